@@ -0,0 +1,100 @@
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import numpy as np
+
+from evaluate_pose import dump_xyz_windows, compute_ates
+from benchmarks.timing import benchmark
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Checks the vectorized ATE of evaluate_pose against the per-window loop '
+                    'and times both on a synthetic sequence')
+    parser.add_argument('--num_frames', type=int, default=1591,
+                        help='frames of the sequence, 1591 for sequence 09')
+    parser.add_argument('--track_length', type=int, default=5)
+    parser.add_argument('--iters', type=int, default=3)
+    return parser.parse_args()
+
+
+# from https://github.com/tinghuiz/SfMLearner
+def dump_xyz(source_to_target_transformations):
+    xyzs = []
+    cam_to_world = np.eye(4)
+    xyzs.append(cam_to_world[:3, 3])
+    for source_to_target_transformation in source_to_target_transformations:
+        cam_to_world = np.dot(cam_to_world, source_to_target_transformation)
+        xyzs.append(cam_to_world[:3, 3])
+    return xyzs
+
+
+# from https://github.com/tinghuiz/SfMLearner
+def compute_ate(gtruth_xyz, pred_xyz_o):
+    offset = gtruth_xyz[0] - pred_xyz_o[0]
+    pred_xyz = pred_xyz_o + offset[None, :]
+    scale = np.sum(gtruth_xyz * pred_xyz) / np.sum(pred_xyz ** 2)
+    alignment_error = pred_xyz * scale - gtruth_xyz
+    rmse = np.sqrt(np.sum(alignment_error ** 2)) / gtruth_xyz.shape[0]
+    return rmse
+
+
+def random_poses(num_poses, rng):
+    """Small random rotations about y and forward translations, like driving
+    """
+    angles = rng.normal(0, 0.02, num_poses)
+    poses = np.tile(np.eye(4), (num_poses, 1, 1))
+    poses[:, 0, 0] = np.cos(angles)
+    poses[:, 0, 2] = np.sin(angles)
+    poses[:, 2, 0] = -np.sin(angles)
+    poses[:, 2, 2] = np.cos(angles)
+    poses[:, :3, 3] = rng.normal(0, 0.05, (num_poses, 3)) + [0, 0, 1]
+    return poses
+
+
+def loop_ates(gt_global_poses, pred_poses, track_length):
+    """Previous implementation of evaluate_pose
+    """
+    gt_local_poses = []
+    for i in range(1, len(gt_global_poses)):
+        gt_local_poses.append(
+            np.linalg.inv(np.dot(np.linalg.inv(gt_global_poses[i - 1]), gt_global_poses[i])))
+
+    ates = []
+    for i in range(0, len(gt_global_poses) - 1):
+        local_xyzs = np.array(dump_xyz(pred_poses[i:i + track_length - 1]))
+        gt_local_xyzs = np.array(dump_xyz(gt_local_poses[i:i + track_length - 1]))
+        ates.append(compute_ate(gt_local_xyzs, local_xyzs))
+    return np.array(ates)
+
+
+def vectorized_ates(gt_global_poses, pred_poses, track_length):
+    gt_local_poses = np.linalg.inv(
+        np.matmul(np.linalg.inv(gt_global_poses[:-1]), gt_global_poses[1:]))
+    local_xyzs, mask = dump_xyz_windows(pred_poses, track_length)
+    gt_local_xyzs, _ = dump_xyz_windows(gt_local_poses, track_length)
+    return compute_ates(gt_local_xyzs, local_xyzs, mask)
+
+
+def main():
+    args = parse_args()
+    rng = np.random.RandomState(0)
+    gt_global_poses = random_poses(args.num_frames, rng)
+    for i in range(1, args.num_frames):
+        gt_global_poses[i] = np.dot(gt_global_poses[i - 1], gt_global_poses[i])
+    pred_poses = random_poses(args.num_frames - 1, rng).astype(np.float32)
+
+    ref = loop_ates(gt_global_poses, pred_poses, args.track_length)
+    ates = vectorized_ates(gt_global_poses, pred_poses, args.track_length)
+    assert ates.shape == ref.shape
+    assert np.allclose(ates, ref, rtol=1e-9, atol=1e-12), np.abs(ates - ref).max()
+    print("-> vectorized ATE matches the per-window loop, {} windows".format(len(ates)))
+
+    for name, fn in [("loop", loop_ates), ("vectorized", vectorized_ates)]:
+        ms = 1000 * benchmark(lambda: fn(gt_global_poses, pred_poses, args.track_length),
+                              warmup=1, iters=args.iters)
+        print("{:>12} | {:10.2f} ms".format(name, ms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import torch
+
+import networks
+from geometry import SSIM
+from benchmarks.timing import benchmark
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='CPU throughput of the depth and pose networks in NCHW vs channels_last')
+    parser.add_argument('--height', type=int, default=192)
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--batch_size', type=int, default=4)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--iters', type=int, default=5)
+    parser.add_argument('--num_threads', type=int,
+                        help='number of CPU threads, defaults to the torch default')
+    return parser.parse_args()
+
+
+class Student(torch.nn.Module):
+    def __init__(self):
+        super(Student, self).__init__()
+        self.encoder = networks.test_hr_encoder.hrnet18(False)
+        self.encoder.num_ch_enc = [ 64, 18, 36, 72, 144 ]
+        self.decoder = networks.HRDepthDecoder(self.encoder.num_ch_enc, range(4))
+
+    def forward(self, x):
+        return self.decoder(self.encoder(x))[("disp", 0)]
+
+
+class Teacher(torch.nn.Module):
+    def __init__(self):
+        super(Teacher, self).__init__()
+        self.encoder = networks.ResnetEncoder(50, False, num_input_images=4)
+        self.decoder = networks.TeacherDecoder(self.encoder.num_ch_enc, 1)
+
+    def forward(self, x):
+        return self.decoder(self.encoder(x))[("disp_t", 0)]
+
+
+class Pose(torch.nn.Module):
+    def __init__(self):
+        super(Pose, self).__init__()
+        self.encoder = networks.ResnetEncoder(18, False, num_input_images=2)
+        self.decoder = networks.PoseDecoder(self.encoder.num_ch_enc, num_input_features=1,
+                                            num_frames_to_predict_for=2)
+
+    def forward(self, x):
+        axisangle, translation = self.decoder([self.encoder(x)])
+        return torch.cat([axisangle, translation], -1)
+
+
+def run(name, model, input_channels, args, memory_format):
+    """Returns the inference and the training throughput in images per second
+    """
+    model = model.to(memory_format=memory_format)
+    x = torch.rand(args.batch_size, input_channels, args.height, args.width)
+    x = x.contiguous(memory_format=memory_format)
+    ssim = SSIM()
+
+    def infer():
+        with torch.no_grad():
+            model(x)
+
+    def train_step():
+        model.zero_grad()
+        out = model(x)
+        if out.dim() == 4:
+            # a photometric style loss so that the SSIM pools and pads are part of the step
+            target = x[:, :3]
+            loss = ssim(target * out, target).mean()
+        else:
+            loss = out.abs().mean()
+        loss.backward()
+
+    model.eval()
+    infer_time = benchmark(infer, args.warmup, args.iters)
+    model.train()
+    train_time = benchmark(train_step, args.warmup, args.iters)
+    return args.batch_size / infer_time, args.batch_size / train_time
+
+
+def main(args):
+    if args.num_threads is not None:
+        torch.set_num_threads(args.num_threads)
+    print("-> {}x{} batch {} on {} CPU threads".format(
+        args.width, args.height, args.batch_size, torch.get_num_threads()))
+
+    models = [("student", Student, 3), ("teacher", Teacher, 12), ("pose", Pose, 6)]
+
+    print("\n  " + ("{:>10} | " * 7).format(
+        "model", "infer", "infer_cl", "delta", "train", "train_cl", "delta"))
+    for name, model_fn, input_channels in models:
+        torch.manual_seed(0)
+        model = model_fn()
+        infer_nchw, train_nchw = run(name, model, input_channels, args, torch.contiguous_format)
+        infer_cl, train_cl = run(name, model, input_channels, args, torch.channels_last)
+        print(("  {:>10} | " + "{:>10.2f} | {:>10.2f} | {:>+9.1f}% | " * 2).format(
+            name,
+            infer_nchw, infer_cl, 100 * (infer_cl / infer_nchw - 1),
+            train_nchw, train_cl, 100 * (train_cl / train_nchw - 1)))
+    print("\n   throughput in images/s, _cl is channels_last")
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,87 @@
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import torch
+
+from geometry import RunningMin
+from benchmarks.timing import benchmark
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Checks RunningMin against torch.min over the concatenated loss maps and '
+                    'compares their time and peak memory')
+    parser.add_argument('--batch_size', type=int, default=12)
+    parser.add_argument('--height', type=int, default=192)
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--num_losses', type=int, default=10,
+                        help='identity and reprojection loss maps per scale')
+    parser.add_argument('--iters', type=int, default=50)
+    parser.add_argument('--no_cuda', action='store_true')
+    return parser.parse_args()
+
+
+def cat_min(losses):
+    return torch.min(torch.cat(losses, 1), 1, True)
+
+
+def running_min(losses):
+    reducer = RunningMin(track_argmin=True)
+    for loss in losses:
+        reducer.add(loss)
+    return reducer.min, reducer.argmin
+
+
+def check(device):
+    """Values, indices and gradients match, including on exact ties
+    """
+    torch.manual_seed(0)
+    losses = [torch.rand(2, 1, 8, 8, device=device, requires_grad=True) for _ in range(5)]
+    with torch.no_grad():
+        losses[3][:, :, :4] = losses[1][:, :, :4]
+
+    for fn in [cat_min, running_min]:
+        for loss in losses:
+            loss.grad = None
+        values, indices = fn(losses)
+        values.sum().backward()
+        if fn is cat_min:
+            ref_values, ref_indices = values.detach(), indices
+            ref_grads = [loss.grad.clone() for loss in losses]
+        else:
+            assert torch.equal(values.detach(), ref_values)
+            assert torch.equal(indices, ref_indices)
+            for grad, ref_grad in zip([loss.grad for loss in losses], ref_grads):
+                assert torch.equal(grad, ref_grad)
+    print("-> RunningMin matches torch.min over the concatenated losses")
+
+
+def main():
+    args = parse_args()
+    device = torch.device("cpu" if args.no_cuda or not torch.cuda.is_available() else "cuda")
+    check(device)
+
+    source = torch.rand(args.batch_size, 1, args.height, args.width, device=device,
+                        requires_grad=True)
+
+    def step(fn):
+        def run():
+            # the loss maps are produced inside the step like in compute_losses
+            losses = [source * (i + 1) % 1 for i in range(args.num_losses)]
+            values, _ = fn(losses)
+            values.mean().backward()
+        return run
+
+    print("-> {} | {} loss maps of {}x1x{}x{}".format(
+        device, args.num_losses, args.batch_size, args.height, args.width))
+    for name, fn in [("cat + min", cat_min), ("RunningMin", running_min)]:
+        if device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats()
+        ms = 1000 * benchmark(step(fn), iters=args.iters, device=device)
+        peak = "{:.1f} MB".format(torch.cuda.max_memory_allocated() / 2 ** 20) \
+            if device.type == "cuda" else "-"
+        print("{:>12} | {:8.3f} ms | peak {}".format(name, ms, peak))
+
+
+if __name__ == "__main__":
+    main()
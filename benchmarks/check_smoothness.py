@@ -0,0 +1,105 @@
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import torch
+import torch.nn.functional as F
+
+from geometry import gradient, get_smooth_loss, SmoothLoss
+from benchmarks.timing import benchmark
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Checks the fused smoothness loss against the reference implementation, '
+                    'runs a gradient check and times both')
+    parser.add_argument('--batch_size', type=int, default=12)
+    parser.add_argument('--height', type=int, default=192)
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--iters', type=int, default=50)
+    parser.add_argument('--no_cuda', action='store_true')
+    return parser.parse_args()
+
+
+def reference_smooth_loss(disp, img):
+    """Previous implementation with the six terms computed separately
+    """
+    b, _, h, w = disp.size()
+    a1 = 0.5
+    a2 = 0.5
+    img = F.interpolate(img, (h, w), mode='area')
+
+    disp_dx, disp_dy = gradient(disp)
+    img_dx, img_dy = gradient(img)
+
+    disp_dxx, disp_dxy = gradient(disp_dx)
+    disp_dyx, disp_dyy = gradient(disp_dy)
+
+    img_dxx, img_dxy = gradient(img_dx)
+    img_dyx, img_dyy = gradient(img_dy)
+
+    smooth1 = torch.mean(disp_dx.abs() * torch.exp(-a1 * img_dx.abs().mean(1, True))) + \
+                torch.mean(disp_dy.abs() * torch.exp(-a1 * img_dy.abs().mean(1, True)))
+
+    smooth2 = torch.mean(disp_dxx.abs() * torch.exp(-a2 * img_dxx.abs().mean(1, True))) + \
+                torch.mean(disp_dxy.abs() * torch.exp(-a2 * img_dxy.abs().mean(1, True))) + \
+                torch.mean(disp_dyx.abs() * torch.exp(-a2 * img_dyx.abs().mean(1, True))) + \
+                torch.mean(disp_dyy.abs() * torch.exp(-a2 * img_dyy.abs().mean(1, True)))
+
+    return smooth1+smooth2
+
+
+def check(device):
+    """Values and gradients in float64 for a disparity at the image and at half its size
+    """
+    torch.manual_seed(0)
+    smooth_loss = SmoothLoss()
+    img = torch.rand(2, 3, 24, 40, dtype=torch.float64, device=device)
+    for h, w in [(24, 40), (12, 20)]:
+        disp = torch.rand(2, 1, h, w, dtype=torch.float64, device=device, requires_grad=True)
+
+        ref = reference_smooth_loss(disp, img)
+        ref_grad, = torch.autograd.grad(ref, disp)
+        for name, fn in [("get_smooth_loss", get_smooth_loss), ("SmoothLoss", smooth_loss)]:
+            loss = fn(disp, img)
+            grad, = torch.autograd.grad(loss, disp)
+            assert torch.allclose(loss, ref, rtol=1e-10, atol=1e-12), \
+                "{} {}x{}: loss {} != {}".format(name, h, w, loss.item(), ref.item())
+            assert torch.allclose(grad, ref_grad, rtol=1e-8, atol=1e-12), \
+                "{} {}x{}: gradients differ".format(name, h, w)
+
+        assert torch.autograd.gradcheck(lambda d: smooth_loss(d, img), (disp,))
+
+    assert len(smooth_loss.cache) == 2
+    smooth_loss.clear()
+    print("-> fused smoothness matches the reference, gradcheck passed")
+
+
+def main():
+    args = parse_args()
+    device = torch.device("cpu" if args.no_cuda or not torch.cuda.is_available() else "cuda")
+    check(device)
+
+    smooth_loss = SmoothLoss()
+    print("-> {} | batch {} | student + teacher terms, forward + backward ms/iter".format(
+        device, args.batch_size))
+    print(("{:>12} | " * 4).format("scale", "reference", "fused", "cached"))
+    for scale in range(4):
+        h = args.height // (2 ** scale)
+        w = args.width // (2 ** scale)
+        img = torch.rand(args.batch_size, 3, h, w, device=device)
+        disps = [torch.rand(args.batch_size, 1, h, w, device=device, requires_grad=True)
+                 for _ in range(2)]
+
+        def run(fn):
+            def step():
+                smooth_loss.clear()
+                sum(fn(disp, img) for disp in disps).backward()
+            return step
+
+        times = [benchmark(run(fn), iters=args.iters, device=device)
+                 for fn in [reference_smooth_loss, get_smooth_loss, smooth_loss]]
+        print(("{:>12} | " + "{:>12.3f} | " * 3).format(scale, *[1000 * t for t in times]))
+
+
+if __name__ == "__main__":
+    main()
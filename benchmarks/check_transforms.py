@@ -0,0 +1,132 @@
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import torch
+
+from geometry import transformation_from_parameters, invert_transformation
+from benchmarks.timing import benchmark
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Checks the vectorized pose transformations against the per-element '
+                    'reference implementation and times both')
+    parser.add_argument('--batch_size', type=int, default=12)
+    parser.add_argument('--iters', type=int, default=1000)
+    parser.add_argument('--no_cuda', action='store_true')
+    return parser.parse_args()
+
+
+def reference_rot_from_axisangle(vec):
+    """Previous implementation filling a zero 4x4 matrix entry by entry
+    """
+    angle = torch.norm(vec, 2, 2, True)
+    axis = vec / (angle + 1e-7)
+    ca = torch.cos(angle)
+    sa = torch.sin(angle)
+    C = 1 - ca
+    x = axis[..., 0].unsqueeze(1)
+    y = axis[..., 1].unsqueeze(1)
+    z = axis[..., 2].unsqueeze(1)
+
+    xs = x * sa
+    ys = y * sa
+    zs = z * sa
+    xC = x * C
+    yC = y * C
+    zC = z * C
+    xyC = x * yC
+    yzC = y * zC
+    zxC = z * xC
+
+    rot = torch.zeros((vec.shape[0], 4, 4)).to(device=vec.device, dtype=vec.dtype)
+
+    rot[:, 0, 0] = torch.squeeze(x * xC + ca)
+    rot[:, 0, 1] = torch.squeeze(xyC - zs)
+    rot[:, 0, 2] = torch.squeeze(zxC + ys)
+    rot[:, 1, 0] = torch.squeeze(xyC + zs)
+    rot[:, 1, 1] = torch.squeeze(y * yC + ca)
+    rot[:, 1, 2] = torch.squeeze(yzC - xs)
+    rot[:, 2, 0] = torch.squeeze(zxC - ys)
+    rot[:, 2, 1] = torch.squeeze(yzC + xs)
+    rot[:, 2, 2] = torch.squeeze(z * zC + ca)
+    rot[:, 3, 3] = 1
+    return rot
+
+
+def reference_get_translation_matrix(translation_vector):
+    T = torch.zeros(translation_vector.shape[0], 4, 4).to(
+        device=translation_vector.device, dtype=translation_vector.dtype)
+    t = translation_vector.contiguous().view(-1, 3, 1)
+    T[:, 0, 0] = 1
+    T[:, 1, 1] = 1
+    T[:, 2, 2] = 1
+    T[:, 3, 3] = 1
+    T[:, :3, 3, None] = t
+    return T
+
+
+def reference_transformation_from_parameters(axisangle, translation, invert=False):
+    R = reference_rot_from_axisangle(axisangle)
+    t = translation.clone()
+    if invert:
+        R = R.transpose(1, 2)
+        t *= -1
+    T = reference_get_translation_matrix(t)
+    if invert:
+        return torch.matmul(R, T)
+    return torch.matmul(T, R)
+
+
+def check(name, fn, reference_fn, axisangle, translation, invert):
+    inputs = [axisangle.clone().requires_grad_(), translation.clone().requires_grad_()]
+    reference_inputs = [axisangle.clone().requires_grad_(), translation.clone().requires_grad_()]
+
+    out = fn(*inputs, invert=invert)
+    expected = reference_fn(*reference_inputs, invert=invert)
+    # a random linear functional so that every entry contributes to the gradients
+    weights = torch.randn_like(out)
+    (out * weights).sum().backward()
+    (expected * weights).sum().backward()
+
+    errors = [(out - expected).abs().max().item()]
+    errors += [(i.grad - r.grad).abs().max().item() for i, r in zip(inputs, reference_inputs)]
+    print("   {:<28} max abs diff | value {:.2e} | d axisangle {:.2e} | d translation {:.2e}".format(
+        name, *errors))
+    assert max(errors) < 1e-10, "{} does not match the reference".format(name)
+
+
+def main(args):
+    device = "cpu" if args.no_cuda or not torch.cuda.is_available() else "cuda"
+    torch.manual_seed(0)
+
+    # double precision so that only real differences show up
+    axisangle = torch.randn(args.batch_size, 1, 3, dtype=torch.float64, device=device)
+    axisangle[0] = 0  # the zero rotation goes through the 1e-7 guard
+    translation = torch.randn(args.batch_size, 1, 3, dtype=torch.float64, device=device)
+
+    print("-> Checking against the reference implementation")
+    for invert in [False, True]:
+        check("transformation (invert={})".format(invert),
+              transformation_from_parameters, reference_transformation_from_parameters,
+              axisangle, translation, invert)
+
+    M = transformation_from_parameters(axisangle, translation)
+    error = (invert_transformation(M) - torch.inverse(M)).abs().max().item()
+    print("   {:<28} max abs diff | value {:.2e}".format("closed form inverse", error))
+    assert error < 1e-10, "invert_transformation does not match torch.inverse"
+
+    print("-> Timing forward + backward, batch {} on {}".format(args.batch_size, device))
+    axisangle = axisangle.float().requires_grad_()
+    translation = translation.float().requires_grad_()
+    for name, fn in [("reference", reference_transformation_from_parameters),
+                     ("vectorized", transformation_from_parameters)]:
+        def step():
+            M = fn(axisangle, translation, invert=True)
+            M.sum().backward()
+        seconds = benchmark(step, 10, args.iters, device)
+        print("   {:<12} {:8.1f} us".format(name, seconds * 1e6))
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,80 @@
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import torch
+
+import networks
+from benchmarks.timing import benchmark
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Checks the truncated feature extractor against the full ResNet50 '
+                    'encoder and times the extractor calls of a training step')
+    parser.add_argument('--batch_size', type=int, default=12)
+    parser.add_argument('--height', type=int, default=192)
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--calls', type=int, default=3,
+                        help='extractor calls per step, one per warped source frame and the target')
+    parser.add_argument('--iters', type=int, default=10)
+    parser.add_argument('--no_cuda', action='store_true')
+    return parser.parse_args()
+
+
+def build(device):
+    encoder = networks.ResnetEncoder(50, None)
+    for param in encoder.parameters():
+        param.requires_grad = False
+    encoder.to(device).eval()
+    # the truncated extractor shares the weights of the full encoder
+    extractor = networks.ResnetFeatureExtractor(encoder, [0])
+    return encoder, extractor
+
+
+def check(device):
+    """Same stage 0 features and gradients with respect to the image, and the requested
+    levels of a deeper extractor match the full encoder
+    """
+    torch.manual_seed(0)
+    encoder, extractor = build(device)
+    img = torch.rand(2, 3, 64, 96, device=device, requires_grad=True)
+
+    ref = encoder(img)
+    ref_grad, = torch.autograd.grad(ref[0].sum(), img)
+    features = extractor(img)
+    grad, = torch.autograd.grad(features[0].sum(), img)
+    assert len(features) == 1
+    assert torch.equal(features[0], ref[0])
+    assert torch.equal(grad, ref_grad)
+
+    deeper = networks.ResnetFeatureExtractor(encoder, [0, 2])
+    for f, ref_f in zip(deeper(img), [ref[0], ref[2]]):
+        assert torch.equal(f, ref_f)
+    print("-> truncated extractor matches the full encoder")
+
+
+def main():
+    args = parse_args()
+    device = torch.device("cpu" if args.no_cuda or not torch.cuda.is_available() else "cuda")
+    check(device)
+
+    encoder, extractor = build(device)
+    img = torch.rand(args.batch_size, 3, args.height, args.width, device=device,
+                     requires_grad=True)
+
+    def step(fn):
+        def run():
+            # the features of warped images are differentiated with respect to the image
+            sum(fn(img)[0].mean() for _ in range(args.calls)).backward()
+        return run
+
+    print("-> {} | {} calls of {}x3x{}x{} per step".format(
+        device, args.calls, args.batch_size, args.height, args.width))
+    for name, model in [("full", encoder), ("truncated", extractor)]:
+        params = sum(p.numel() for p in model.parameters()) / 1e6
+        ms = 1000 * benchmark(step(model), iters=args.iters, device=device)
+        print("{:>10} | {:6.2f}M params | {:8.3f} ms/step".format(name, params, ms))
+
+
+if __name__ == "__main__":
+    main()
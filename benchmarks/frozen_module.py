@@ -0,0 +1,85 @@
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import torch
+
+import networks
+from benchmarks.timing import benchmark
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Checks FrozenModule against the frozen network run in eval mode and '
+                    'times the frozen student of the teacher input in train mode vs frozen')
+    parser.add_argument('--batch_size', type=int, default=12)
+    parser.add_argument('--height', type=int, default=192)
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--frozen_device', type=str,
+                        help='device of the frozen network, defaults to the training device')
+    parser.add_argument('--iters', type=int, default=10)
+    parser.add_argument('--no_cuda', action='store_true')
+    return parser.parse_args()
+
+
+def build_student():
+    encoder = networks.test_hr_encoder.hrnet18(False)
+    encoder.num_ch_enc = [64, 18, 36, 72, 144]
+    return torch.nn.Sequential(encoder, networks.HRDepthDecoder(encoder.num_ch_enc, range(4)))
+
+
+def check(device):
+    """Eval mode outputs, usable in the backward pass of a loss, and gradients to the
+    inputs when differentiable
+    """
+    torch.manual_seed(0)
+    student = build_student().to(device).eval()
+    img = torch.rand(2, 3, 64, 96, device=device)
+    with torch.no_grad():
+        ref = student(img)[("disp", 0)]
+
+    frozen = networks.FrozenModule(student, device)
+    frozen.train()
+    assert not frozen.module.training
+    disp = frozen.submit(img).result()[("disp", 0)]
+    assert torch.equal(disp, ref)
+
+    weight = torch.rand(1, device=device, requires_grad=True)
+    (weight * disp).mean().backward()
+    assert weight.grad is not None
+
+    frozen = networks.FrozenModule(student, device, differentiable=True)
+    img.requires_grad = True
+    frozen(img)[("disp", 0)].mean().backward()
+    assert img.grad is not None and all(p.grad is None for p in student.parameters())
+    print("-> FrozenModule matches the network in eval mode")
+
+
+def main():
+    args = parse_args()
+    device = torch.device("cpu" if args.no_cuda or not torch.cuda.is_available() else "cuda")
+    check(device)
+
+    img = torch.rand(3 * args.batch_size, 3, args.height, args.width, device=device)
+    student = build_student().to(device)
+    for param in student.parameters():
+        param.requires_grad = False
+
+    runs = [("train mode", lambda: student.train()(img))]
+    dtypes = [torch.float32] + ([torch.float16] if device.type == "cuda" else [torch.bfloat16])
+    for dtype in dtypes:
+        frozen = networks.FrozenModule(build_student(), args.frozen_device or device, dtype)
+        runs.append(("frozen {}".format(str(dtype)[6:]), (lambda f: lambda: f(img))(frozen)))
+
+    print("-> {} | frozen student for 3 frames of {}x3x{}x{}".format(
+        device, args.batch_size, args.height, args.width))
+    for name, fn in runs:
+        if device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats()
+        ms = 1000 * benchmark(fn, iters=args.iters, device=device)
+        peak = "{:.1f} MB".format(torch.cuda.max_memory_allocated() / 2 ** 20) \
+            if device.type == "cuda" else "-"
+        print("{:>16} | {:8.3f} ms | peak {}".format(name, ms, peak))
+
+
+if __name__ == "__main__":
+    main()
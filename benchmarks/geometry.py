@@ -0,0 +1,183 @@
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import numpy as np
+import torch
+import torch.nn as nn
+
+from geometry import BackprojectDepth, Project3D, SSIM, get_smooth_loss, grid_sample, \
+    transformation_from_parameters
+from benchmarks.timing import benchmark
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Microbenchmarks of the geometry package against the previous per-scale '
+                    'layers, forward and backward')
+    parser.add_argument('--batch_size', type=int, default=12)
+    parser.add_argument('--height', type=int, default=192)
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--iters', type=int, default=20)
+    parser.add_argument('--no_cuda', action='store_true')
+    return parser.parse_args()
+
+
+class ReferenceBackprojectDepth(nn.Module):
+    """Previous layer holding its own batch sized pixel grid
+    """
+    def __init__(self, batch_size, height, width):
+        super(ReferenceBackprojectDepth, self).__init__()
+
+        self.batch_size = batch_size
+        self.height = height
+        self.width = width
+
+        meshgrid = np.meshgrid(range(self.width), range(self.height), indexing='xy')
+        self.id_coords = np.stack(meshgrid, axis=0).astype(np.float32)
+        self.id_coords = nn.Parameter(torch.from_numpy(self.id_coords), requires_grad=False)
+
+        self.ones = nn.Parameter(torch.ones(self.batch_size, 1, self.height * self.width),
+                                 requires_grad=False)
+
+        self.pix_coords = torch.unsqueeze(torch.stack(
+            [self.id_coords[0].view(-1), self.id_coords[1].view(-1)], 0), 0)
+        self.pix_coords = self.pix_coords.repeat(batch_size, 1, 1)
+        self.pix_coords = nn.Parameter(torch.cat([self.pix_coords, self.ones], 1),
+                                       requires_grad=False)
+
+    def forward(self, depth, inv_K):
+        cam_points = torch.matmul(inv_K[:, :3, :3], self.pix_coords)
+        cam_points = depth.view(self.batch_size, 1, -1) * cam_points
+        cam_points = torch.cat([cam_points, self.ones], 1)
+        return cam_points
+
+
+class ReferenceProject3D(nn.Module):
+    """Previous layer normalizing the pixel coordinates in place
+    """
+    def __init__(self, batch_size, height, width, eps=1e-7):
+        super(ReferenceProject3D, self).__init__()
+
+        self.batch_size = batch_size
+        self.height = height
+        self.width = width
+        self.eps = eps
+
+    def forward(self, points, K, T):
+        P = torch.matmul(K, T)[:, :3, :]
+        cam_points = torch.matmul(P, points)
+        pix_coords = cam_points[:, :2, :] / (cam_points[:, 2, :].unsqueeze(1) + self.eps)
+        pix_coords = pix_coords.view(self.batch_size, 2, self.height, self.width)
+        pix_coords = pix_coords.permute(0, 2, 3, 1)
+        pix_coords[..., 0] /= self.width - 1
+        pix_coords[..., 1] /= self.height - 1
+        pix_coords = (pix_coords - 0.5) * 2
+        return pix_coords
+
+
+class ReferenceSSIM(nn.Module):
+    """Previous layer with one average pool per local statistic
+    """
+    def __init__(self):
+        super(ReferenceSSIM, self).__init__()
+        self.mu_x_pool = nn.AvgPool2d(3, 1)
+        self.mu_y_pool = nn.AvgPool2d(3, 1)
+        self.sig_x_pool = nn.AvgPool2d(3, 1)
+        self.sig_y_pool = nn.AvgPool2d(3, 1)
+        self.sig_xy_pool = nn.AvgPool2d(3, 1)
+        self.refl = nn.ReflectionPad2d(1)
+        self.C1 = 0.01 ** 2
+        self.C2 = 0.03 ** 2
+
+    def forward(self, x, y):
+        x = self.refl(x)
+        y = self.refl(y)
+        mu_x = self.mu_x_pool(x)
+        mu_y = self.mu_y_pool(y)
+        sigma_x = self.sig_x_pool(x ** 2) - mu_x ** 2
+        sigma_y = self.sig_y_pool(y ** 2) - mu_y ** 2
+        sigma_xy = self.sig_xy_pool(x * y) - mu_x * mu_y
+        SSIM_n = (2 * mu_x * mu_y + self.C1) * (2 * sigma_xy + self.C2)
+        SSIM_d = (mu_x ** 2 + mu_y ** 2 + self.C1) * (sigma_x + sigma_y + self.C2)
+        return torch.clamp((1 - SSIM_n / SSIM_d) / 2, 0, 1)
+
+
+def make_intrinsics(batch_size, height, width, device):
+    K = torch.tensor([[0.58 * width, 0, 0.5 * width, 0],
+                      [0, 1.92 * height, 0.5 * height, 0],
+                      [0, 0, 1, 0],
+                      [0, 0, 0, 1]], device=device)
+    K = K.unsqueeze(0).repeat(batch_size, 1, 1)
+    return K, torch.inverse(K)
+
+
+def warp_fn(backproject, project, depth, image, K, inv_K, T):
+    """Forward and backward of a full reprojection of `image` with `depth`
+    """
+    def fn():
+        depth.grad = None
+        pix_coords = project(backproject(depth, inv_K), K, T)
+        warped = grid_sample(image, pix_coords, padding_mode="border")
+        warped.mean().backward()
+    return fn
+
+
+def loss_fn(loss, *inputs):
+    """Forward and backward of `loss(*inputs)`
+    """
+    def fn():
+        inputs[0].grad = None
+        loss(*inputs).mean().backward()
+    return fn
+
+
+def main():
+    args = parse_args()
+    device = torch.device("cpu" if args.no_cuda or not torch.cuda.is_available() else "cuda")
+    b = args.batch_size
+
+    print("-> {} | batch {} | forward + backward ms/iter".format(device, b))
+    print(("{:>20} | " * 4).format("op", "scale", "previous", "geometry"))
+    for scale in range(4):
+        h = args.height // (2 ** scale)
+        w = args.width // (2 ** scale)
+        K, inv_K = make_intrinsics(b, h, w, device)
+        T = transformation_from_parameters(0.01 * torch.randn(b, 1, 3, device=device),
+                                           0.1 * torch.randn(b, 1, 3, device=device))
+        depth = (1 + 10 * torch.rand(b, 1, h, w, device=device)).requires_grad_()
+        image = torch.rand(b, 3, h, w, device=device)
+        target = torch.rand(b, 3, h, w, device=device)
+        disp = torch.rand(b, 1, h, w, device=device, requires_grad=True)
+        pred = image.clone().requires_grad_()
+
+        rows = [
+            ("reprojection",
+             warp_fn(ReferenceBackprojectDepth(b, h, w).to(device), ReferenceProject3D(b, h, w),
+                     depth, image, K, inv_K, T),
+             warp_fn(BackprojectDepth(b, h, w), Project3D(b, h, w),
+                     depth, image, K, inv_K, T)),
+            ("ssim",
+             loss_fn(ReferenceSSIM().to(device), pred, target),
+             loss_fn(SSIM().to(device), pred, target)),
+            ("smoothness",
+             None,
+             loss_fn(get_smooth_loss, disp, image)),
+        ]
+        for name, previous, current in rows:
+            previous_ms = "-" if previous is None else \
+                "{:.3f}".format(1000 * benchmark(previous, iters=args.iters, device=device))
+            current_ms = "{:.3f}".format(1000 * benchmark(current, iters=args.iters, device=device))
+            print(("{:>20} | " * 4).format(name, scale, previous_ms, current_ms))
+
+        with torch.no_grad():
+            ref_coords = ReferenceProject3D(b, h, w)(
+                ReferenceBackprojectDepth(b, h, w).to(device)(depth, inv_K), K, T)
+            coords = Project3D(b, h, w)(BackprojectDepth(b, h, w)(depth, inv_K), K, T)
+            ref_ssim = ReferenceSSIM().to(device)(pred, target)
+            ssim = SSIM().to(device)(pred, target)
+        print("{:>20}   max |diff| coords {:.2e} ssim {:.2e}".format(
+            "", (coords - ref_coords).abs().max().item(), (ssim - ref_ssim).abs().max().item()))
+
+
+if __name__ == "__main__":
+    main()
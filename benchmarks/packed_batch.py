@@ -0,0 +1,89 @@
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import torch
+from torch.utils.data.dataloader import default_collate
+
+from datasets import PackedBatch, PackedCollate
+from benchmarks.timing import benchmark
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Checks PackedCollate against default_collate and times the host to '
+                    'device copy of a training batch per key vs packed')
+    parser.add_argument('--batch_size', type=int, default=12)
+    parser.add_argument('--height', type=int, default=192)
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--frame_ids', nargs='+', type=int, default=[0, -1, 1])
+    parser.add_argument('--iters', type=int, default=50)
+    return parser.parse_args()
+
+
+def make_sample(height, width, frame_ids, num_scales=4):
+    """Random sample with the keys of MonoDataset
+    """
+    sample = {}
+    for scale in range(num_scales):
+        for i in frame_ids:
+            for n in ["color", "color_aug"]:
+                sample[(n, i, scale)] = torch.rand(3, height // 2 ** scale, width // 2 ** scale)
+    for scale in range(num_scales):
+        sample[("K", scale)] = torch.rand(4, 4)
+        sample[("inv_K", scale)] = torch.rand(4, 4)
+    sample["depth_gt"] = torch.rand(1, 375, 1242)
+    return sample
+
+
+def check(samples):
+    """Same keys and values, contiguous or channels_last views
+
+    The packed batch lists its keys block by block, so only the key sets are compared.
+    """
+    ref = default_collate(samples)
+    for channels_last in [False, True]:
+        batch = PackedCollate(channels_last)(samples)
+        assert set(batch.keys()) == set(ref.keys())
+        for key, value in ref.items():
+            assert torch.equal(batch[key], value), key
+            memory_format = torch.channels_last if channels_last and value.dim() == 4 \
+                else torch.contiguous_format
+            assert batch[key].is_contiguous(memory_format=memory_format), key
+    print("-> PackedCollate matches default_collate, {} keys in {} blocks".format(
+        len(batch), len(batch.groups)))
+
+
+def main():
+    args = parse_args()
+    samples = [make_sample(args.height, args.width, args.frame_ids)
+               for _ in range(args.batch_size)]
+    check(samples)
+    if not torch.cuda.is_available():
+        print("-> no CUDA device, skipping the transfer timing")
+        return
+
+    device = torch.device("cuda")
+    batch = {k: v.pin_memory() for k, v in default_collate(samples).items()}
+    packed = PackedCollate()(samples).pin_memory()
+
+    def per_key():
+        for v in batch.values():
+            v.to(device)
+
+    def per_key_non_blocking():
+        for v in batch.values():
+            v.to(device, non_blocking=True)
+
+    def packed_copy():
+        # to_device moves the buffers in place, so each copy starts from the pinned batch
+        PackedBatch(packed.buffers, packed.groups).to_device(device)
+
+    print("-> {} keys | ms per batch".format(len(batch)))
+    for name, fn in [("per key", per_key), ("per key, non_blocking", per_key_non_blocking),
+                     ("packed", packed_copy)]:
+        ms = 1000 * benchmark(fn, iters=args.iters, device=device)
+        print("{:>24} | {:8.3f} ms".format(name, ms))
+
+
+if __name__ == "__main__":
+    main()
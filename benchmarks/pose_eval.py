@@ -0,0 +1,81 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+import argparse
+import time
+import torch
+from torch.utils.data import DataLoader
+
+from datasets import KITTIOdomDataset, PoseFrames, FrameRing
+from utils import readlines
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Frames per second of loading an odometry sequence for evaluate_pose, '
+                    'as pairs of MonoDataset samples vs frames decoded once')
+    parser.add_argument('--data_path', type=str, required=True)
+    parser.add_argument('--sequence', type=int, default=9)
+    parser.add_argument('--height', type=int, default=192)
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--batch_size', type=int, default=16)
+    parser.add_argument('--num_workers', type=int, default=4)
+    parser.add_argument('--num_frames', type=int, default=400,
+                        help='frames read from the start of the sequence')
+    parser.add_argument('--no_cuda', action='store_true')
+    return parser.parse_args()
+
+
+def check(pair_dataset, frames_dataset):
+    """The pairs of the ring are the color_aug pairs of the MonoDataset samples
+    """
+    ring = FrameRing(torch.device("cpu"))
+    frames = torch.stack([frames_dataset[i] for i in range(4)])
+    pairs = torch.cat([ring.push(frames[:1]), ring.push(frames[1:3]), ring.push(frames[3:])])
+    for i in range(3):
+        sample = pair_dataset[i]
+        ref = torch.cat([sample[("color_aug", 0, 0)], sample[("color_aug", 1, 0)]], 0)
+        assert torch.equal(pairs[i], ref), i
+    print("-> FrameRing pairs match the frame pairs of KITTIOdomDataset")
+
+
+def run(loader, to_pairs, device):
+    start_time = time.time()
+    num_pairs = 0
+    for inputs in loader:
+        num_pairs += to_pairs(inputs).shape[0]
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    return num_pairs / (time.time() - start_time)
+
+
+def main():
+    args = parse_args()
+    device = torch.device("cpu" if args.no_cuda or not torch.cuda.is_available() else "cuda")
+    filenames = readlines(os.path.join(os.path.dirname(__file__), "..", "splits", "odom",
+                                       "test_files_{:02d}.txt".format(args.sequence)))
+    filenames = filenames[:args.num_frames]
+
+    pair_dataset = KITTIOdomDataset(args.data_path, filenames[:-1], args.height, args.width,
+                                    [0, 1], 4, is_train=False)
+    frames_dataset = PoseFrames(KITTIOdomDataset(args.data_path, filenames, args.height,
+                                                 args.width, [0], 1, is_train=False))
+    check(pair_dataset, frames_dataset)
+
+    def sample_pairs(inputs):
+        return torch.cat([inputs[("color_aug", 0, 0)].to(device),
+                          inputs[("color_aug", 1, 0)].to(device)], 1)
+
+    ring = FrameRing(device)
+    loaders = [
+        ("MonoDataset pairs", DataLoader(pair_dataset, args.batch_size, num_workers=args.num_workers,
+                                         pin_memory=True), sample_pairs),
+        ("frames + ring", DataLoader(frames_dataset, args.batch_size, num_workers=args.num_workers,
+                                     pin_memory=True), ring.push)]
+    print("-> sequence {:02d} | {} frames | {}".format(args.sequence, len(filenames), device))
+    for name, loader, to_pairs in loaders:
+        print("{:>20} | {:8.1f} pairs/s".format(name, run(loader, to_pairs, device)))
+
+
+if __name__ == "__main__":
+    main()
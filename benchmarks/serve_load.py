@@ -0,0 +1,123 @@
+from __future__ import absolute_import, division, print_function
+
+import io
+import json
+import time
+import socket
+import argparse
+import threading
+import http.client
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Load generator for serve_depth.py, reports the client latencies and '
+                    'throughput and the server counters')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8500)
+    parser.add_argument('--unix_socket', type=str,
+                        help='if set, connects to this unix socket instead of --host and --port')
+    parser.add_argument('--image', type=str,
+                        help='image sent with every request, a random 1242x375 image if not set')
+    parser.add_argument('--format', type=str, default='png', choices=['png', 'npy'])
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4, 16],
+                        help='numbers of clients sending requests back to back')
+    parser.add_argument('--requests', type=int, default=200,
+                        help='requests sent at each concurrency')
+    return parser.parse_args()
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        http.client.HTTPConnection.__init__(self, "localhost")
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+def connect(args):
+    if args.unix_socket is not None:
+        return UnixHTTPConnection(args.unix_socket)
+    return http.client.HTTPConnection(args.host, args.port)
+
+
+def request(connection, method, path, body=None):
+    connection.request(method, path, body=body)
+    response = connection.getresponse()
+    data = response.read()
+    assert response.status == 200, "{} {}: {} {}".format(method, path, response.status, data)
+    return data
+
+
+def load_image(path):
+    if path is not None:
+        with open(path, "rb") as f:
+            return f.read()
+
+    import numpy as np
+    import PIL.Image as pil
+    buffer = io.BytesIO()
+    image = np.random.RandomState(0).randint(0, 256, (375, 1242, 3)).astype(np.uint8)
+    pil.fromarray(image).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def run_clients(args, image, concurrency):
+    """Latencies of args.requests requests sent by `concurrency` clients, and the wall time
+    """
+    latencies = []
+    lock = threading.Lock()
+    counter = iter(range(args.requests))
+
+    def client():
+        connection = connect(args)
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    break
+            start_time = time.time()
+            request(connection, "POST", "/depth?format={}".format(args.format), image)
+            with lock:
+                latencies.append(time.time() - start_time)
+        connection.close()
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start_time = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies), time.time() - start_time
+
+
+def main():
+    args = parse_args()
+    image = load_image(args.image)
+
+    connection = connect(args)
+    health = json.loads(request(connection, "GET", "/health").decode())
+    print("-> server predicting at {}x{}, {} KB images".format(
+        health["width"], health["height"], len(image) // 1024))
+    # warm up the server before timing
+    for _ in range(5):
+        request(connection, "POST", "/depth?format={}".format(args.format), image)
+
+    print("\n{:>11} | {:>10} | {:>10} | {:>10}".format("concurrency", "req/s", "p50 ms", "p99 ms"))
+    for concurrency in args.concurrency:
+        latencies, elapsed = run_clients(args, image, concurrency)
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))]
+        print("{:>11} | {:10.1f} | {:10.1f} | {:10.1f}".format(
+            concurrency, len(latencies) / elapsed, 1000 * p50, 1000 * p99))
+
+    stats = json.loads(request(connection, "GET", "/stats").decode())
+    print("\n-> server counters")
+    for key, value in stats.items():
+        print("{:>24} | {}".format(key, value))
+    connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+root_dir = os.path.join(os.path.dirname(__file__), "..")
+
+CLIS = ["train.py", "train_teacher.py", "evaluate_depth.py", "evaluate_pose.py", "test_sample.py"]
+
+# modules which should only be imported once a network is built or a figure drawn
+HEAVY_MODULES = ["torch", "torchvision", "matplotlib", "yacs", "cv2"]
+
+# runs a CLI with --help in the child and reports the heavy modules it imported
+HELP_CHILD = """
+import os, sys, json, runpy
+sys.argv = [{cli!r}, "--help"]
+sys.stdout = open(os.devnull, "w")
+try:
+    runpy.run_path({cli!r}, run_name="__main__")
+except SystemExit:
+    pass
+sys.stdout = sys.__stdout__
+print(json.dumps([m for m in {heavy!r} if m in sys.modules]))
+"""
+
+# imports the student trainer and loads its first training batch
+BATCH_CHILD = """
+import os, sys, json, time
+start_time = time.time()
+from options import MonodepthOptions
+opts = MonodepthOptions().parser.parse_args(sys.argv[1:])
+from torch.utils.data import DataLoader
+import trainer_student
+import datasets
+from utils import readlines
+import_time = time.time() - start_time
+
+fpath = os.path.join("splits", opts.split, "{}_files.txt")
+dataset = {"kitti": datasets.KITTIRAWDataset, "kitti_odom": datasets.KITTIOdomDataset}[opts.dataset](
+    opts.data_path, readlines(fpath.format("train")), opts.height, opts.width,
+    opts.frame_ids, 4, is_train=True, img_ext=".png" if opts.png else ".jpg")
+loader = DataLoader(dataset, opts.batch_size, shuffle=True, num_workers=opts.num_workers,
+                    pin_memory=True, drop_last=True, collate_fn=datasets.PackedCollate())
+next(iter(loader))
+print(json.dumps([import_time, time.time() - start_time]))
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Time to the --help of each command line entry point, and to the first '
+                    'training batch when --data_path is given')
+    parser.add_argument('--data_path', type=str,
+                        help='KITTI data, if set also times the first training batch')
+    parser.add_argument('--split', type=str, default='eigen_zhou')
+    parser.add_argument('--png', action='store_true')
+    parser.add_argument('--num_workers', type=int, default=4)
+    parser.add_argument('--iters', type=int, default=3,
+                        help='runs of each command, the fastest one is reported')
+    return parser.parse_args()
+
+
+def run_child(code, args=()):
+    """Wall time of a fresh interpreter running `code` from the repository root, and its
+    last line of output parsed as json
+    """
+    start_time = time.time()
+    output = subprocess.check_output([sys.executable, "-c", code] + list(args), cwd=root_dir)
+    return time.time() - start_time, json.loads(output.decode().strip().splitlines()[-1])
+
+
+def main():
+    args = parse_args()
+
+    baseline, _ = min(run_child("print('[]')") for _ in range(args.iters))
+    print("-> python startup {:.0f} ms".format(1000 * baseline))
+
+    print("\n{:>20} | {:>10} | {}".format("--help", "ms", "heavy modules imported"))
+    for cli in CLIS:
+        elapsed, loaded = min(run_child(HELP_CHILD.format(cli=cli, heavy=HEAVY_MODULES))
+                              for _ in range(args.iters))
+        print("{:>20} | {:10.0f} | {}".format(cli, 1000 * elapsed, ", ".join(loaded) or "-"))
+
+    if args.data_path is None:
+        print("\n-> set --data_path to time the first training batch")
+        return
+
+    train_args = ["--data_path", args.data_path, "--split", args.split,
+                  "--num_workers", str(args.num_workers)] + (["--png"] if args.png else [])
+    elapsed, (import_time, batch_time) = run_child(BATCH_CHILD, train_args)
+    print("\n-> first training batch | imports {:.0f} ms | first batch {:.0f} ms | "
+          "process {:.0f} ms".format(1000 * import_time, 1000 * batch_time, 1000 * elapsed))
+
+
+if __name__ == "__main__":
+    main()
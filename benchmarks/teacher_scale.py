@@ -0,0 +1,117 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+import argparse
+import time
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+import datasets
+import networks
+from geometry import disp_to_depth
+from utils import readlines
+from evaluate_depth import splits_dir, load_gt_depths, compute_depth_metrics
+from trainer_student import HelpedTeacher
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Accuracy vs speed of the distillation teacher at each --teacher_scale '
+                    'on the eigen split')
+    parser.add_argument('--data_path', type=str, required=True)
+    parser.add_argument('--load_weights_folder', type=str, required=True,
+                        help='encoder.pth and depth.pth of the helper student')
+    parser.add_argument('--load_weights_folder_teacher', type=str, required=True,
+                        help='encoder_t.pth and depth_t.pth of the teacher')
+    parser.add_argument('--upsampler_weights', type=str,
+                        help='disp_upsampler.pth of a student trained with --teacher_scale, '
+                             'bilinear upsampling if not set')
+    parser.add_argument('--teacher_scales', nargs='+', type=int, default=[0, 1, 2])
+    parser.add_argument('--height', type=int, default=192)
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--min_depth', type=float, default=0.1)
+    parser.add_argument('--max_depth', type=float, default=100.0)
+    parser.add_argument('--batch_size', type=int, default=16)
+    parser.add_argument('--num_workers', type=int, default=4)
+    parser.add_argument('--no_cuda', action='store_true')
+    return parser.parse_args()
+
+
+def load(model, path, device):
+    pretrained_dict = torch.load(path, map_location="cpu")
+    model_dict = model.state_dict()
+    model.load_state_dict({k: v for k, v in pretrained_dict.items() if k in model_dict})
+    return model.to(device).eval()
+
+
+def build_teacher(args, device):
+    student_encoder = networks.test_hr_encoder.hrnet18(False)
+    student_encoder.num_ch_enc = [64, 18, 36, 72, 144]
+    student_decoder = networks.HRDepthDecoder(student_encoder.num_ch_enc, range(4))
+    teacher_encoder = networks.ResnetEncoder(50, False, num_input_images=4)
+    teacher_decoder = networks.TeacherDecoder(teacher_encoder.num_ch_enc, 1)
+    for model, folder, name in [(student_encoder, args.load_weights_folder, "encoder.pth"),
+                                (student_decoder, args.load_weights_folder, "depth.pth"),
+                                (teacher_encoder, args.load_weights_folder_teacher, "encoder_t.pth"),
+                                (teacher_decoder, args.load_weights_folder_teacher, "depth_t.pth")]:
+        load(model, os.path.join(folder, name), device)
+    return networks.FrozenModule(
+        HelpedTeacher(student_encoder, student_decoder, teacher_encoder, teacher_decoder), device)
+
+
+def predict(teacher, upsampler, loader, teacher_scale, device):
+    """Full resolution teacher disparities of the split and the mean time per batch
+    """
+    sync = torch.cuda.synchronize if device.type == "cuda" else (lambda: None)
+    pred_disps = []
+    total_time = 0
+    with torch.no_grad():
+        for inputs in loader:
+            inputs.to_device(device)
+            sync()
+            start_time = time.time()
+            disp = teacher(*[inputs[("color", i, teacher_scale)] for i in [-1, 0, 1]])[("disp_t", 0)]
+            if teacher_scale > 0:
+                disp = upsampler(disp, inputs[("color", 0, 0)])
+            sync()
+            total_time += time.time() - start_time
+            pred_disps.append(disp[:, 0].cpu().numpy())
+    return np.concatenate(pred_disps), total_time / len(loader)
+
+
+def main():
+    args = parse_args()
+    device = torch.device("cpu" if args.no_cuda or not torch.cuda.is_available() else "cuda")
+
+    filenames = readlines(os.path.join(splits_dir, "eigen", "test_files.txt"))
+    dataset = datasets.KITTIRAWDataset(args.data_path, filenames, args.height, args.width,
+                                       [0, -1, 1], 4, is_train=False)
+    loader = DataLoader(dataset, args.batch_size, shuffle=False, num_workers=args.num_workers,
+                        pin_memory=True, drop_last=False, collate_fn=datasets.PackedCollate())
+    gt_depths = load_gt_depths("eigen")
+
+    teacher = build_teacher(args, device)
+    upsampler = networks.DispUpsampler().to(device).eval()
+    if args.upsampler_weights is not None:
+        load(upsampler, args.upsampler_weights, device)
+    metric_opt = argparse.Namespace(
+        eval_split="eigen", pred_depth_scale_factor=1, disable_median_scaling=False)
+
+    print("-> eigen | {} | {}x{} | {} upsampling".format(
+        device, args.width, args.height,
+        "learned" if args.upsampler_weights is not None else "bilinear"))
+    print(("{:>8} | {:>10} | {:>10} | " + "{:>8} | " * 7).format(
+        "scale", "teacher", "ms/batch", "abs_rel", "sq_rel", "rmse", "rmse_log", "a1", "a2", "a3"))
+    for teacher_scale in args.teacher_scales:
+        pred_disps, batch_time = predict(teacher, upsampler, loader, teacher_scale, device)
+        pred_disps, _ = disp_to_depth(torch.from_numpy(pred_disps), args.min_depth, args.max_depth)
+        errors, _ = compute_depth_metrics(pred_disps.numpy(), gt_depths, metric_opt)
+        mean_errors = np.array(errors).mean(0)
+        resolution = "{}x{}".format(args.width // 2 ** teacher_scale, args.height // 2 ** teacher_scale)
+        print(("{:>8} | {:>10} | {:>10.2f} | " + "{:>8.3f} | " * 7).format(
+            teacher_scale, resolution, 1000 * batch_time, *mean_errors.tolist()))
+
+
+if __name__ == "__main__":
+    main()
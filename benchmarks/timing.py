@@ -0,0 +1,21 @@
+from __future__ import absolute_import, division, print_function
+
+import time
+import torch
+
+
+def benchmark(fn, warmup=3, iters=10, device=None):
+    """Return the mean wall time in seconds of `fn()` over `iters` runs after `warmup` runs
+    """
+    sync = torch.cuda.synchronize if device is not None and torch.device(device).type == "cuda" \
+        else (lambda: None)
+
+    for _ in range(warmup):
+        fn()
+    sync()
+
+    start_time = time.time()
+    for _ in range(iters):
+        fn()
+    sync()
+    return (time.time() - start_time) / iters
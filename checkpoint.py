@@ -0,0 +1,148 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+import re
+import queue
+import random
+import threading
+import numpy as np
+import torch
+from torch.utils.data import Sampler
+
+
+def epoch_from_folder(folder):
+    """Epoch saved in a weights_<epoch> folder, None for other folders
+    """
+    match = re.match(r"weights_(\d+)$", os.path.basename(os.path.normpath(folder)))
+    return int(match.group(1)) if match else None
+
+
+def to_cpu(obj):
+    """Copy of a state dict, or of nested dicts and lists of them, with the tensors on the CPU
+    """
+    if torch.is_tensor(obj):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return type(obj)((k, to_cpu(v)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(to_cpu(v) for v in obj)
+    return obj
+
+
+def get_rng_state():
+    """The random states of python, numpy and torch, as types torch.load reads back with
+    weights_only
+    """
+    name, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    state = {"python": random.getstate(),
+             "numpy": (name, torch.from_numpy(keys.astype(np.int64)), pos, has_gauss,
+                       cached_gaussian),
+             "torch": torch.get_rng_state()}
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state):
+    random.setstate(state["python"])
+    name, keys, pos, has_gauss, cached_gaussian = state["numpy"]
+    np.random.set_state((name, keys.numpy().astype(np.uint32), pos, has_gauss, cached_gaussian))
+    torch.set_rng_state(state["torch"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
+class ResumableSampler(Sampler):
+    """Random sampler whose order only depends on the seed and the epoch
+
+    set_epoch(epoch, start) makes the next pass yield the permutation of `epoch` from its
+    `start`-th sample, so a resumed run continues with the rest of the same permutation.
+    Without a seed each run draws its own from the torch seed, as a shuffling DataLoader, and
+    the checkpoints store it.
+    """
+    def __init__(self, data_source, seed=None):
+        self.data_source = data_source
+        if seed is None:
+            seed = torch.initial_seed() % 2 ** 32
+        self.seed = seed
+        self.epoch = 0
+        self.start = 0
+
+    def set_epoch(self, epoch, start=0):
+        self.epoch = epoch
+        self.start = start
+
+    def __iter__(self):
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+        order = torch.randperm(len(self.data_source), generator=generator).tolist()
+        return iter(order[self.start:])
+
+    def __len__(self):
+        return len(self.data_source) - self.start
+
+    def state_dict(self):
+        return {"seed": self.seed}
+
+    def load_state_dict(self, state):
+        self.seed = state["seed"]
+
+
+def atomic_save(obj, path):
+    """torch.save to a temporary file renamed over `path`, so a crash never leaves a
+    truncated checkpoint behind
+    """
+    tmp_path = path + ".tmp"
+    torch.save(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+
+class CheckpointWriter(object):
+    """Writes checkpoints from a background thread
+
+    save() copies the state to the CPU before returning, so training can go on updating
+    the weights while the files are written. Errors of the thread are raised by the next
+    call to save(), wait() or close().
+    """
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.error = None
+        self.thread = threading.Thread(target=self.write_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write_loop(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is not None and self.error is None:
+                    for obj, path in item:
+                        atomic_save(obj, path)
+            except Exception as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+            if item is None:
+                return
+
+    def check(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def save(self, files):
+        """Queue a list of (obj, path) pairs, written in order
+        """
+        self.check()
+        self.queue.put([(to_cpu(obj), path) for obj, path in files])
+
+    def wait(self):
+        """Wait for the queued checkpoints to be written
+        """
+        self.queue.join()
+        self.check()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.check()
@@ -1,3 +1,5 @@
 from .kitti_dataset import KITTIRAWDataset, KITTIOdomDataset, KITTIDepthDataset
 from .cityscapes_preprocessed_dataset import CityscapesPreprocessedDataset
 from .cityscapes_evaldataset import CityscapesEvalDataset
+from .packed_batch import PackedBatch, PackedCollate
+from .sequence_frames import PoseFrames, FrameRing
@@ -41,6 +41,7 @@ class MonoDataset(data.Dataset):
                  num_scales,
                  is_train=False,
                  img_ext='.png',
+                 helper_disp_path=None,
                  ):
         super(MonoDataset, self).__init__()
 
@@ -56,6 +57,7 @@ class MonoDataset(data.Dataset):
 
         self.is_train = is_train
         self.img_ext = '.png'
+        self.helper_disp_path = helper_disp_path
 
         self.loader = pil_loader
         self.to_tensor = transforms.ToTensor()
@@ -123,6 +125,9 @@ class MonoDataset(data.Dataset):
             ("color_aug", <frame_id>, <scale>)      for augmented colour images,
             ("K", scale) or ("inv_K", scale)        for camera intrinsics,
             "depth_gt"                              for ground truth depth maps
+            ("helper_disp", <frame_id>, <scale>)    for disparities precomputed by
+                                                    export_helper_disps.py, at every scale
+                                                    for frame 0 and at scale 0 for the others
 
         <frame_id> is:
             an integer (e.g. 0, -1, or 1) representing the temporal step relative to 'index',
@@ -188,6 +193,21 @@ class MonoDataset(data.Dataset):
             del inputs[("color", i, -1)]
             del inputs[("color_aug", i, -1)]
 
+        if self.helper_disp_path is not None:
+            for i in self.frame_idxs:
+                if i == "s":
+                    continue
+                scales = range(self.num_scales) if i == 0 else [0]
+                if i in poses:
+                    # dummy frame
+                    for scale in scales:
+                        inputs[("helper_disp", i, scale)] = torch.zeros(
+                            1, self.height // 2 ** scale, self.width // 2 ** scale, dtype=torch.float16)
+                else:
+                    helper_disps = self.get_helper_disps(folder, frame_index + i, side, do_flip, scales)
+                    for scale in scales:
+                        inputs[("helper_disp", i, scale)] = helper_disps[scale]
+
         if self.load_depth and False:
             depth_gt = self.get_depth(folder, frame_index, side, do_flip)
             inputs["depth_gt"] = np.expand_dims(depth_gt, 0)
@@ -198,6 +218,29 @@ class MonoDataset(data.Dataset):
     def get_color(self, folder, frame_index, side, do_flip):
         raise NotImplementedError
 
+    def get_helper_disp_path(self, folder, frame_index, side):
+        """The image path with its extension replaced by .npz, relative to helper_disp_path
+        instead of data_path
+        """
+        image_path = os.path.splitext(self.get_image_path(folder, frame_index, side))[0]
+        return os.path.join(self.helper_disp_path,
+                            os.path.relpath(image_path, self.data_path) + ".npz")
+
+    def get_helper_disps(self, folder, frame_index, side, do_flip, scales):
+        """float16 1xHxW disparities of the helper student for an image, per scale
+
+        Each disp_<scale> array of the file holds the disparity of the image and the one of
+        the flipped image.
+        """
+        helper_disps = {}
+        with np.load(self.get_helper_disp_path(folder, frame_index, side)) as f:
+            for scale in scales:
+                disp = f["disp_{}".format(scale)][int(do_flip)]
+                assert disp.shape == (self.height // 2 ** scale, self.width // 2 ** scale), \
+                    "helper disparities were exported at another resolution"
+                helper_disps[scale] = torch.from_numpy(disp)[None]
+        return helper_disps
+
     def check_depth(self):
         raise NotImplementedError
 
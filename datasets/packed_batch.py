@@ -0,0 +1,137 @@
+from __future__ import absolute_import, division, print_function
+
+from collections import OrderedDict
+
+import torch
+from torch.utils.data import get_worker_info
+
+
+def group_name(key):
+    """The group a key of MonoDataset is stacked into
+
+    ("color", <frame_id>, <scale>) keys are stacked over the frames of a scale and
+    ("K", <scale>) keys over the scales, other keys get a group of their own.
+    """
+    if isinstance(key, tuple) and len(key) == 3:
+        return (key[0], key[2])
+    if isinstance(key, tuple) and len(key) == 2:
+        return (key[0],)
+    return key
+
+
+class PackedBatch(object):
+    """A collated batch stored in one flat buffer per dtype
+
+    The tensors of a group are stacked into an NxBx... block and every block of a dtype
+    lives in the same buffer, so moving the batch to the device is one copy per dtype
+    instead of one per key. The keys are views into the blocks and are read like the
+    dict returned by the datasets, e.g. inputs[("color", 0, 0)] is a Bx3xHxW view.
+
+    `groups` holds (keys, dtype, offset, shape, channels_last) per block, where shape is
+    the shape of a single key. With channels_last the block is stored as NxBxHxWxC and
+    the views are channels_last BxCxHxW tensors.
+    """
+    def __init__(self, buffers, groups):
+        self.buffers = buffers
+        self.groups = groups
+        self.views = self.make_views()
+
+    def make_views(self):
+        views = OrderedDict()
+        for keys, dtype, offset, shape, channels_last in self.groups:
+            if channels_last:
+                shape = shape[:1] + shape[2:] + shape[1:2]
+            block_shape = torch.Size((len(keys),) + tuple(shape))
+            block = self.buffers[dtype][offset:offset + block_shape.numel()].view(block_shape)
+            for i, key in enumerate(keys):
+                views[key] = block[i].permute(0, 3, 1, 2) if channels_last else block[i]
+        return views
+
+    def __getstate__(self):
+        # the views are rebuilt rather than sent between processes
+        return {"buffers": self.buffers, "groups": self.groups}
+
+    def __setstate__(self, state):
+        self.__init__(state["buffers"], state["groups"])
+
+    def __getitem__(self, key):
+        return self.views[key]
+
+    def __contains__(self, key):
+        return key in self.views
+
+    def __iter__(self):
+        return iter(self.views)
+
+    def __len__(self):
+        return len(self.views)
+
+    def keys(self):
+        return self.views.keys()
+
+    def values(self):
+        return self.views.values()
+
+    def items(self):
+        return self.views.items()
+
+    def pin_memory(self):
+        """Called by DataLoader when pin_memory=True
+        """
+        return PackedBatch({d: b.pin_memory() for d, b in self.buffers.items()}, self.groups)
+
+    def to_device(self, device, non_blocking=True):
+        """Move the buffers to `device` in place, asynchronously when they are pinned
+        """
+        self.buffers = {d: b.to(device, non_blocking=non_blocking)
+                        for d, b in self.buffers.items()}
+        self.views = self.make_views()
+        return self
+
+
+class PackedCollate(object):
+    """collate_fn returning a PackedBatch
+
+    The samples are copied straight into the packed buffers, which are allocated in
+    shared memory inside worker processes like default_collate does. With channels_last
+    the CxHxW tensors of the samples are stored channels last.
+    """
+    def __init__(self, channels_last=False):
+        self.channels_last = channels_last
+
+    def __call__(self, samples):
+        batch_size = len(samples)
+
+        blocks = OrderedDict()
+        for key, value in samples[0].items():
+            assert torch.is_tensor(value), \
+                "PackedCollate only packs tensors, got {} for {}".format(type(value).__name__, key)
+            shape = (batch_size,) + tuple(value.shape)
+            name = group_name(key)
+            block = blocks.get(name)
+            if block is not None and (block[1] != value.dtype or block[3] != shape):
+                # keys of a group which do not stack, e.g. a dummy frame, are kept apart
+                name = key
+                block = None
+            if block is None:
+                channels_last = self.channels_last and value.dim() == 3
+                blocks[name] = block = [[], value.dtype, None, shape, channels_last]
+            block[0].append(key)
+
+        sizes = {}
+        for block in blocks.values():
+            block[2] = sizes.get(block[1], 0)
+            sizes[block[1]] = block[2] + len(block[0]) * torch.Size(block[3]).numel()
+
+        buffers = {}
+        for dtype, size in sizes.items():
+            buffers[dtype] = torch.empty(size, dtype=dtype)
+            if get_worker_info() is not None:
+                # sent to the main process without another copy
+                buffers[dtype].share_memory_()
+
+        batch = PackedBatch(buffers, [tuple(block) for block in blocks.values()])
+        for key, view in batch.items():
+            for i, sample in enumerate(samples):
+                view[i].copy_(sample[key])
+        return batch
@@ -0,0 +1,51 @@
+from __future__ import absolute_import, division, print_function
+
+import torch
+import torch.utils.data as data
+
+
+class PoseFrames(data.Dataset):
+    """The frames of an odometry sequence, decoded once and resized to the pose network input
+    """
+    def __init__(self, dataset):
+        super(PoseFrames, self).__init__()
+        self.dataset = dataset
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, index):
+        folder, frame_index, side = self.dataset.index_to_folder_and_frame_idx(index)
+        color = self.dataset.get_color(folder, frame_index, side, False)
+        return self.dataset.to_tensor(self.dataset.resize[0](color))
+
+
+class FrameRing(object):
+    """Frames of a sequence kept on the device between batches
+
+    push() copies a batch of frames to the device after the last frame of the previous batch
+    and returns the frames of all the consecutive pairs now available, the last frame is then
+    moved to the front to start the pairs of the next batch.
+    """
+    def __init__(self, device):
+        self.device = device
+        self.buffer = None
+        self.num_frames = 0
+
+    def push(self, frames):
+        n = frames.shape[0]
+        if self.buffer is None or self.buffer.shape[0] < n + 1:
+            buffer = torch.empty((n + 1,) + frames.shape[1:], dtype=frames.dtype,
+                                 device=self.device)
+            if self.num_frames > 0:
+                buffer[:1].copy_(self.buffer[:1])
+            self.buffer = buffer
+        self.buffer[self.num_frames:self.num_frames + n].copy_(
+            frames, non_blocking=self.device.type == "cuda")
+        end = self.num_frames + n
+
+        # the pairs are concatenated along the channels, which copies them out of the buffer
+        pairs = torch.cat([self.buffer[:end - 1], self.buffer[1:end]], 1)
+        self.buffer[:1].copy_(self.buffer[end - 1:end])
+        self.num_frames = 1
+        return pairs
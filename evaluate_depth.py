@@ -1,19 +1,10 @@
 from __future__ import absolute_import, division, print_function
 
 import os
-import cv2
 import numpy as np
 import time
-import torch
-from torch.utils.data import DataLoader
-from  torchvision.utils import save_image
-from layers import disp_to_depth
 from utils import readlines, sec_to_hm_str
 from options import MonodepthOptions
-import datasets
-import networks
-print(torch.__version__)
-cv2.setNumThreads(0)  # This speeds up evaluation 5x on our unix systems (OpenCV 3.3.1)
 
 
 splits_dir = os.path.join(os.path.dirname(__file__), "splits")
@@ -72,11 +63,76 @@ def batch_post_process_disparity(l_disp, r_disp):
     return r_mask * l_disp + l_mask * r_disp + (1.0 - l_mask - r_mask) * m_disp
 
 
+def load_gt_depths(eval_split):
+    """Load the ground truth depths of an evaluation split
+    """
+    gt_path = os.path.join(splits_dir, eval_split, "gt_depths.npz")
+    return np.load(gt_path, fix_imports=True, encoding='latin1', allow_pickle=True)["data"]
+
+
+def compute_depth_metrics(pred_disps, gt_depths, opt):
+    """Compute the per-image error metrics of predicted disparities against ground truth
+
+    Returns the list of per-image errors (see compute_errors) and the median scaling ratios
+    """
+    import cv2
+    cv2.setNumThreads(0)
+    MIN_DEPTH = 1e-3
+    MAX_DEPTH = 80
+
+    errors = []
+    ratios = []
+    for i in range(pred_disps.shape[0]):
+
+        gt_depth = gt_depths[i]
+        gt_height, gt_width = gt_depth.shape[:2]
+
+        pred_disp = pred_disps[i]
+        pred_disp = cv2.resize(pred_disp, (gt_width, gt_height))
+        pred_depth = 1 / pred_disp
+        if opt.eval_split == "eigen":
+            mask = np.logical_and(gt_depth > MIN_DEPTH, gt_depth < MAX_DEPTH)
+
+            crop = np.array([0.40810811 * gt_height, 0.99189189 * gt_height,
+                             0.03594771 * gt_width,  0.96405229 * gt_width]).astype(np.int32)
+            crop_mask = np.zeros(mask.shape)
+            crop_mask[crop[0]:crop[1], crop[2]:crop[3]] = 1
+            mask = np.logical_and(mask, crop_mask)
+
+        else:
+            mask = gt_depth > 0
+
+        pred_depth = pred_depth[mask]
+        gt_depth = gt_depth[mask]
+        pred_depth *= opt.pred_depth_scale_factor
+
+        if not opt.disable_median_scaling:
+            ratio = np.median(gt_depth) / np.median(pred_depth)
+            ratios.append(ratio)
+            pred_depth *= ratio
+
+        pred_depth[pred_depth < MIN_DEPTH] = MIN_DEPTH
+        pred_depth[pred_depth > MAX_DEPTH] = MAX_DEPTH
+        errors.append(compute_errors(gt_depth, pred_depth))
+
+    return errors, ratios
+
+
 def evaluate(opt):
     """Evaluates a pretrained model using a specified test set
     """
+    # imported here so that --help and the metric helpers do not load torch, cv2 and the networks
+    import cv2
+    import torch
+    from torch.utils.data import DataLoader
+    from geometry import disp_to_depth
+    import datasets
+    import networks
+    from weight_registry import load_state_dict
+
     MIN_DEPTH = 1e-3
     MAX_DEPTH = 80
+    cv2.setNumThreads(0)  # This speeds up evaluation 5x on our unix systems (OpenCV 3.3.1)
 
     assert sum((opt.eval_mono, opt.eval_stereo)) == 1, \
         "Please choose mono or stereo evaluation by setting either --eval_mono or --eval_stereo"
@@ -93,8 +149,8 @@ def evaluate(opt):
         encoder_path = os.path.join(opt.load_weights_folder, "encoder.pth")
         decoder_path = os.path.join(opt.load_weights_folder, "depth.pth")
         
-        encoder_dict = torch.load(encoder_path) if torch.cuda.is_available() else torch.load(encoder_path,map_location = 'cpu')
-        decoder_dict = torch.load(decoder_path) if torch.cuda.is_available() else torch.load(encoder_path,map_location = 'cpu')
+        encoder_dict = load_state_dict(encoder_path)
+        decoder_dict = load_state_dict(decoder_path)
         dataset = datasets.KITTIRAWDataset(opt.data_path, filenames,
                                            encoder_dict['height'], encoder_dict['width'],
                                            [0], 4, is_train=False)
@@ -113,6 +169,9 @@ def evaluate(opt):
         encoder.eval()
         depth_decoder.cuda() if torch.cuda.is_available() else depth_decoder.cpu()
         depth_decoder.eval()
+        if opt.channels_last:
+            encoder.to(memory_format=torch.channels_last)
+            depth_decoder.to(memory_format=torch.channels_last)
         pred_disps = []
         print('-->Using\n cuda') if torch.cuda.is_available() else print('-->Using\n CPU')
         print("-> Computing predictions with size {}x{}".format(
@@ -132,6 +191,8 @@ def evaluate(opt):
                 if opt.post_process:
                     # Post-processed results require each image to have two forward passes
                     input_color = torch.cat((input_color, torch.flip(input_color, [3])), 0)
+                if opt.channels_last:
+                    input_color = input_color.contiguous(memory_format=torch.channels_last)
 
                 output = depth_decoder(encoder(input_color))
 
@@ -187,9 +248,7 @@ def evaluate(opt):
         print("-> No ground truth is available for the KITTI benchmark, so not evaluating. Done.")
         quit()
 
-    gt_path = os.path.join(splits_dir, opt.eval_split, "gt_depths.npz")
-    gt_depths = np.load(gt_path, fix_imports=True, encoding='latin1',allow_pickle=True)["data"]
-    #gt_depths = np.load(gt_path, fix_imports=True, encoding='latin1')["data"]
+    gt_depths = load_gt_depths(opt.eval_split)
 
     print("-> Evaluating")
 
@@ -201,47 +260,7 @@ def evaluate(opt):
     else:
         print("   Mono evaluation - using median scaling")
 
-    errors = []
-    ratios = []
-    
-    tobe_cleaned = []
-    cleaned = list(range(pred_disps.shape[0]))
-    for i in tobe_cleaned:
-        if i in cleaned:
-            cleaned.remove(i)
-    for i in range(pred_disps.shape[0]):
-
-        gt_depth = gt_depths[i]
-        gt_height, gt_width = gt_depth.shape[:2]
-
-        pred_disp = pred_disps[i]
-        pred_disp = cv2.resize(pred_disp, (gt_width, gt_height))
-        pred_depth = 1 / pred_disp
-        if opt.eval_split == "eigen":
-            mask = np.logical_and(gt_depth > MIN_DEPTH, gt_depth < MAX_DEPTH)
-
-            crop = np.array([0.40810811 * gt_height, 0.99189189 * gt_height,
-                             0.03594771 * gt_width,  0.96405229 * gt_width]).astype(np.int32)
-            crop_mask = np.zeros(mask.shape)
-            crop_mask[crop[0]:crop[1], crop[2]:crop[3]] = 1
-            mask = np.logical_and(mask, crop_mask)
-
-        else:
-            mask = gt_depth > 0
-        
-        
-        pred_depth = pred_depth[mask]
-        gt_depth = gt_depth[mask]
-        pred_depth *= opt.pred_depth_scale_factor
-        
-        if not opt.disable_median_scaling:
-            ratio = np.median(gt_depth) / np.median(pred_depth)
-            ratios.append(ratio)
-            pred_depth *= ratio
-
-        pred_depth[pred_depth < MIN_DEPTH] = MIN_DEPTH
-        pred_depth[pred_depth > MAX_DEPTH] = MAX_DEPTH
-        errors.append(compute_errors(gt_depth, pred_depth))
+    errors, ratios = compute_depth_metrics(pred_disps, gt_depths, opt)
 
     if not opt.disable_median_scaling:
         ratios = np.array(ratios)
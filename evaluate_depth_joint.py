@@ -0,0 +1,212 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+import time
+import numpy as np
+import torch
+import torch.utils.data as data
+from torch.utils.data import DataLoader
+
+from geometry import disp_to_depth
+from utils import readlines, sec_to_hm_str
+from options_teacher import MonodepthOptions
+from evaluate_depth import splits_dir, STEREO_SCALE_FACTOR, batch_post_process_disparity, \
+    load_gt_depths, compute_depth_metrics
+import datasets
+import networks
+from weight_registry import load_state_dict
+
+
+class EvalImages(data.Dataset):
+    """The distinct images used by the test items, each decoded once
+
+    An image missing from the disk is a black frame, as the dummy frames of MonoDataset.
+    """
+    def __init__(self, dataset, images):
+        super(EvalImages, self).__init__()
+        self.dataset = dataset
+        self.images = images
+
+    def __len__(self):
+        return len(self.images)
+
+    def __getitem__(self, index):
+        folder, frame_index, side = self.images[index]
+        try:
+            color = self.dataset.get_color(folder, frame_index, side, False)
+        except FileNotFoundError:
+            return torch.zeros(3, self.dataset.height, self.dataset.width)
+        return self.dataset.to_tensor(self.dataset.resize[0](color))
+
+
+def load(model, path, device):
+    pretrained_dict = load_state_dict(path)
+    model_dict = model.state_dict()
+    model.load_state_dict({k: v for k, v in pretrained_dict.items() if k in model_dict})
+    model.to(device)
+    model.eval()
+    return pretrained_dict
+
+
+def predict(opt, filenames, device):
+    """Student and teacher disparities of the test items from one pass over their images
+
+    The student runs once per image. Its outputs stay cached until the last test item using
+    the image as frame -1, 0 or 1 has been predicted, so the disparity of frame 0 is both the
+    student prediction and part of the teacher input of its item, and the neighbouring frames
+    shared by consecutive items are not predicted again.
+    """
+    encoder = networks.test_hr_encoder.hrnet18(False)
+    encoder.num_ch_enc = [64, 18, 36, 72, 144]
+    depth_decoder = networks.HRDepthDecoder(encoder.num_ch_enc, opt.scales)
+    encoder_dict = load(encoder, os.path.join(opt.load_weights_folder, "encoder.pth"), device)
+    load(depth_decoder, os.path.join(opt.load_weights_folder, "depth.pth"), device)
+    if opt.channels_last:
+        encoder.to(memory_format=torch.channels_last)
+        depth_decoder.to(memory_format=torch.channels_last)
+
+    encoder_teacher = networks.ResnetEncoder(50, False, num_input_images=4)
+    decoder_teacher = networks.TeacherDecoder(encoder_teacher.num_ch_enc, 1)
+    load(encoder_teacher, os.path.join(opt.load_weights_folder_teacher, "encoder_t.pth"), device)
+    load(decoder_teacher, os.path.join(opt.load_weights_folder_teacher, "depth_t.pth"), device)
+
+    dataset = datasets.KITTIRAWDataset(opt.data_path, filenames,
+                                       encoder_dict['height'], encoder_dict['width'],
+                                       [0], 1, is_train=False)
+
+    # the distinct images in order of first use, and the images of every item
+    images = {}
+    item_images = []
+    for index in range(len(filenames)):
+        folder, frame_index, side = dataset.index_to_folder_and_frame_idx(index)
+        item_images.append([images.setdefault((folder, frame_index + i, side), len(images))
+                            for i in [-1, 0, 1]])
+    last_use = {}
+    for index, image_ids in enumerate(item_images):
+        for image_id in image_ids:
+            last_use[image_id] = index
+
+    batch_size = 16
+    dataloader = DataLoader(EvalImages(dataset, list(images)), batch_size, shuffle=False,
+                            num_workers=opt.num_workers, pin_memory=True, drop_last=False)
+    image_batches = iter(dataloader)
+
+    print("-> Computing predictions of {} items from {} images with size {}x{}".format(
+        len(filenames), len(images), encoder_dict['width'], encoder_dict['height']))
+
+    # image id -> (color, student disparity, student disparity of the flipped color)
+    cache = {}
+    next_image = 0
+    student_disps = []
+    teacher_disps = []
+    with torch.no_grad():
+        init_time = time.time()
+        for start in range(0, len(item_images), batch_size):
+            items = item_images[start:start + batch_size]
+
+            while next_image <= max(max(image_ids) for image_ids in items):
+                colors = next(image_batches).to(device)
+                input_color = colors
+                if opt.post_process:
+                    # Post-processed results require each image to have two forward passes
+                    input_color = torch.cat((colors, torch.flip(colors, [3])), 0)
+                if opt.channels_last:
+                    input_color = input_color.contiguous(memory_format=torch.channels_last)
+                disps = depth_decoder(encoder(input_color))[("disp", 0)]
+                flipped_disps = disps[colors.shape[0]:] if opt.post_process else disps
+                for j in range(colors.shape[0]):
+                    cache[next_image + j] = (colors[j], disps[j], flipped_disps[j])
+                next_image += colors.shape[0]
+
+            student_disp = torch.stack([cache[image_ids[1]][1] for image_ids in items])
+            teacher_input = torch.stack([
+                torch.cat([t for image_id in image_ids for t in cache[image_id][:2]], 0)
+                for image_ids in items])
+            if opt.post_process:
+                student_disp = torch.cat(
+                    (student_disp, torch.stack([cache[image_ids[1]][2] for image_ids in items])), 0)
+                flipped_input = torch.stack([
+                    torch.cat([t for image_id in image_ids for t in
+                               (torch.flip(cache[image_id][0], [2]), cache[image_id][2])], 0)
+                    for image_ids in items])
+                teacher_input = torch.cat((teacher_input, flipped_input), 0)
+            teacher_disp = decoder_teacher(encoder_teacher(teacher_input))[("disp_t", 0)]
+
+            for pred_disps, disp in [(student_disps, student_disp), (teacher_disps, teacher_disp)]:
+                pred_disp, _ = disp_to_depth(disp, opt.min_depth, opt.max_depth)
+                pred_disp = pred_disp.cpu()[:, 0].numpy()
+                if opt.post_process:
+                    N = pred_disp.shape[0] // 2
+                    pred_disp = batch_post_process_disparity(pred_disp[:N], pred_disp[N:, :, ::-1])
+                pred_disps.append(pred_disp)
+
+            end = start + len(items)
+            for image_id in [image_id for image_id in cache if last_use[image_id] < end]:
+                del cache[image_id]
+
+        print("===>total time:{}".format(sec_to_hm_str(time.time() - init_time)))
+
+    return np.concatenate(student_disps), np.concatenate(teacher_disps)
+
+
+def evaluate(opt):
+    """Evaluates a student and the teacher it helps on a test set in one pass
+    """
+    assert sum((opt.eval_mono, opt.eval_stereo)) == 1, \
+        "Please choose mono or stereo evaluation by setting either --eval_mono or --eval_stereo"
+    assert opt.eval_split in ["eigen", "eigen_benchmark"], \
+        "eval_split should be a split with ground truth depths, eigen or eigen_benchmark"
+
+    for folder in [opt.load_weights_folder, opt.load_weights_folder_teacher]:
+        assert os.path.isdir(os.path.expanduser(folder)), "Cannot find a folder at {}".format(folder)
+    opt.load_weights_folder = os.path.expanduser(opt.load_weights_folder)
+    opt.load_weights_folder_teacher = os.path.expanduser(opt.load_weights_folder_teacher)
+
+    print("-> Loading weights from {} and {}".format(
+        opt.load_weights_folder, opt.load_weights_folder_teacher))
+    device = torch.device("cpu" if opt.no_cuda or not torch.cuda.is_available() else "cuda")
+
+    filenames = readlines(os.path.join(splits_dir, opt.eval_split, "test_files.txt"))
+    student_disps, teacher_disps = predict(opt, filenames, device)
+
+    if opt.save_pred_disps:
+        for folder, pred_disps in [(opt.load_weights_folder, student_disps),
+                                   (opt.load_weights_folder_teacher, teacher_disps)]:
+            output_path = os.path.join(folder, "disps_{}_split.npy".format(opt.eval_split))
+            print("-> Saving predicted disparities to ", output_path)
+            np.save(output_path, pred_disps)
+
+    if opt.no_eval:
+        print("-> Evaluation disabled. Done.")
+        return
+
+    gt_depths = load_gt_depths(opt.eval_split)
+
+    print("-> Evaluating")
+
+    if opt.eval_stereo:
+        print("   Stereo evaluation - "
+              "disabling median scaling, scaling by {}".format(STEREO_SCALE_FACTOR))
+        opt.disable_median_scaling = True
+        opt.pred_depth_scale_factor = STEREO_SCALE_FACTOR
+    else:
+        print("   Mono evaluation - using median scaling")
+
+    for name, pred_disps in [("student", student_disps), ("teacher", teacher_disps)]:
+        errors, ratios = compute_depth_metrics(pred_disps, gt_depths, opt)
+
+        print("\n-> {}".format(name))
+        if not opt.disable_median_scaling:
+            ratios = np.array(ratios)
+            med = np.median(ratios)
+            print(" Scaling ratios | med: {:0.3f} | std: {:0.3f}".format(med, np.std(ratios / med)))
+        mean_errors = np.array(errors).mean(0)
+
+        print("\n  " + ("{:>8} | " * 7).format("abs_rel", "sq_rel", "rmse", "rmse_log", "a1", "a2", "a3"))
+        print(("&{: 8.3f}  " * 7).format(*mean_errors.tolist()) + "\\\\")
+    print("\n-> Done!")
+
+
+if __name__ == "__main__":
+    options = MonodepthOptions()
+    evaluate(options.parse())
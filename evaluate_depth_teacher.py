@@ -1,19 +1,10 @@
 from __future__ import absolute_import, division, print_function
 
 import os
-import cv2
 import numpy as np
 import time
-import torch
-from torch.utils.data import DataLoader
-from  torchvision.utils import save_image
-from layers import disp_to_depth
 from utils import readlines, sec_to_hm_str
 from options_teacher import MonodepthOptions
-import datasets
-import networks
-print(torch.__version__)
-cv2.setNumThreads(0)  # This speeds up evaluation 5x on our unix systems (OpenCV 3.3.1)
 
 
 splits_dir = os.path.join(os.path.dirname(__file__), "splits")
@@ -75,8 +66,18 @@ def batch_post_process_disparity(l_disp, r_disp):
 def evaluate(opt):
     """Evaluates a pretrained model using a specified test set
     """
+    # imported here so that --help and the metric helpers do not load torch, cv2 and the networks
+    import cv2
+    import torch
+    from torch.utils.data import DataLoader
+    from geometry import disp_to_depth
+    import datasets
+    import networks
+    from weight_registry import load_state_dict
+
     MIN_DEPTH = 1e-3
     MAX_DEPTH = 80
+    cv2.setNumThreads(0)  # This speeds up evaluation 5x on our unix systems (OpenCV 3.3.1)
 
     assert sum((opt.eval_mono, opt.eval_stereo)) == 1, \
         "Please choose mono or stereo evaluation by setting either --eval_mono or --eval_stereo"
@@ -93,8 +94,8 @@ def evaluate(opt):
         encoder_path = os.path.join(opt.load_weights_folder, "encoder.pth")
         decoder_path = os.path.join(opt.load_weights_folder, "depth.pth")
         
-        encoder_dict = torch.load(encoder_path) if torch.cuda.is_available() else torch.load(encoder_path,map_location = 'cpu')
-        decoder_dict = torch.load(decoder_path) if torch.cuda.is_available() else torch.load(decoder_path,map_location = 'cpu')
+        encoder_dict = load_state_dict(encoder_path)
+        decoder_dict = load_state_dict(decoder_path)
         dataset = datasets.KITTIRAWDataset(opt.data_path, filenames,
                                            encoder_dict['height'], encoder_dict['width'],
                                            [0, -1, 1], 4, is_train=False)
@@ -121,10 +122,10 @@ def evaluate(opt):
         # teacher network
         encoder_teacher_path = os.path.join(opt.load_weights_folder_teacher, "encoder_t.pth")
         decoder_teacher_path = os.path.join(opt.load_weights_folder_teacher, "depth_t.pth")
-        encoder_teacher_dict = torch.load(encoder_teacher_path) if torch.cuda.is_available() else torch.load(encoder_teacher_path,map_location = 'cpu')
-        decoder_teacher_dict = torch.load(decoder_teacher_path) if torch.cuda.is_available() else torch.load(decoder_teacher_path,map_location = 'cpu')
+        encoder_teacher_dict = load_state_dict(encoder_teacher_path)
+        decoder_teacher_dict = load_state_dict(decoder_teacher_path)
         
-        encoder_teacher = networks.ResnetEncoder(50, "pretrained", num_input_images=4)
+        encoder_teacher = networks.ResnetEncoder(50, False, num_input_images=4)
         decoder_teacher = networks.TeacherDecoder(encoder_teacher.num_ch_enc, 1)
 
         model_dict_teacher = encoder_teacher.state_dict()
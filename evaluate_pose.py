@@ -1,126 +1,193 @@
 from __future__ import absolute_import, division, print_function
 
 import os
+from itertools import zip_longest
 import numpy as np
 
-import torch
-from torch.utils.data import DataLoader
-
-from layers import transformation_from_parameters
 from utils import readlines
 from options import MonodepthOptions
-from datasets import KITTIOdomDataset
-import networks
 
 
-# from https://github.com/tinghuiz/SfMLearner
-def dump_xyz(source_to_target_transformations):
-    xyzs = []
-    cam_to_world = np.eye(4)
-    xyzs.append(cam_to_world[:3, 3])
-    for source_to_target_transformation in source_to_target_transformations:
-        cam_to_world = np.dot(cam_to_world, source_to_target_transformation)
-        xyzs.append(cam_to_world[:3, 3])
-    return xyzs
+# adapted from https://github.com/tinghuiz/SfMLearner to all the windows of a sequence at once
+def dump_xyz_windows(source_to_target_transformations, track_length):
+    """Positions along every window of track_length - 1 consecutive transformations
+
+    Returns the Nx(track_length)x3 positions of the N windows, starting at the origin, and
+    the Nx(track_length) mask of the positions inside the sequence, since the windows at
+    the end of the sequence are shorter.
+    """
+    num_transformations = len(source_to_target_transformations)
+    steps = track_length - 1
+
+    # the windows at the end are padded with identities, masked out of the errors
+    padded = np.concatenate([source_to_target_transformations,
+                             np.tile(np.eye(4), (steps - 1, 1, 1))])
+    windows = padded[np.arange(num_transformations)[:, None] + np.arange(steps)[None, :]]
+
+    cam_to_world = np.tile(np.eye(4), (num_transformations, 1, 1))
+    xyzs = [cam_to_world[:, :3, 3]]
+    for k in range(steps):
+        cam_to_world = np.matmul(cam_to_world, windows[:, k])
+        xyzs.append(cam_to_world[:, :3, 3])
 
+    mask = np.arange(num_transformations)[:, None] + np.arange(track_length)[None, :] \
+        <= num_transformations
+    return np.stack(xyzs, 1), mask
 
-# from https://github.com/tinghuiz/SfMLearner
-def compute_ate(gtruth_xyz, pred_xyz_o):
+
+# adapted from https://github.com/tinghuiz/SfMLearner to all the windows of a sequence at once
+def compute_ates(gtruth_xyz, pred_xyz_o, mask):
+    """ATE of every window, the arguments are as returned by dump_xyz_windows
+    """
+    mask = mask[..., None].astype(gtruth_xyz.dtype)
 
     # Make sure that the first matched frames align (no need for rotational alignment as
     # all the predicted/ground-truth snippets have been converted to use the same coordinate
     # system with the first frame of the snippet being the origin).
-    offset = gtruth_xyz[0] - pred_xyz_o[0]
-    pred_xyz = pred_xyz_o + offset[None, :]
+    offset = gtruth_xyz[:, :1] - pred_xyz_o[:, :1]
+    pred_xyz = pred_xyz_o + offset
 
     # Optimize the scaling factor
-    scale = np.sum(gtruth_xyz * pred_xyz) / np.sum(pred_xyz ** 2)
-    alignment_error = pred_xyz * scale - gtruth_xyz
-    rmse = np.sqrt(np.sum(alignment_error ** 2)) / gtruth_xyz.shape[0]
+    scale = np.sum(gtruth_xyz * pred_xyz * mask, (1, 2)) / np.sum(pred_xyz ** 2 * mask, (1, 2))
+    alignment_error = (pred_xyz * scale[:, None, None] - gtruth_xyz) * mask
+    rmse = np.sqrt(np.sum(alignment_error ** 2, (1, 2))) / np.sum(mask, (1, 2))
     return rmse
 
 
-def evaluate(opt):
-    """Evaluate odometry on the KITTI dataset
-    """
-    assert os.path.isdir(opt.load_weights_folder), \
-        "Cannot find a folder at {}".format(opt.load_weights_folder)
+def load_pose_networks(opt, device):
+    import networks
+    from weight_registry import load_state_dict
+
+    pose_encoder_path = os.path.join(opt.load_weights_folder, "pose_encoder.pth")
+    pose_decoder_path = os.path.join(opt.load_weights_folder, "pose.pth")
+
+    pose_encoder = networks.ResnetEncoder(opt.num_layers, False, 2)
+    pose_encoder.load_state_dict(load_state_dict(pose_encoder_path))
+
+    pose_decoder_dict = load_state_dict(pose_decoder_path)
+    if any(k.startswith("convs.") for k in pose_decoder_dict):
+        # trained with --pose_decoder_sharing, only the full pose head is evaluated
+        heads = [head for head in networks.MultiHeadPoseDecoder.head_dims
+                 if "convs.{}_2.weight".format(head) in pose_decoder_dict]
+        share_trunk = "convs.trunk_0.weight" in pose_decoder_dict
+        pose_decoder = networks.MultiHeadPoseDecoder(
+            pose_encoder.num_ch_enc, 1, 2, heads=heads, share_trunk=share_trunk)
+    else:
+        pose_decoder = networks.PoseDecoder(pose_encoder.num_ch_enc, 1, 2)
+    pose_decoder.load_state_dict(pose_decoder_dict)
+
+    pose_encoder.to(device)
+    pose_encoder.eval()
+    pose_decoder.to(device)
+    pose_decoder.eval()
+    return pose_encoder, pose_decoder
 
-    assert opt.eval_split == "odom_9" or opt.eval_split == "odom_10", \
-        "eval_split should be either odom_9 or odom_10"
 
-    sequence_id = int(opt.eval_split.split("_")[1])
+def sequence_loader(opt, sequence_id):
+    from torch.utils.data import DataLoader
+    from datasets import KITTIOdomDataset, PoseFrames
 
     filenames = readlines(
         os.path.join(os.path.dirname(__file__), "splits", "odom",
                      "test_files_{:02d}.txt".format(sequence_id)))
 
+    # every frame is loaded once, the pairs of consecutive frames are built per batch,
+    # so the frame after the last test file is needed for the last pair
+    folder, frame_index, side = filenames[-1].split()
+    filenames = filenames + ["{} {} {}".format(folder, int(frame_index) + 1, side)]
+
     dataset = KITTIOdomDataset(opt.data_path, filenames, opt.height, opt.width,
-                               [0, 1], 4, is_train=False)
-    dataloader = DataLoader(dataset, opt.batch_size, shuffle=False,
-                            num_workers=opt.num_workers, pin_memory=True, drop_last=False)
+                               [0], 1, is_train=False)
+    return DataLoader(PoseFrames(dataset), opt.batch_size, shuffle=False,
+                      num_workers=opt.num_workers, pin_memory=True, drop_last=False)
 
-    pose_encoder_path = os.path.join(opt.load_weights_folder, "pose_encoder.pth")
-    pose_decoder_path = os.path.join(opt.load_weights_folder, "pose.pth")
 
-    pose_encoder = networks.ResnetEncoder(opt.num_layers, False, 2)
-    pose_encoder.load_state_dict(torch.load(pose_encoder_path))
+def predict_poses(loaders, pose_encoder, pose_decoder, device):
+    """Relative poses between the consecutive frames of each sequence
 
-    pose_decoder = networks.PoseDecoder(pose_encoder.num_ch_enc, 1, 2)
-    pose_decoder.load_state_dict(torch.load(pose_decoder_path))
+    The sequences are read side by side, the pairs of one batch of every sequence go
+    through the pose network together.
+    """
+    import torch
+    from geometry import transformation_from_parameters
+    from datasets import FrameRing
 
-    pose_encoder.cuda()
-    pose_encoder.eval()
-    pose_decoder.cuda()
-    pose_decoder.eval()
+    rings = [FrameRing(device) for _ in loaders]
+    pred_poses = [[] for _ in loaders]
 
-    pred_poses = []
+    with torch.no_grad():
+        for batches in zip_longest(*loaders):
+            pairs = [(i, rings[i].push(frames))
+                     for i, frames in enumerate(batches) if frames is not None]
+            pairs = [(i, p) for i, p in pairs if p.shape[0] > 0]
+            if not pairs:
+                continue
 
-    print("-> Computing pose predictions")
+            # pose network only takes two frames as input, all the consecutive pairs are
+            # stacked along the batch dimension and encoded in one pass
+            all_color_aug = torch.cat([p for _, p in pairs], 0)
 
-    opt.frame_ids = [0, 1]  # pose network only takes two frames as input
+            features = [pose_encoder(all_color_aug)]
+            pose_outputs = pose_decoder(features)
+            if isinstance(pose_outputs, dict):
+                pose_outputs = pose_outputs["pose"]
+            axisangle, translation = pose_outputs
 
-    with torch.no_grad():
-        for inputs in dataloader:
-            for key, ipt in inputs.items():
-                inputs[key] = ipt.cuda()
+            poses = transformation_from_parameters(axisangle[:, 0], translation[:, 0]).cpu().numpy()
+            start = 0
+            for i, p in pairs:
+                pred_poses[i].append(poses[start:start + p.shape[0]])
+                start += p.shape[0]
 
-            all_color_aug = torch.cat([inputs[("color_aug", i, 0)] for i in opt.frame_ids], 1)
+    return [np.concatenate(poses) for poses in pred_poses]
 
-            features = [pose_encoder(all_color_aug)]
-            axisangle, translation = pose_decoder(features)
 
-            pred_poses.append(
-                transformation_from_parameters(axisangle[:, 0], translation[:, 0]).cpu().numpy())
+def evaluate(opt):
+    """Evaluate odometry on the KITTI dataset
+    """
+    assert os.path.isdir(opt.load_weights_folder), \
+        "Cannot find a folder at {}".format(opt.load_weights_folder)
 
-    pred_poses = np.concatenate(pred_poses)
+    assert opt.eval_split in ["odom", "odom_9", "odom_10"], \
+        "eval_split should be either odom, odom_9 or odom_10"
+
+    # imported here so that --help does not load torch and the networks
+    import torch
+
+    sequence_ids = [9, 10] if opt.eval_split == "odom" else [int(opt.eval_split.split("_")[1])]
+    device = torch.device("cpu" if opt.no_cuda or not torch.cuda.is_available() else "cuda")
+
+    loaders = [sequence_loader(opt, sequence_id) for sequence_id in sequence_ids]
+    pose_encoder, pose_decoder = load_pose_networks(opt, device)
+
+    print("-> Computing pose predictions")
 
-    gt_poses_path = os.path.join(opt.data_path, "poses", "{:02d}.txt".format(sequence_id))
-    gt_global_poses = np.loadtxt(gt_poses_path).reshape(-1, 3, 4)
-    gt_global_poses = np.concatenate(
-        (gt_global_poses, np.zeros((gt_global_poses.shape[0], 1, 4))), 1)
-    gt_global_poses[:, 3, 3] = 1
-    gt_xyzs = gt_global_poses[:, :3, 3]
+    all_pred_poses = predict_poses(loaders, pose_encoder, pose_decoder, device)
 
-    gt_local_poses = []
-    for i in range(1, len(gt_global_poses)):
-        gt_local_poses.append(
-            np.linalg.inv(np.dot(np.linalg.inv(gt_global_poses[i - 1]), gt_global_poses[i])))
+    for sequence_id, pred_poses in zip(sequence_ids, all_pred_poses):
+        gt_poses_path = os.path.join(opt.data_path, "poses", "{:02d}.txt".format(sequence_id))
+        gt_global_poses = np.loadtxt(gt_poses_path).reshape(-1, 3, 4)
+        gt_global_poses = np.concatenate(
+            (gt_global_poses, np.zeros((gt_global_poses.shape[0], 1, 4))), 1)
+        gt_global_poses[:, 3, 3] = 1
 
-    ates = []
-    num_frames = gt_xyzs.shape[0]
-    track_length = 5
-    for i in range(0, num_frames - 1):
-        local_xyzs = np.array(dump_xyz(pred_poses[i:i + track_length - 1]))
-        gt_local_xyzs = np.array(dump_xyz(gt_local_poses[i:i + track_length - 1]))
+        gt_local_poses = np.linalg.inv(
+            np.matmul(np.linalg.inv(gt_global_poses[:-1]), gt_global_poses[1:]))
 
-        ates.append(compute_ate(gt_local_xyzs, local_xyzs))
+        track_length = 5
+        local_xyzs, mask = dump_xyz_windows(pred_poses, track_length)
+        gt_local_xyzs, _ = dump_xyz_windows(gt_local_poses, track_length)
+        ates = compute_ates(gt_local_xyzs, local_xyzs, mask)
 
-    print("\n   Trajectory error: {:0.3f}, std: {:0.3f}\n".format(np.mean(ates), np.std(ates)))
+        print("\n   Sequence {:02d} trajectory error: {:0.3f}, std: {:0.3f}\n".format(
+            sequence_id, np.mean(ates), np.std(ates)))
 
-    save_path = os.path.join(opt.load_weights_folder, "poses.npy")
-    np.save(save_path, pred_poses)
-    print("-> Predictions saved to", save_path)
+        if len(sequence_ids) == 1:
+            save_path = os.path.join(opt.load_weights_folder, "poses.npy")
+        else:
+            save_path = os.path.join(opt.load_weights_folder, "poses_{:02d}.npy".format(sequence_id))
+        np.save(save_path, pred_poses)
+        print("-> Predictions saved to", save_path)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,121 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+
+import argparse
+import numpy as np
+import torch
+import torch.utils.data as data
+from torch.utils.data import DataLoader
+
+import datasets
+import networks
+from utils import readlines
+from weight_registry import load_state_dict
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Precomputes the disparities of the helper student feeding the teacher, '
+                    'loaded by trainer_teacher.py with --helper_disp_path')
+    parser.add_argument('--data_path', type=str, required=True,
+                        help='path to the training data')
+    parser.add_argument('--split', type=str, default='eigen_zhou',
+                        help='split whose train and val images are exported')
+    parser.add_argument('--dataset', type=str, default='kitti', choices=['kitti', 'kitti_odom'])
+    parser.add_argument('--load_weights_folder', type=str, required=True,
+                        help='folder with the encoder.pth and depth.pth of the helper student, '
+                             'as in --student_model_input_of_disp_for_t')
+    parser.add_argument('--helper_disp_path', type=str,
+                        help='where the disparities are written, defaults to '
+                             '<data_path>/helper_disps')
+    parser.add_argument('--height', type=int, default=192)
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--frame_ids', nargs='+', type=int, default=[0, -1, 1])
+    parser.add_argument('--png', action='store_true')
+    parser.add_argument('--batch_size', type=int, default=12)
+    parser.add_argument('--num_workers', type=int, default=4)
+    parser.add_argument('--overwrite', action='store_true',
+                        help='if set, exports images whose disparities already exist again')
+    parser.add_argument('--no_cuda', action='store_true')
+    return parser.parse_args()
+
+
+class HelperImages(data.Dataset):
+    """The images of a dataset resized to the training resolution, with their flipped copy
+    """
+    def __init__(self, dataset, images):
+        super(HelperImages, self).__init__()
+        self.dataset = dataset
+        self.images = images
+
+    def __len__(self):
+        return len(self.images)
+
+    def __getitem__(self, index):
+        folder, frame_index, side = self.images[index]
+        colors = [self.dataset.to_tensor(self.dataset.resize[0](
+            self.dataset.get_color(folder, frame_index, side, do_flip)))
+            for do_flip in [False, True]]
+        return index, torch.stack(colors)
+
+
+def export_helper_disps():
+    opt = parse_args()
+    if opt.helper_disp_path is None:
+        opt.helper_disp_path = os.path.join(opt.data_path, "helper_disps")
+    device = torch.device("cpu" if opt.no_cuda or not torch.cuda.is_available() else "cuda")
+
+    dataset_class = {"kitti": datasets.KITTIRAWDataset, "kitti_odom": datasets.KITTIOdomDataset}
+    fpath = os.path.join(os.path.dirname(__file__), "splits", opt.split, "{}_files.txt")
+    lines = readlines(fpath.format("train")) + readlines(fpath.format("val"))
+    dataset = dataset_class[opt.dataset](
+        opt.data_path, lines, opt.height, opt.width, [0], 4, is_train=False,
+        img_ext='.png' if opt.png else '.jpg', helper_disp_path=opt.helper_disp_path)
+
+    # every image used as one of --frame_ids by a training or validation sample
+    images = set()
+    for index in range(len(lines)):
+        folder, frame_index, side = dataset.index_to_folder_and_frame_idx(index)
+        for i in opt.frame_ids:
+            images.add((folder, frame_index + i, side))
+    images = sorted(image for image in images
+                    if os.path.isfile(dataset.get_image_path(*image)) and
+                    (opt.overwrite or not os.path.isfile(dataset.get_helper_disp_path(*image))))
+    print("-> Exporting helper disparities of {} images to {}".format(
+        len(images), opt.helper_disp_path))
+
+    encoder = networks.test_hr_encoder.hrnet18(False)
+    encoder.num_ch_enc = [64, 18, 36, 72, 144]
+    decoder = networks.HRDepthDecoder(encoder.num_ch_enc, range(4))
+    for model, name in [(encoder, "encoder.pth"), (decoder, "depth.pth")]:
+        pretrained_dict = load_state_dict(os.path.join(opt.load_weights_folder, name))
+        model_dict = model.state_dict()
+        model.load_state_dict({k: v for k, v in pretrained_dict.items() if k in model_dict})
+        model.to(device).eval()
+
+    loader = DataLoader(HelperImages(dataset, images), opt.batch_size, shuffle=False,
+                        num_workers=opt.num_workers, pin_memory=True)
+    with torch.no_grad():
+        for batch_idx, (indices, colors) in enumerate(loader):
+            # Bx2x3xHxW, the image and its flipped copy
+            colors = colors.to(device).flatten(0, 1)
+            outputs = decoder(encoder(colors))
+            disps = {"disp_{}".format(s): outputs[("disp", s)].half().cpu().numpy()
+                     for s in range(4)}
+
+            for i, index in enumerate(indices.tolist()):
+                path = dataset.get_helper_disp_path(*images[index])
+                if not os.path.exists(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path))
+                # 2xHxW per scale
+                np.savez(path, **{k: v[2 * i:2 * i + 2, 0] for k, v in disps.items()})
+
+            if batch_idx % 100 == 0:
+                print("   {} / {}".format(min((batch_idx + 1) * opt.batch_size, len(images)),
+                                          len(images)))
+    print("-> Done")
+
+
+if __name__ == "__main__":
+    export_helper_disps()
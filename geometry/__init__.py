@@ -0,0 +1,17 @@
+from .layout import is_channels_last, ReflectionPad2d, grid_sample
+from .transforms import disp_to_depth, depth_to_disp, transformation_from_parameters, \
+    make_transformation, invert_transformation, get_translation_matrix, rodrigues, \
+    rot_from_axisangle
+from .projection import pixel_grid, BackprojectDepth, Project3D, Backproject, Project
+from .photometric import SSIM, gradient, smoothness_weights, fused_smooth_loss, get_smooth_loss, \
+    SmoothLoss, get_first_order_smooth_loss, RunningMin, compute_depth_errors, \
+    compute_masked_depth_errors
+
+__all__ = ['is_channels_last', 'ReflectionPad2d', 'grid_sample',
+           'disp_to_depth', 'depth_to_disp', 'transformation_from_parameters',
+           'make_transformation', 'invert_transformation', 'get_translation_matrix',
+           'rodrigues', 'rot_from_axisangle',
+           'pixel_grid', 'BackprojectDepth', 'Project3D', 'Backproject', 'Project',
+           'SSIM', 'gradient', 'smoothness_weights', 'fused_smooth_loss', 'get_smooth_loss',
+           'SmoothLoss', 'get_first_order_smooth_loss', 'RunningMin',
+           'compute_depth_errors', 'compute_masked_depth_errors']
@@ -0,0 +1,52 @@
+from __future__ import absolute_import, division, print_function
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+def is_channels_last(x):
+    """True if a 4D tensor is stored in channels_last (NHWC) but not also in NCHW order
+    """
+    return x.dim() == 4 and not x.is_contiguous() and \
+        x.is_contiguous(memory_format=torch.channels_last)
+
+
+class ReflectionPad2d(nn.ReflectionPad2d):
+    """nn.ReflectionPad2d that keeps channels_last inputs in channels_last
+
+    The reflection pad kernels always allocate an NCHW output, which would force the
+    following conv to convert the layout back. For channels_last inputs the padded
+    tensor is assembled in place instead.
+    """
+    def forward(self, x):
+        if not is_channels_last(x):
+            return super(ReflectionPad2d, self).forward(x)
+
+        left, right, top, bottom = self.padding
+        n, c, h, w = x.shape
+        out = x.new_empty((n, c, h + top + bottom, w + left + right),
+                          memory_format=torch.channels_last)
+        out[:, :, top:top + h, left:left + w] = x
+        if top > 0:
+            out[:, :, :top, left:left + w] = x[:, :, 1:top + 1].flip(2)
+        if bottom > 0:
+            out[:, :, top + h:, left:left + w] = x[:, :, h - bottom - 1:h - 1].flip(2)
+        # the columns are reflected from the row padded output to fill the corners
+        if left > 0:
+            out[:, :, :, :left] = out[:, :, :, left + 1:2 * left + 1].flip(3)
+        if right > 0:
+            out[:, :, :, left + w:] = out[:, :, :, left + w - right - 1:left + w - 1].flip(3)
+        return out
+
+
+def grid_sample(input, grid, padding_mode="border"):
+    """F.grid_sample returning its output in the memory format of `input`
+
+    grid_sample always writes an NCHW output, which would switch every following op
+    of a channels_last pipeline back to NCHW.
+    """
+    out = F.grid_sample(input, grid, padding_mode=padding_mode)
+    if is_channels_last(input):
+        out = out.contiguous(memory_format=torch.channels_last)
+    return out
@@ -0,0 +1,219 @@
+from __future__ import absolute_import, division, print_function
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from .layout import ReflectionPad2d
+
+
+class SSIM(nn.Module):
+    """Layer to compute the SSIM loss between a pair of images
+
+    The five local statistics are pooled with a single average pool over their
+    channel-wise concatenation instead of five separate pools.
+    """
+    def __init__(self):
+        super(SSIM, self).__init__()
+        self.pool = nn.AvgPool2d(3, 1)
+
+        self.refl = ReflectionPad2d(1)
+
+        self.C1 = 0.01 ** 2
+        self.C2 = 0.03 ** 2
+
+    def forward(self, x, y):
+        c = x.shape[1]
+        x, y = torch.split(self.refl(torch.cat([x, y], 1)), c, 1)
+
+        stats = self.pool(torch.cat([x, y, x * x, y * y, x * y], 1))
+        mu_x, mu_y, mu_xx, mu_yy, mu_xy = torch.split(stats, c, 1)
+        sigma_x  = mu_xx - mu_x ** 2
+        sigma_y  = mu_yy - mu_y ** 2
+        sigma_xy = mu_xy - mu_x * mu_y
+
+        SSIM_n = (2 * mu_x * mu_y + self.C1) * (2 * sigma_xy + self.C2)
+        SSIM_d = (mu_x ** 2 + mu_y ** 2 + self.C1) * (sigma_x + sigma_y + self.C2)
+
+        return torch.clamp((1 - SSIM_n / SSIM_d) / 2, 0, 1)
+
+
+def gradient(D):
+    """Forward differences of a BxCxHxW tensor along x and y
+    """
+    D_dy = D[:, :, 1:] - D[:, :, :-1]
+    D_dx = D[:, :, :, 1:] - D[:, :, :, :-1]
+    return D_dx, D_dy
+
+
+def smoothness_weights(img, height, width, a1=0.5, a2=0.5):
+    """Edge-aware weights of the smoothness terms for a disparity of height x width
+
+    Returns the weights of the dx, dy, dxy and dxx / dyy terms with the 1 / numel of
+    each mean folded in. The mixed differences dxy and dyx of the second order are the
+    same finite difference, so their two identical terms are merged into one with
+    twice the weight.
+    """
+    if img.shape[2:] != (height, width):
+        img = F.interpolate(img, (height, width), mode='area')
+
+    img_dx, img_dy = gradient(img)
+    img_dxx, img_dxy = gradient(img_dx)
+    _, img_dyy = gradient(img_dy)
+
+    weights = []
+    for grad, a, factor in [(img_dx, a1, 1.), (img_dy, a1, 1.), (img_dxy, a2, 2.),
+                            (img_dxx, a2, 1.), (img_dyy, a2, 1.)]:
+        w = torch.exp(-a * grad.abs().mean(1, True))
+        weights.append(w * (factor / w.numel()))
+    return weights
+
+
+def fused_smooth_loss(disp, weights):
+    """First and second order edge-aware smoothness of a disparity with precomputed
+    smoothness_weights
+    """
+    w_dx, w_dy, w_dxy, w_dxx, w_dyy = weights
+    disp_dx, disp_dy = gradient(disp)
+    disp_dxx, disp_dxy = gradient(disp_dx)
+    disp_dyy = disp_dy[:, :, 1:] - disp_dy[:, :, :-1]
+
+    return (disp_dx.abs() * w_dx).sum() + (disp_dy.abs() * w_dy).sum() + \
+        (disp_dxy.abs() * w_dxy).sum() + (disp_dxx.abs() * w_dxx).sum() + \
+        (disp_dyy.abs() * w_dyy).sum()
+
+
+def get_smooth_loss(disp, img):
+    """Computes the first and second order edge-aware smoothness loss for a disparity image
+    The color image is resized to the disparity and used for the edge-aware weights
+    """
+    return fused_smooth_loss(disp, smoothness_weights(img, disp.shape[2], disp.shape[3]))
+
+
+class SmoothLoss(nn.Module):
+    """get_smooth_loss caching the edge-aware weights of each image and resolution
+
+    The weights only depend on the color image, so they are computed once per batch and
+    scale and shared by every disparity regularised against that image (student and
+    teacher). Call clear() when a new batch starts.
+    """
+    def __init__(self):
+        super(SmoothLoss, self).__init__()
+        self.cache = {}
+
+    def clear(self):
+        self.cache = {}
+
+    def weights(self, img, height, width):
+        if img.requires_grad:
+            return smoothness_weights(img, height, width)
+
+        key = (id(img), height, width)
+        entry = self.cache.get(key)
+        # the image is kept alive by the cache, so its id can not be reused while cached
+        if entry is None or entry[0] is not img:
+            with torch.no_grad():
+                entry = (img, smoothness_weights(img, height, width))
+            self.cache[key] = entry
+        return entry[1]
+
+    def forward(self, disp, img):
+        return fused_smooth_loss(disp, self.weights(img, disp.shape[2], disp.shape[3]))
+
+
+def get_first_order_smooth_loss(disp, img):
+    """Computes the first order smoothness loss for a disparity image (monodepth2)
+    The color image is used for edge-aware smoothness
+    """
+    grad_disp_x = torch.abs(disp[:, :, :, :-1] - disp[:, :, :, 1:])
+    grad_disp_y = torch.abs(disp[:, :, :-1, :] - disp[:, :, 1:, :])
+
+    grad_img_x = torch.mean(torch.abs(img[:, :, :, :-1] - img[:, :, :, 1:]), 1, keepdim=True)
+    grad_img_y = torch.mean(torch.abs(img[:, :, :-1, :] - img[:, :, 1:, :]), 1, keepdim=True)
+
+    grad_disp_x *= torch.exp(-grad_img_x)
+    grad_disp_y *= torch.exp(-grad_img_y)
+
+    return grad_disp_x.mean() + grad_disp_y.mean()
+
+
+class RunningMin(object):
+    """Per-pixel running minimum of loss maps added one at a time, optionally with the
+    index of the map each minimum came from
+
+    Gives the same values, gradients and indices as torch.min(torch.cat(losses, 1), 1, True)
+    without materialising the stacked tensor, ties go to the first map added.
+    """
+    def __init__(self, track_argmin=False):
+        self.track_argmin = track_argmin
+        self.min = None
+        self.argmin = None
+        self.count = 0
+
+    def add(self, loss):
+        if self.min is None:
+            self.min = loss
+            if self.track_argmin:
+                self.argmin = torch.zeros(loss.shape, dtype=torch.long, device=loss.device)
+        else:
+            smaller = loss < self.min
+            self.min = torch.where(smaller, loss, self.min)
+            if self.track_argmin:
+                self.argmin.masked_fill_(smaller, self.count)
+        self.count += 1
+        return self
+
+
+def compute_depth_errors(gt, pred):
+    """Computation of error metrics between predicted and ground truth depths
+    """
+    thresh = torch.max((gt / pred), (pred / gt))
+    a1 = (thresh < 1.25     ).float().mean()
+    a2 = (thresh < 1.25 ** 2).float().mean()
+    a3 = (thresh < 1.25 ** 3).float().mean()
+
+    rmse = (gt - pred) ** 2
+    rmse = torch.sqrt(rmse.mean())
+
+    rmse_log = (torch.log(gt) - torch.log(pred)) ** 2
+    rmse_log = torch.sqrt(rmse_log.mean())
+
+    abs_rel = torch.mean(torch.abs(gt - pred) / gt)
+
+    sq_rel = torch.mean((gt - pred) ** 2 / gt)
+
+    return abs_rel, sq_rel, rmse, rmse_log, a1, a2, a3
+
+
+def compute_masked_depth_errors(gt, pred, mask):
+    """compute_depth_errors over the pixels selected by mask, after median scaling of the
+    prediction and clamping it to [1e-3, 80]
+
+    Uses masked reductions instead of boolean indexing, so that the host never has to wait
+    for the device to know the number of valid pixels.
+    """
+    nan = float("nan")
+    ratio = gt.masked_fill(~mask, nan).nanmedian() / pred.masked_fill(~mask, nan).nanmedian()
+    pred = torch.clamp(pred * ratio, min=1e-3, max=80)
+
+    # pixels outside the mask are set to 1 to keep every term finite, then weighted out
+    gt = torch.where(mask, gt, torch.ones_like(gt))
+    pred = torch.where(mask, pred, torch.ones_like(pred))
+    weight = mask.float()
+    count = weight.sum()
+
+    def mean(x):
+        return (x * weight).sum() / count
+
+    thresh = torch.max((gt / pred), (pred / gt))
+    a1 = mean((thresh < 1.25     ).float())
+    a2 = mean((thresh < 1.25 ** 2).float())
+    a3 = mean((thresh < 1.25 ** 3).float())
+
+    rmse = torch.sqrt(mean((gt - pred) ** 2))
+    rmse_log = torch.sqrt(mean((torch.log(gt) - torch.log(pred)) ** 2))
+
+    abs_rel = mean(torch.abs(gt - pred) / gt)
+    sq_rel = mean((gt - pred) ** 2 / gt)
+
+    return abs_rel, sq_rel, rmse, rmse_log, a1, a2, a3
@@ -0,0 +1,98 @@
+from __future__ import absolute_import, division, print_function
+
+import torch
+import torch.nn as nn
+
+
+_pixel_grids = {}
+
+
+def pixel_grid(height, width, dtype=torch.float32, device="cpu"):
+    """Homogeneous pixel coordinates (x, y, 1) of a height x width image normalized to the
+    [-1, 1] range of grid_sample, as a 1x3x(H*W) tensor
+
+    Returned with the 1x4x4 matrix N mapping pixel to normalized coordinates and its
+    inverse, all cached per (height, width, dtype, device).
+    """
+    key = (height, width, dtype, torch.device(device))
+    entry = _pixel_grids.get(key)
+    if entry is None:
+        xs = torch.linspace(-1, 1, width, dtype=dtype, device=device)
+        ys = torch.linspace(-1, 1, height, dtype=dtype, device=device)
+        grid = torch.stack([xs.view(1, -1).expand(height, width).reshape(-1),
+                            ys.view(-1, 1).expand(height, width).reshape(-1),
+                            torch.ones(height * width, dtype=dtype, device=device)], 0)
+
+        sx = 2. / (width - 1)
+        sy = 2. / (height - 1)
+        norm = torch.tensor([[sx, 0, -1, 0],
+                             [0, sy, -1, 0],
+                             [0, 0, 1, 0],
+                             [0, 0, 0, 1]], dtype=dtype, device=device)
+        inv_norm = torch.tensor([[1 / sx, 0, 1 / sx, 0],
+                                 [0, 1 / sy, 1 / sy, 0],
+                                 [0, 0, 1, 0],
+                                 [0, 0, 0, 1]], dtype=dtype, device=device)
+        entry = (grid.unsqueeze(0), norm.unsqueeze(0), inv_norm.unsqueeze(0))
+        _pixel_grids[key] = entry
+    return entry
+
+
+class BackprojectDepth(nn.Module):
+    """Layer to transform a depth image into a point cloud
+
+    Returns Bx4xHxW homogeneous camera points. The batch size and resolution are taken
+    from the depth, the constructor arguments are only kept for compatibility.
+    """
+    def __init__(self, batch_size=None, height=None, width=None):
+        super(BackprojectDepth, self).__init__()
+
+        self.height = height
+        self.width = width
+
+    def forward(self, depth, inv_K):
+        batch_size, _, height, width = depth.shape
+        pix_coords, _, inv_norm = pixel_grid(height, width, depth.dtype, depth.device)
+
+        # inv_K is applied to the normalized grid by undoing the normalization first
+        cam_points = torch.matmul(torch.matmul(inv_K[:, :3, :3], inv_norm[:, :3, :3]), pix_coords)
+        cam_points = depth.reshape(batch_size, 1, -1) * cam_points
+        ones = pix_coords[:, 2:].expand(batch_size, 1, -1)
+        cam_points = torch.cat([cam_points, ones], 1)
+
+        return cam_points.view(batch_size, 4, height, width)
+
+
+class Project3D(nn.Module):
+    """Layer which projects 3D points into a camera with intrinsics K and at position T
+
+    The normalization to the [-1, 1] range of grid_sample is folded into the projection
+    matrix, so the points are projected straight to sampling coordinates. The resolution
+    is taken from Bx4xHxW points, height and width are only needed for Bx4x(H*W) points.
+    """
+    def __init__(self, batch_size=None, height=None, width=None, eps=1e-7):
+        super(Project3D, self).__init__()
+
+        self.height = height
+        self.width = width
+        self.eps = eps
+
+    def forward(self, points, K, T):
+        batch_size = points.shape[0]
+        if points.dim() == 4:
+            height, width = points.shape[2:]
+        else:
+            height, width = self.height, self.width
+        _, norm, _ = pixel_grid(height, width, points.dtype, points.device)
+
+        P = torch.matmul(torch.matmul(norm, K), T)[:, :3, :]
+        cam_points = torch.matmul(P, points.reshape(batch_size, 4, -1))
+
+        pix_coords = cam_points[:, :2, :] / (cam_points[:, 2:3, :] + self.eps)
+        pix_coords = pix_coords.view(batch_size, 2, height, width)
+        return pix_coords.permute(0, 2, 3, 1)
+
+
+# the half resolution feature warping used to keep its own copies of these layers
+Backproject = BackprojectDepth
+Project = Project3D
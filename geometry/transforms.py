@@ -0,0 +1,100 @@
+from __future__ import absolute_import, division, print_function
+
+import torch
+
+
+def disp_to_depth(disp, min_depth, max_depth):
+    """Convert network's sigmoid output into depth prediction
+    The formula for this conversion is given in the 'additional considerations'
+    section of the paper.
+    """
+    min_disp = 1 / max_depth
+    max_disp = 1 / min_depth
+    scaled_disp = min_disp + (max_disp - min_disp) * disp
+    depth = 1 / scaled_disp
+    return scaled_disp, depth
+
+
+def depth_to_disp(depth, min_depth, max_depth):
+    """Inverse of disp_to_depth, convert a depth into the network's sigmoid output
+    """
+    min_disp = 1 / max_depth
+    max_disp = 1 / min_depth
+    disp = 1 / depth - min_disp
+    return disp / (max_disp - min_disp)
+
+
+def transformation_from_parameters(axisangle, translation, invert=False):
+    """Convert the  pose_decoder network's (axisangle, translation) output into a 4x4 matrix
+
+    The inverse is built in closed form as [R^T | -R^T t] instead of with a matmul of
+    two 4x4 matrices.
+    """
+    R = rodrigues(axisangle)
+    t = translation.reshape(-1, 3, 1)
+    # translation[12 x 1 x 3]
+    # axisnagle[12 x 1 x 3]
+    # R [12 X 3 x 3]
+    # t [12 x 3 x 1]
+
+    if invert:
+        R = R.transpose(1, 2)
+        t = -torch.matmul(R, t)
+
+    #M [12 X 4 X 4]
+    return make_transformation(R, t)
+
+
+def make_transformation(R, t):
+    """Assemble Bx4x4 homogeneous transformations from Bx3x3 rotations and Bx3x1 translations
+    """
+    bottom = R.new_tensor([0, 0, 0, 1]).expand(R.shape[0], 1, 4)
+    return torch.cat([torch.cat([R, t], 2), bottom], 1)
+
+
+def invert_transformation(M):
+    """Closed form inverse of a batch of Bx4x4 rigid transformations
+    """
+    R = M[:, :3, :3].transpose(1, 2)
+    t = -torch.matmul(R, M[:, :3, 3:])
+    return make_transformation(R, t)
+
+
+def get_translation_matrix(translation_vector):
+    """Convert a translation vector into a 4x4 transformation matrix
+    """
+    t = translation_vector.reshape(-1, 3, 1)
+    R = torch.eye(3, dtype=t.dtype, device=t.device).expand(t.shape[0], 3, 3)
+    return make_transformation(R, t)
+
+
+def rodrigues(vec):
+    """Convert a Bx1x3 axisangle rotation into a Bx3x3 rotation matrix with Rodrigues'
+    formula R = cos(a) I + sin(a) [k]x + (1 - cos(a)) k k^T
+    """
+    angle = torch.norm(vec, 2, 2, True)
+    axis = (vec / (angle + 1e-7)).transpose(1, 2)
+    # angle [12 x 1 x 1]
+    # axis [12 x 3 x 1]
+    ca = torch.cos(angle)
+    sa = torch.sin(angle)
+    x = axis[:, 0]
+    y = axis[:, 1]
+    z = axis[:, 2]
+    zero = torch.zeros_like(x)
+    #x,y,z [12 x 1]
+
+    skew = torch.stack([zero, -z, y,
+                        z, zero, -x,
+                        -y, x, zero], 1).view(-1, 3, 3)
+    eye = torch.eye(3, dtype=vec.dtype, device=vec.device)
+
+    return ca * eye + sa * skew + (1 - ca) * torch.matmul(axis, axis.transpose(1, 2))
+
+
+def rot_from_axisangle(vec):
+    """Convert an axisangle rotation into a 4x4 transformation matrix
+    Input 'vec' has to be Bx1x3
+    """
+    R = rodrigues(vec)
+    return make_transformation(R, R.new_zeros(R.shape[0], 3, 1))
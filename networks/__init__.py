@@ -1,6 +1,8 @@
 from .test_hr_encoder import *
 from .HR_Depth_Decoder import HRDepthDecoder
-from .resnet_encoder import ResnetEncoder
-from .pose_decoder import PoseDecoder_for_t, PoseDecoder_for_r, PoseDecoder
+from .resnet_encoder import ResnetEncoder, ResnetFeatureExtractor
+from .pose_decoder import PoseDecoder_for_t, PoseDecoder_for_r, PoseDecoder, MultiHeadPoseDecoder
 from .auto_decoder import AutoDecoder
 from .teacher_decoder import TeacherDecoder
+from .frozen_module import FrozenModule
+from .disp_upsampler import DispUpsampler
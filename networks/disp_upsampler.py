@@ -0,0 +1,30 @@
+from __future__ import absolute_import, division, print_function
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from .layers import ConvBlock, Conv3x3
+
+
+class DispUpsampler(nn.Module):
+    """Learned upsampling of a sigmoid disparity, guided by the image at the output resolution
+
+    The disparity is upsampled bilinearly and a small network predicts a residual on its
+    logit from the image and the upsampled disparity. The last layer starts at zero, so the
+    untrained upsampler is bilinear upsampling.
+    """
+    def __init__(self, num_ch=16, eps=1e-4):
+        super(DispUpsampler, self).__init__()
+
+        self.eps = eps
+        self.conv1 = ConvBlock(4, num_ch)
+        self.conv2 = ConvBlock(num_ch, num_ch)
+        self.residual = Conv3x3(num_ch, 1)
+        nn.init.zeros_(self.residual.conv.weight)
+        nn.init.zeros_(self.residual.conv.bias)
+
+    def forward(self, disp, image):
+        disp = F.interpolate(disp, image.shape[2:], mode="bilinear", align_corners=False)
+        disp = torch.clamp(disp, self.eps, 1 - self.eps)
+        x = self.conv2(self.conv1(torch.cat([image, disp], 1)))
+        return torch.sigmoid(torch.log(disp / (1 - disp)) + self.residual(x))
@@ -0,0 +1,94 @@
+from __future__ import absolute_import, division, print_function
+
+from concurrent.futures import Future, ThreadPoolExecutor
+import torch
+import torch.nn as nn
+
+
+def map_tensors(fn, obj):
+    """Apply fn to the tensors of nested dicts, lists and tuples
+    """
+    if torch.is_tensor(obj):
+        return fn(obj)
+    if isinstance(obj, dict):
+        return type(obj)((k, map_tensors(fn, v)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(map_tensors(fn, v) for v in obj)
+    return obj
+
+
+class FrozenModule(nn.Module):
+    """Runs a frozen network in eval mode, optionally in another dtype or on another device
+
+    The wrapped module stays in eval mode whatever train() is called with, and its parameters
+    do not require gradients. Inputs are moved and cast to `device` and `dtype`, outputs are
+    moved back to the device and floating point dtype of the first input. Unless
+    `differentiable` is set, the module runs under torch.inference_mode; set it when the
+    gradients of a loss have to flow back to the inputs.
+
+    submit() returns a Future. When the module lives on another device than the inputs it
+    runs in a background thread, overlapping with the work queued meanwhile on the training
+    device.
+    """
+    def __init__(self, module, device, dtype=None, differentiable=False):
+        super(FrozenModule, self).__init__()
+
+        for param in module.parameters():
+            param.requires_grad = False
+        self.module = module.to(device=device, dtype=dtype)
+        self.module.eval()
+
+        self.device = torch.device(device)
+        if self.device.type == "cuda" and self.device.index is None:
+            # compared with the device of the inputs in submit()
+            self.device = torch.device("cuda", torch.cuda.current_device())
+        self.dtype = dtype
+        self.differentiable = differentiable
+        self.executor = None
+
+    def train(self, mode=True):
+        super(FrozenModule, self).train(mode)
+        self.module.eval()
+        return self
+
+    def to_module(self, x):
+        dtype = self.dtype if self.dtype is not None and x.is_floating_point() else x.dtype
+        return x.to(self.device, dtype, non_blocking=self.device.type == "cuda")
+
+    @staticmethod
+    def from_module(x, device, dtype):
+        x = x.to(device, dtype if x.is_floating_point() else x.dtype,
+                 non_blocking=device.type == "cuda")
+        # inference tensors cannot be saved for the backward pass of the losses using them
+        return x.clone() if x.is_inference() else x
+
+    def forward(self, *inputs):
+        first = next(x for x in inputs if torch.is_tensor(x))
+        device, dtype = first.device, first.dtype
+
+        inputs = map_tensors(self.to_module, inputs)
+        if self.differentiable:
+            outputs = self.module(*inputs)
+        else:
+            with torch.inference_mode():
+                outputs = self.module(*inputs)
+        return map_tensors(lambda x: self.from_module(x, device, dtype), outputs)
+
+    def run_in_thread(self, *inputs):
+        if self.device.type == "cuda":
+            with torch.cuda.device(self.device):
+                return self(*inputs)
+        return self(*inputs)
+
+    def submit(self, *inputs):
+        """Start running the module, the outputs are read with .result()
+        """
+        first = next(x for x in inputs if torch.is_tensor(x))
+        if first.device == self.device:
+            future = Future()
+            future.set_result(self(*inputs))
+            return future
+
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        return self.executor.submit(self.run_in_thread, *inputs)
@@ -40,7 +40,7 @@ class PoseDecoder(nn.Module):
 
         out = out.mean(3).mean(2)
         #out.size = 12*12
-        out = 0.01 * out.view(-1, self.num_frames_to_predict_for, 1, 6)
+        out = 0.01 * out.reshape(-1, self.num_frames_to_predict_for, 1, 6)
         #out.size = 12 * 2 * 1 * 6
         axisangle = out[..., :3]
         translation = out[..., 3:]
@@ -78,7 +78,7 @@ class PoseDecoder_for_t(nn.Module):
                 out = self.relu(out)
 
         out = out.mean(3).mean(2)
-        out = 0.01 * out.view(-1, self.num_frames_to_predict_for, 1, 3)
+        out = 0.01 * out.reshape(-1, self.num_frames_to_predict_for, 1, 3)
         translation = out
         return translation
 
@@ -113,6 +113,97 @@ class PoseDecoder_for_r(nn.Module):
                 out = self.relu(out)
 
         out = out.mean(3).mean(2)
-        out = 0.01 * out.view(-1, self.num_frames_to_predict_for, 1, 3)
+        out = 0.01 * out.reshape(-1, self.num_frames_to_predict_for, 1, 3)
         axisangle = out
         return axisangle
+
+
+class MultiHeadPoseDecoder(nn.Module):
+    """Pose decoder computing the outputs of PoseDecoder, PoseDecoder_for_t and
+    PoseDecoder_for_r from a single shared squeeze conv
+
+    With share_trunk the two 3x3 pose convs are shared as well and only the final 1x1
+    convs (6, 3 and 3 outputs per frame) are separate heads. The forward pass returns
+    a dict keyed by head name holding what the corresponding separate decoder returns.
+    """
+    head_dims = OrderedDict([("pose", 6), ("pose_for_t", 3), ("pose_for_r", 3)])
+
+    def __init__(self, num_ch_enc, num_input_features, num_frames_to_predict_for=None, stride=1,
+                 heads=("pose", "pose_for_t", "pose_for_r"), share_trunk=True):
+        super(MultiHeadPoseDecoder, self).__init__()
+
+        for head in heads:
+            if head not in self.head_dims:
+                raise ValueError("{} is not a valid pose head".format(head))
+
+        self.num_ch_enc = num_ch_enc
+        self.num_input_features = num_input_features
+
+        if num_frames_to_predict_for is None:
+            num_frames_to_predict_for = num_input_features - 1
+        self.num_frames_to_predict_for = num_frames_to_predict_for
+        self.heads = list(heads)
+        self.share_trunk = share_trunk
+
+        self.convs = nn.ModuleDict()
+        self.convs["squeeze"] = nn.Conv2d(self.num_ch_enc[-1], 256, 1)
+        for trunk in self.trunks():
+            self.convs["{}_0".format(trunk)] = nn.Conv2d(num_input_features * 256, 256, 3, stride, 1)
+            self.convs["{}_1".format(trunk)] = nn.Conv2d(256, 256, 3, stride, 1)
+        for head in self.heads:
+            self.convs["{}_2".format(head)] = nn.Conv2d(
+                256, self.head_dims[head] * num_frames_to_predict_for, 1)
+
+        self.relu = nn.ReLU()
+
+    def trunks(self):
+        return ["trunk"] if self.share_trunk else self.heads
+
+    def forward(self, input_features):
+        last_features = [f[-1] for f in input_features]
+        cat_features = [self.relu(self.convs["squeeze"](f)) for f in last_features]
+        cat_features = torch.cat(cat_features, 1)
+
+        trunk_features = {}
+        for trunk in self.trunks():
+            out = self.relu(self.convs["{}_0".format(trunk)](cat_features))
+            trunk_features[trunk] = self.relu(self.convs["{}_1".format(trunk)](out))
+
+        outputs = {}
+        for head in self.heads:
+            out = self.convs["{}_2".format(head)](trunk_features["trunk" if self.share_trunk else head])
+            out = out.mean(3).mean(2)
+            out = 0.01 * out.reshape(-1, self.num_frames_to_predict_for, 1, self.head_dims[head])
+            if head == "pose":
+                outputs[head] = (out[..., :3], out[..., 3:])
+            else:
+                outputs[head] = out
+        return outputs
+
+    def load_decoder_state_dicts(self, state_dicts):
+        """Initialise from the state dicts of separate PoseDecoder / PoseDecoder_for_t /
+        PoseDecoder_for_r models, keyed by head name
+
+        Each head and unshared trunk comes from its own decoder. The shared squeeze (and
+        trunk) come from the full PoseDecoder when available, so the translation and
+        rotation heads need fine-tuning after the conversion.
+        """
+        # PoseDecoder* keep squeeze, pose 0, pose 1 and pose 2 as net.0 to net.3
+        def conv(state_dict, index):
+            return {"weight": state_dict["net.{}.weight".format(index)],
+                    "bias": state_dict["net.{}.bias".format(index)]}
+
+        available = [head for head in self.head_dims if head in state_dicts]
+        if len(available) == 0:
+            raise ValueError("no pose decoder state dict to load from")
+        shared_source = state_dicts[available[0]]
+
+        self.convs["squeeze"].load_state_dict(conv(shared_source, 0))
+        for trunk in self.trunks():
+            source = shared_source if trunk == "trunk" else state_dicts.get(trunk)
+            if source is not None:
+                self.convs["{}_0".format(trunk)].load_state_dict(conv(source, 1))
+                self.convs["{}_1".format(trunk)].load_state_dict(conv(source, 2))
+        for head in self.heads:
+            if head in state_dicts:
+                self.convs["{}_2".format(head)].load_state_dict(conv(state_dicts[head], 3))
@@ -4,12 +4,8 @@ import numpy as np
 from .CBAM_resnet import ResNet
 import torch
 import torch.nn as nn
-import torchvision.models as models # a subpackage containing different models 
-import torch.utils.model_zoo as model_zoo#pretrained network
 from hr_layers import *
-import ssl
- 
-ssl._create_default_https_context = ssl._create_unverified_context
+from weight_registry import WeightRegistry
 
 class ResNetMultiImageInput(ResNet):
 #class ResNetMultiImageInput(models.ResNet):
@@ -44,6 +40,8 @@ def resnet_multiimage_input(num_layers, pretrained=True, num_input_images=1):
         pretrained (bool): If True, returns a model pre-trained on ImageNet
         num_input_images (int): Number of frames stacked as input
     """
+    import torchvision.models as models # a subpackage containing different models
+
     assert num_layers in [18, 50], "Can only run with 18 or 50 layer resnet"
     blocks = {18: [2, 2, 2, 2], 50: [3, 4, 6, 3]}[num_layers]
     block_type = {18: models.resnet.BasicBlock, 50: models.resnet.Bottleneck}[num_layers]
@@ -52,7 +50,8 @@ def resnet_multiimage_input(num_layers, pretrained=True, num_input_images=1):
     if pretrained:
         # loaded = torch.load("/home/inspur/MAX_SPACE/yangli/pretrained-model/resnet50-0676ba61.pth")
         # loaded = torch.jit.load("/home/inspur/MAX_SPACE/yangli/pretrained-model/resnet50-0676ba61.pth")
-        loaded = model_zoo.load_url(models.resnet.model_urls['resnet{}'.format(num_layers)])
+        name = 'resnet{}'.format(num_layers)
+        loaded = WeightRegistry().load(name, models.resnet.model_urls[name])
         loaded['conv1.weight'] = torch.cat(
             [loaded['conv1.weight']] * num_input_images, 1) / num_input_images
         model.load_state_dict(loaded)
@@ -64,6 +63,7 @@ class ResnetEncoder(nn.Module):
     """
     def __init__(self, num_layers, pretrained=True, num_input_images=1):
         super(ResnetEncoder, self).__init__()
+        import torchvision.models as models # a subpackage containing different models
 
         self.num_ch_enc = np.array([64, 64, 128, 256, 512])
 
@@ -84,7 +84,11 @@ class ResnetEncoder(nn.Module):
         if num_input_images > 1:
             self.encoder = resnet_multiimage_input(num_layers, pretrained, num_input_images)
         else:
-            self.encoder = resnets[num_layers](pretrained)
+            self.encoder = resnets[num_layers](False)
+            if pretrained:
+                name = 'resnet{}'.format(num_layers)
+                self.encoder.load_state_dict(
+                    WeightRegistry().load(name, models.resnet.model_urls[name]))
 
         if num_layers > 34:
             self.num_ch_enc[1:] *= 4
@@ -113,3 +117,34 @@ class ResnetEncoder(nn.Module):
         features.append(self.encoder.layer4(features[-1]))
         #features[-1] = self.se_block4(features[-1])
         return features# feature has 5 elements
+
+
+class ResnetFeatureExtractor(nn.Module):
+    """ResnetEncoder which only runs up to the deepest of the requested feature levels
+
+    Level 0 is the conv1/bn1/relu output and levels 1-4 the outputs of layer1-layer4, as in
+    ResnetEncoder.forward. The layers after the deepest level, and the classifier, are
+    removed so their weights are freed. Returns the features of `levels` in order.
+    """
+    def __init__(self, resnet_encoder, levels=(0,)):
+        super(ResnetFeatureExtractor, self).__init__()
+
+        self.levels = list(levels)
+        self.depth = max(self.levels)
+        self.num_ch_enc = resnet_encoder.num_ch_enc[self.levels]
+
+        encoder = resnet_encoder.encoder
+        self.conv1 = encoder.conv1
+        self.bn1 = encoder.bn1
+        self.relu = encoder.relu
+        self.maxpool = encoder.maxpool
+        self.layers = nn.ModuleList(
+            [getattr(encoder, "layer{}".format(i)) for i in range(1, self.depth + 1)])
+
+    def forward(self, input_image):
+        x = (input_image - 0.45) / 0.225
+        features = [self.relu(self.bn1(self.conv1(x)))]
+        for i, layer in enumerate(self.layers):
+            x = features[-1] if i > 0 else self.maxpool(features[-1])
+            features.append(layer(x))
+        return [features[i] for i in self.levels]
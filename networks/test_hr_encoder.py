@@ -1,14 +1,12 @@
 import os
+import copy
 import torch
 import logging
 import torch.nn as nn
 import torch.nn.functional as F
-from torchvision.models.utils import load_state_dict_from_url
-#from torch.hub import load_state_dict_from_url
-import matplotlib.pyplot as plt
 logger = logging.getLogger('hrnet_backbone')
 
-__all__ = ['hrnet18', 'hrnet32', 'hrnet48','hrnet64']
+__all__ = ['hrnet18', 'hrnet32', 'hrnet48','hrnet64', 'optimize_for_inference']
 
 
 model_urls = {
@@ -25,6 +23,7 @@ model_urls = {
 # }
 
 def visual_feature(features):
+    import matplotlib.pyplot as plt
     for a in range(len(features)):
         feature_map = features[a].squeeze(0).cpu()
         n,h,w = feature_map.size()
@@ -163,6 +162,8 @@ class HighResolutionModule(nn.Module):
             num_branches, blocks, num_blocks, num_channels)
         self.fuse_layers = self._make_fuse_layers()
         self.relu = nn.ReLU(inplace=True)
+        # set by optimize_for_inference, see _fuse_inplace
+        self.inplace_fuse = False
 
     def _check_branches(self, num_branches, blocks, num_blocks,
                         num_inchannels, num_channels):
@@ -270,6 +271,9 @@ class HighResolutionModule(nn.Module):
         for i in range(self.num_branches):
             x[i] = self.branches[i](x[i])
 
+        if self.inplace_fuse:
+            return [self._fuse_inplace(i, x) for i in range(len(self.fuse_layers))]
+
         x_fuse = []
         for i in range(len(self.fuse_layers)):
             y = x[0] if i == 0 else self.fuse_layers[i][0](x[0])
@@ -291,6 +295,32 @@ class HighResolutionModule(nn.Module):
 
         return x_fuse
 
+    def _fuse_inplace(self, i, x):
+        """Fuse all branches into output branch i, accumulating into a single buffer
+
+        The identity term is added last so that the buffer is always a fresh tensor
+        produced by a fuse layer and x[i] is never written to.
+        """
+        y = None
+        for j in range(self.num_branches):
+            if j == i:
+                continue
+            if j > i:
+                out = F.interpolate(
+                    self.fuse_layers[i][j](x[j]),
+                    size=[x[i].shape[-2], x[i].shape[-1]],
+                    mode='bilinear',
+                    align_corners=True
+                    )
+            else:
+                out = self.fuse_layers[i][j](x[j])
+            if y is None:
+                y = out
+            else:
+                y += out
+        y += x[i]
+        return self.relu(y)
+
 
 blocks_dict = {
     'BASIC': BasicBlock,
@@ -503,8 +533,103 @@ class HighResolutionNet(nn.Module):
         
 
 
+def fuse_conv_bn(conv, bn):
+    """Return a new convolution with the (eval mode) BatchNorm folded into its weights
+    """
+    fused = nn.Conv2d(conv.in_channels, conv.out_channels, conv.kernel_size,
+                      stride=conv.stride, padding=conv.padding, dilation=conv.dilation,
+                      groups=conv.groups, bias=True, padding_mode=conv.padding_mode)
+    fused = fused.to(device=conv.weight.device, dtype=conv.weight.dtype)
+
+    with torch.no_grad():
+        scale = torch.rsqrt(bn.running_var + bn.eps)
+        if bn.weight is not None:
+            scale = scale * bn.weight
+        bias = -bn.running_mean * scale
+        if bn.bias is not None:
+            bias = bias + bn.bias
+        if conv.bias is not None:
+            bias = bias + conv.bias * scale
+
+        fused.weight.copy_(conv.weight * scale.reshape(-1, 1, 1, 1))
+        fused.bias.copy_(bias)
+    return fused
+
+
+def _fold_batchnorms(module):
+    """Recursively fold every conv->BatchNorm pair below `module` into a single conv
+    """
+    for name, child in list(module.named_children()):
+        if isinstance(child, nn.Sequential):
+            layers = []
+            for layer in child:
+                if isinstance(layer, nn.BatchNorm2d) and layers and isinstance(layers[-1], nn.Conv2d):
+                    layers[-1] = fuse_conv_bn(layers[-1], layer)
+                else:
+                    layers.append(layer)
+            child = nn.Sequential(*layers)
+            setattr(module, name, child)
+        _fold_batchnorms(child)
+
+    # blocks and the stem keep their convs and norms as conv<k> / bn<k> attributes
+    for k in range(1, 4):
+        conv = getattr(module, 'conv{}'.format(k), None)
+        bn = getattr(module, 'bn{}'.format(k), None)
+        if isinstance(conv, nn.Conv2d) and isinstance(bn, nn.BatchNorm2d):
+            setattr(module, 'conv{}'.format(k), fuse_conv_bn(conv, bn))
+            setattr(module, 'bn{}'.format(k), nn.Identity())
+
+
+def _flatten_features(features):
+    flat = []
+    for f in features:
+        if isinstance(f, (list, tuple)):
+            flat += _flatten_features(f)
+        else:
+            flat.append(f)
+    return flat
+
+
+def optimize_for_inference(encoder, example_input=None, rtol=1e-3, atol=1e-4):
+    """Return an inference-only copy of an HRNet encoder
+
+    Every conv->BatchNorm pair (blocks, downsample, stem, transition and fuse layers) is
+    folded into a single conv using the running statistics, and the multi-resolution
+    fuse accumulates all upsampled branches into one buffer instead of allocating a new
+    tensor per addition. The bilinear upsampling itself cannot be merged into the add
+    without a custom kernel, so it is left as is.
+
+    If `example_input` is given, the outputs of the original and the optimized encoder
+    are compared on it and a RuntimeError is raised if they differ.
+    The returned model must only be used in eval mode without gradients.
+    """
+    optimized = copy.deepcopy(encoder).eval()
+    _fold_batchnorms(optimized)
+    for m in optimized.modules():
+        if isinstance(m, HighResolutionModule):
+            m.inplace_fuse = True
+
+    if example_input is not None:
+        was_training = encoder.training
+        encoder.eval()
+        with torch.no_grad():
+            expected = _flatten_features(encoder(example_input))
+            actual = _flatten_features(optimized(example_input))
+        encoder.train(was_training)
+
+        for i, (e, a) in enumerate(zip(expected, actual)):
+            if not torch.allclose(e, a, rtol=rtol, atol=atol):
+                raise RuntimeError(
+                    'optimized encoder output {} differs from the original (max abs diff {:.3e})'.format(
+                        i, (e - a).abs().max().item()))
+        logger.info('optimized encoder matches the original on {} outputs'.format(len(expected)))
+
+    return optimized
+
+
 def _hrnet(arch, pretrained, progress, **kwargs):
     from .hrnet_config import MODEL_CONFIGS
+    from weight_registry import WeightRegistry
     model = HighResolutionNet(MODEL_CONFIGS[arch], **kwargs)
     if pretrained:
         if arch == 'hrnet64':
@@ -512,8 +637,7 @@ def _hrnet(arch, pretrained, progress, **kwargs):
             model_url = model_urls[arch]
             #pretrained_path = model_path[arch]
             #loaded_state_dict = torch.load(pretrained_path)
-            loaded_state_dict = load_state_dict_from_url(model_url,
-                                                  progress=progress)
+            loaded_state_dict = WeightRegistry().load(arch, model_url)
             #add weights demention to adopt input change
             exp_layers = ['conv1.weight', 'bn1.weight', 'bn1.bias', 'bn1.running_mean', 'bn1.running_var', 'conv2.weight', 'bn2.weight', 'bn2.bias', 'bn2.running_mean', 'bn2.running_var']
             lista = ['transition1.0.0.weight', 'transition1.1.0.0.weight', 'transition2.2.0.0.weight', 'transition3.3.0.0.weight']
@@ -547,8 +671,7 @@ def _hrnet(arch, pretrained, progress, **kwargs):
             arch = arch + '_imagenet'
             model_url = model_urls[arch]
             #pretrained_path = model_path[arch]
-            loaded_state_dict = load_state_dict_from_url(model_url,
-                                                  progress=progress)
+            loaded_state_dict = WeightRegistry().load(arch, model_url)
             #loaded_state_dict = torch.load(pretrained_path)
         #if k == 'conv1.weight':
         #    loaded_state_dict[k] = torch.cat([v] * 2, 1) / 2
@@ -150,6 +150,12 @@ class MonodepthOptions:
                                  help="normal or shared",
                                  default="separate_resnet",
                                  choices=["posecnn", "separate_resnet", "shared"])
+        self.parser.add_argument("--pose_decoder_sharing",
+                                 type=str,
+                                 help="none runs separate pose decoders, squeeze / trunk run one "
+                                      "multi-head decoder sharing the squeeze conv / also the 3x3 convs",
+                                 default="none",
+                                 choices=["none", "squeeze", "trunk"])
 
         # SYSTEM options
         self.parser.add_argument("--no_cuda",
@@ -159,6 +165,23 @@ class MonodepthOptions:
                                  type=int,
                                  help="number of dataloader workers",
                                  default=12)
+        self.parser.add_argument("--channels_last",
+                                 help="if set, runs the models and their image inputs in "
+                                      "channels_last (NHWC) memory format",
+                                 action="store_true")
+        self.parser.add_argument("--low_memory_reprojection",
+                                 help="if set, keeps only the sampling coordinates of the warped "
+                                      "images and recomputes the warp in the backward pass",
+                                 action="store_true")
+        self.parser.add_argument("--frozen_device",
+                                 type=str,
+                                 help="device of the frozen helper networks, e.g. cuda:1 or cpu, "
+                                      "defaults to the training device")
+        self.parser.add_argument("--frozen_dtype",
+                                 type=str,
+                                 help="dtype the frozen helper networks run in",
+                                 default="float32",
+                                 choices=["float32", "float16", "bfloat16"])
 
         # LOADING options
         self.parser.add_argument("--models_to_load",
@@ -172,6 +195,15 @@ class MonodepthOptions:
         self.parser.add_argument("--load_weights_folder_teacher",
                                  type=str,
                                  help="name of model to load")
+        self.parser.add_argument("--helper_disp_path",
+                                 type=str,
+                                 help="disparities of the student helping the teacher written by "
+                                      "export_helper_disps.py, loaded instead of running it")
+        self.parser.add_argument("--resume",
+                                 type=str,
+                                 help="checkpoint.pth, or the models folder holding it, to resume "
+                                      "training from with the optimizer, scheduler, random and "
+                                      "data loader states")
         # LOGGING options
         self.parser.add_argument("--log_frequency",
                                  type=int,
@@ -181,6 +213,36 @@ class MonodepthOptions:
                                  type=int,
                                  help="number of epochs between each save",
                                  default=1)
+        self.parser.add_argument("--checkpoint_frequency",
+                                 type=int,
+                                 help="number of steps between checkpoints written in the middle "
+                                      "of an epoch, 0 only checkpoints at the end of epochs",
+                                 default=0)
+        self.parser.add_argument("--val_frequency",
+                                 type=int,
+                                 help="number of steps between validations, "
+                                      "validates at every log step if not set")
+        self.parser.add_argument("--val_batches",
+                                 type=int,
+                                 help="number of batches the validation metrics are averaged over",
+                                 default=1)
+        self.parser.add_argument("--val_mode",
+                                 type=str,
+                                 help="sync validates in the training loop, stream on a side CUDA "
+                                      "stream, process evaluates each saved checkpoint in a subprocess",
+                                 default="sync",
+                                 choices=["sync", "stream", "process"])
+        self.parser.add_argument("--profile",
+                                 help="if set, times the stages of every step and writes them to "
+                                      "the profile folder of the log directory",
+                                 action="store_true")
+        self.parser.add_argument("--profile_trace_start",
+                                 type=int,
+                                 help="with --profile, step at which to start a torch.profiler trace")
+        self.parser.add_argument("--profile_trace_steps",
+                                 type=int,
+                                 help="number of steps in the torch.profiler trace",
+                                 default=5)
 
         # EVALUATION options
         self.parser.add_argument("--eval_stereo",
@@ -203,8 +265,10 @@ class MonodepthOptions:
                                  type=str,
                                  default="eigen",
                                  choices=[
-                                    "eigen", "eigen_benchmark", "benchmark", "odom_9", "odom_10"],
-                                 help="which split to run eval on")
+                                    "eigen", "eigen_benchmark", "benchmark", "odom_9", "odom_10",
+                                    "odom"],
+                                 help="which split to run eval on, odom evaluates the poses of "
+                                      "sequences 09 and 10 together")
         self.parser.add_argument("--save_pred_disps",
                                  help="if set saves predicted disparities",
                                  action="store_true")
@@ -0,0 +1,178 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+import csv
+import json
+import time
+import torch
+
+
+class _NullRegion(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_null_region = _NullRegion()
+
+
+class _Region(object):
+    """Times a named region with CUDA events, or with the wall clock on the CPU
+    """
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        profiler = self.profiler
+        profiler.stack.append(self.name)
+        self.name = "/".join(profiler.stack)
+        if profiler.use_cuda:
+            self.start = torch.cuda.Event(enable_timing=True)
+            self.start.record()
+        else:
+            self.start = time.time()
+        return self
+
+    def __exit__(self, *args):
+        profiler = self.profiler
+        if profiler.use_cuda:
+            end = torch.cuda.Event(enable_timing=True)
+            end.record()
+            profiler.pending.append((self.name, self.start, end))
+        else:
+            profiler.add(self.name, 1000 * (time.time() - self.start))
+        profiler.stack.pop()
+        return False
+
+
+class StepProfiler(object):
+    """Per-stage timing of training steps
+
+    Stages are wrapped in `with profiler.region(name):`, nested regions are named
+    "outer/inner" and repeated regions are summed over the step. Each step also records
+    the time spent waiting for the data loader, the wall time and the peak memory.
+    Steps are appended to steps.jsonl in `log_dir`, steps.csv and summary.json are
+    written by close(). When disabled every call is a no-op.
+
+    If trace_start is set, a torch.profiler trace of trace_steps steps starting at that
+    step is written to `log_dir` for TensorBoard.
+    """
+    def __init__(self, enabled, device, log_dir, trace_start=None, trace_steps=5):
+        self.enabled = enabled
+        self.use_cuda = enabled and torch.device(device).type == "cuda"
+        self.device = device
+        self.log_dir = log_dir
+
+        self.stack = []
+        self.pending = []
+        self.times = {}
+        self.rows = []
+        self.window = []
+
+        self.trace = None
+        if enabled:
+            if not os.path.exists(log_dir):
+                os.makedirs(log_dir)
+            self.jsonl = open(os.path.join(log_dir, "steps.jsonl"), "a")
+
+            if trace_start is not None:
+                activities = [torch.profiler.ProfilerActivity.CPU]
+                if self.use_cuda:
+                    activities.append(torch.profiler.ProfilerActivity.CUDA)
+                self.trace = torch.profiler.profile(
+                    activities=activities,
+                    schedule=torch.profiler.schedule(
+                        wait=max(trace_start - 1, 0), warmup=min(trace_start, 1),
+                        active=trace_steps, repeat=1),
+                    on_trace_ready=torch.profiler.tensorboard_trace_handler(log_dir),
+                    profile_memory=True, record_shapes=True)
+                self.trace.start()
+
+    def region(self, name):
+        if not self.enabled:
+            return _null_region
+        return _Region(self, name)
+
+    def add(self, name, ms):
+        self.times[name] = self.times.get(name, 0.) + ms
+
+    def start_step(self, data_wait):
+        """Start timing a step, `data_wait` is the time in seconds spent waiting for its batch
+        """
+        if not self.enabled:
+            return
+        self.times = {"data_wait": 1000 * data_wait}
+        self.step_start = time.time()
+        if self.use_cuda:
+            torch.cuda.reset_peak_memory_stats(self.device)
+
+    def end_step(self, step, batch_size):
+        """Collect the regions of the step, this waits for the device when using CUDA
+        """
+        if not self.enabled:
+            return
+        if self.use_cuda:
+            torch.cuda.synchronize(self.device)
+            for name, start, end in self.pending:
+                self.add(name, start.elapsed_time(end))
+            self.pending = []
+
+        row = {"step": step, "step_ms": 1000 * (time.time() - self.step_start)}
+        row["examples_per_sec"] = batch_size / max(row["step_ms"] / 1000, 1e-9)
+        if self.use_cuda:
+            row["peak_memory_mb"] = torch.cuda.max_memory_allocated(self.device) / 2 ** 20
+        row.update(self.times)
+
+        self.rows.append(row)
+        self.window.append(row)
+        self.jsonl.write(json.dumps(row) + "\n")
+
+        if self.trace is not None:
+            self.trace.step()
+
+    def summary(self):
+        """Print the mean of every column over the steps since the last summary
+        """
+        if not self.enabled or not self.window:
+            return
+        names = []
+        for row in self.window:
+            names += [k for k in row if k != "step" and k not in names]
+
+        print("profile | {} steps up to step {}".format(len(self.window), self.window[-1]["step"]))
+        for name in names:
+            values = [row[name] for row in self.window if name in row]
+            print("  {:<40} {:>10.2f}".format(name, sum(values) / len(values)))
+        self.jsonl.flush()
+        self.window = []
+
+    def close(self):
+        """Write steps.csv and summary.json and stop the trace
+        """
+        if not self.enabled:
+            return
+        if self.trace is not None:
+            self.trace.stop()
+            self.trace = None
+        self.jsonl.close()
+
+        names = ["step"]
+        for row in self.rows:
+            names += [k for k in row if k not in names]
+        with open(os.path.join(self.log_dir, "steps.csv"), "w") as f:
+            writer = csv.DictWriter(f, fieldnames=names)
+            writer.writeheader()
+            writer.writerows(self.rows)
+
+        summary = {}
+        for name in names[1:]:
+            values = sorted(row[name] for row in self.rows if name in row)
+            if values:
+                summary[name] = {"mean": sum(values) / len(values),
+                                 "median": values[len(values) // 2],
+                                 "max": values[-1]}
+        with open(os.path.join(self.log_dir, "summary.json"), "w") as f:
+            json.dump(summary, f, indent=2)
@@ -0,0 +1,179 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+import time
+import inspect
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader
+from torch.quantization import QConfig, HistogramObserver, PerChannelMinMaxObserver
+from torch.quantization.quantize_fx import prepare_fx, convert_fx
+
+from geometry import disp_to_depth
+from utils import readlines
+from options import MonodepthOptions
+from evaluate_depth import compute_depth_metrics, load_gt_depths, splits_dir
+from weight_registry import load_state_dict
+import datasets
+import networks
+
+
+class StudentDepth(nn.Module):
+    """Student encoder and decoder as a single traceable module returning the full
+    resolution disparity
+    """
+    def __init__(self, encoder, decoder):
+        super(StudentDepth, self).__init__()
+        self.encoder = encoder
+        self.decoder = decoder
+
+    def forward(self, x):
+        return self.decoder(self.encoder(x))[("disp", 0)]
+
+
+def load_student(opt):
+    """Load the fp32 student from opt.load_weights_folder on the CPU
+    """
+    encoder_dict = load_state_dict(os.path.join(opt.load_weights_folder, "encoder.pth"))
+    decoder_dict = load_state_dict(os.path.join(opt.load_weights_folder, "depth.pth"))
+
+    encoder = networks.test_hr_encoder.hrnet18(False)
+    encoder.num_ch_enc = [ 64, 18, 36, 72, 144 ]
+    depth_decoder = networks.HRDepthDecoder(encoder.num_ch_enc, opt.scales)
+    model_dict = encoder.state_dict()
+    dec_model_dict = depth_decoder.state_dict()
+    encoder.load_state_dict({k: v for k, v in encoder_dict.items() if k in model_dict})
+    depth_decoder.load_state_dict({k: v for k, v in decoder_dict.items() if k in dec_model_dict})
+
+    model = StudentDepth(encoder, depth_decoder)
+    model.eval()
+    return model, encoder_dict['height'], encoder_dict['width']
+
+
+def build_qconfig_dict(model, backend):
+    """Per-channel symmetric int8 weights and histogram calibrated uint8 activations
+
+    The disparity heads (ReflectionPad2d + 3x3 conv to a single channel + sigmoid) are
+    kept in fp32: quantized convs only support zero padding, the heads are a negligible
+    share of the compute, and keeping them in float preserves the precision of the
+    predicted disparity. The reflection padded convs inside the decoder ConvBlocks stay
+    quantized, FX puts the padding in float if the engine has no quantized kernel for it.
+    """
+    qconfig = QConfig(
+        activation=HistogramObserver.with_args(reduce_range=(backend == "fbgemm")),
+        weight=PerChannelMinMaxObserver.with_args(dtype=torch.qint8,
+                                                  qscheme=torch.per_channel_symmetric))
+
+    float_modules = ["decoder.sigmoid"]
+    for name in model.decoder.convs.keys():
+        if name.startswith("dispConvScale"):
+            float_modules.append("decoder.convs.{}".format(name))
+
+    return {"": qconfig,
+            "module_name": [(name, None) for name in float_modules]}
+
+
+def quantize(model, calib_loader, opt, example_input):
+    """Post-training static quantization of the student with FX graph mode
+    """
+    qconfig_dict = build_qconfig_dict(model, opt.quant_backend)
+    # torch < 1.13 does not take example inputs
+    if "example_inputs" in inspect.signature(prepare_fx).parameters:
+        prepared = prepare_fx(model, qconfig_dict, example_inputs=(example_input,))
+    else:
+        prepared = prepare_fx(model, qconfig_dict)
+
+    print("-> Calibrating on {} images of the {} split".format(
+        len(calib_loader.dataset), opt.quant_calib_split))
+    with torch.no_grad():
+        for inputs in calib_loader:
+            prepared(inputs[("color", 0, 0)])
+
+    return convert_fx(prepared)
+
+
+def predict(model, dataloader, opt, num_warmup=5):
+    """Predict the disparities of a dataloader, returns them with the mean latency per image
+    """
+    pred_disps = []
+    timing = 0.0
+    with torch.no_grad():
+        for i, data in enumerate(dataloader):
+            input_color = data[("color", 0, 0)]
+            if i == 0:
+                for _ in range(num_warmup):
+                    model(input_color)
+
+            start_time = time.time()
+            disp = model(input_color)
+            timing += time.time() - start_time
+
+            pred_disp, _ = disp_to_depth(disp, opt.min_depth, opt.max_depth)
+            pred_disps.append(pred_disp[:, 0].numpy())
+
+    return np.concatenate(pred_disps), timing / len(dataloader.dataset)
+
+
+def main(opt):
+    """Quantizes a trained student, then evaluates the fp32 and the int8 models on the CPU
+    """
+    assert opt.load_weights_folder is not None, "--load_weights_folder is required"
+    opt.load_weights_folder = os.path.expanduser(opt.load_weights_folder)
+    assert os.path.isdir(opt.load_weights_folder), \
+        "Cannot find a folder at {}".format(opt.load_weights_folder)
+
+    torch.backends.quantized.engine = opt.quant_backend
+    if opt.quant_num_threads is not None:
+        torch.set_num_threads(opt.quant_num_threads)
+
+    print("-> Loading weights from {}".format(opt.load_weights_folder))
+    model, height, width = load_student(opt)
+
+    calib_filenames = readlines(os.path.join(splits_dir, opt.quant_calib_split, "train_files.txt"))
+    step = max(1, len(calib_filenames) // opt.quant_calib_images)
+    calib_filenames = calib_filenames[::step][:opt.quant_calib_images]
+    calib_dataset = datasets.KITTIRAWDataset(opt.data_path, calib_filenames, height, width,
+                                             [0], 4, is_train=False)
+    calib_loader = DataLoader(calib_dataset, opt.batch_size, shuffle=False,
+                              num_workers=opt.num_workers, drop_last=False)
+
+    filenames = readlines(os.path.join(splits_dir, opt.eval_split, "test_files.txt"))
+    dataset = datasets.KITTIRAWDataset(opt.data_path, filenames, height, width,
+                                       [0], 4, is_train=False)
+    # batch size 1 so that the latency matches single image serving on the edge boxes
+    dataloader = DataLoader(dataset, 1, shuffle=False, num_workers=opt.num_workers,
+                            drop_last=False)
+
+    example_input = torch.rand(1, 3, height, width)
+    quantized = quantize(model, calib_loader, opt, example_input)
+
+    output_path = opt.quant_output
+    if output_path is None:
+        output_path = os.path.join(opt.load_weights_folder, "student_int8.pt")
+    torch.jit.save(torch.jit.script(quantized), output_path)
+    print("-> Saved int8 model to {}".format(output_path))
+
+    gt_depths = load_gt_depths(opt.eval_split)
+    results = {}
+    for name, m in [("fp32", model), ("int8", quantized)]:
+        print("-> Evaluating {} model".format(name))
+        pred_disps, latency = predict(m, dataloader, opt)
+        errors, _ = compute_depth_metrics(pred_disps, gt_depths, opt)
+        results[name] = (np.array(errors).mean(0), latency)
+
+    print("\n  " + ("{:>8} | " * 9).format(
+        "model", "abs_rel", "sq_rel", "rmse", "rmse_log", "a1", "a2", "a3", "ms/img"))
+    for name, (mean_errors, latency) in results.items():
+        print(("{:>8} | " + "{: 8.3f} | " * 8).format(name, *(mean_errors.tolist() + [latency * 1000])))
+
+    fp32_errors, fp32_latency = results["fp32"]
+    int8_errors, int8_latency = results["int8"]
+    print("\n   abs_rel change: {:+.4f} | speedup: {:.2f}x".format(
+        int8_errors[0] - fp32_errors[0], fp32_latency / int8_latency))
+    print("\n-> Done!")
+
+
+if __name__ == "__main__":
+    options = MonodepthOptions()
+    main(options.parse())
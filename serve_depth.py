@@ -0,0 +1,337 @@
+from __future__ import absolute_import, division, print_function
+
+import io
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import Future
+from socketserver import ThreadingMixIn, UnixStreamServer
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Depth inference server keeping the student resident, POST an encoded image '
+                    'to /depth and read the counters at /stats')
+    parser.add_argument('--load_weights_folder', type=str, required=True,
+                        help='folder with the encoder.pth and depth.pth of the student')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8500)
+    parser.add_argument('--unix_socket', type=str,
+                        help='if set, serves on this unix socket instead of --host and --port')
+    parser.add_argument('--max_batch_size', type=int, default=8,
+                        help='largest number of requests predicted together')
+    parser.add_argument('--max_wait_ms', type=float, default=5,
+                        help='longest time the first request of a batch waits for others')
+    parser.add_argument('--min_depth', type=float, default=0.1)
+    parser.add_argument('--max_depth', type=float, default=100.0)
+    parser.add_argument('--depth_scale', type=float, default=1,
+                        help='factor applied to the predicted depths, 5.4 for stereo models')
+    parser.add_argument('--channels_last', action='store_true')
+    parser.add_argument('--no_cuda', action='store_true')
+    return parser.parse_args()
+
+
+class DepthModel(object):
+    """The student encoder and decoder, predicting depth at the training resolution
+    """
+    def __init__(self, load_weights_folder, device, min_depth, max_depth, channels_last=False):
+        import torch
+        import networks
+        from weight_registry import load_state_dict
+
+        self.device = device
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.channels_last = channels_last
+
+        self.encoder = networks.test_hr_encoder.hrnet18(False)
+        self.encoder.num_ch_enc = [64, 18, 36, 72, 144]
+        self.decoder = networks.HRDepthDecoder(self.encoder.num_ch_enc, range(4))
+        encoder_dict = load_state_dict(os.path.join(load_weights_folder, "encoder.pth"))
+        decoder_dict = load_state_dict(os.path.join(load_weights_folder, "depth.pth"))
+        self.height = encoder_dict['height']
+        self.width = encoder_dict['width']
+        for model, pretrained_dict in [(self.encoder, encoder_dict), (self.decoder, decoder_dict)]:
+            model_dict = model.state_dict()
+            model.load_state_dict({k: v for k, v in pretrained_dict.items() if k in model_dict})
+            model.to(device)
+            model.eval()
+            if channels_last:
+                model.to(memory_format=torch.channels_last)
+
+    def __call__(self, images):
+        """Bx1xHxW depths on the CPU of a Bx3xHxW batch
+        """
+        import torch
+        from geometry import disp_to_depth
+
+        with torch.inference_mode():
+            images = images.to(self.device, non_blocking=True)
+            if self.channels_last:
+                images = images.contiguous(memory_format=torch.channels_last)
+            disp = self.decoder(self.encoder(images))[("disp", 0)]
+            _, depth = disp_to_depth(disp, self.min_depth, self.max_depth)
+            return depth.float().cpu()
+
+
+class DynamicBatcher(object):
+    """Runs a model on batches of the requests submitted from several threads
+
+    A batch starts with the oldest waiting request and takes the requests arriving until it
+    holds max_batch_size of them or the first one has waited max_wait_ms. The batches run one
+    at a time in a background thread, the results are read from the Futures of submit().
+    """
+    def __init__(self, model, max_batch_size, max_wait_ms, stats):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.stats = stats
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, image):
+        """Queue a 3xHxW image, the Future gives its 1xHxW depth
+        """
+        future = Future()
+        self.queue.put((time.time(), image, future))
+        return future
+
+    def next_batch(self):
+        batch = [self.queue.get()]
+        deadline = batch[0][0] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.time()
+            try:
+                batch.append(self.queue.get(timeout=timeout) if timeout > 0
+                             else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        import torch
+
+        while True:
+            batch = self.next_batch()
+            try:
+                depths = self.model(torch.stack([image for _, image, _ in batch]))
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.stats.add_batch(len(batch))
+            for (_, _, future), depth in zip(batch, depths):
+                future.set_result(depth)
+
+
+class ServerStats(object):
+    """Request counters and the latency percentiles of the last requests
+    """
+    def __init__(self, window=10000):
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self.batched_requests = 0
+
+    def add_request(self, latency):
+        with self.lock:
+            self.requests += 1
+            self.latencies.append((time.time(), latency))
+
+    def add_error(self):
+        with self.lock:
+            self.errors += 1
+
+    def add_batch(self, batch_size):
+        with self.lock:
+            self.batches += 1
+            self.batched_requests += batch_size
+
+    def summary(self):
+        with self.lock:
+            now = time.time()
+            latencies = sorted(latency for _, latency in self.latencies)
+            recent = [t for t, _ in self.latencies if t > now - 10]
+            uptime = now - self.start_time
+
+            def percentile(p):
+                if not latencies:
+                    return None
+                return 1000 * latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))]
+
+            return {"uptime_s": uptime,
+                    "requests": self.requests,
+                    "errors": self.errors,
+                    "throughput_rps": self.requests / uptime,
+                    "recent_throughput_rps": len(recent) / min(10, uptime),
+                    "p50_ms": percentile(50),
+                    "p99_ms": percentile(99),
+                    "mean_batch_size": self.batched_requests / max(1, self.batches)}
+
+
+def encode_depth(depth, fmt):
+    """Bytes and content type of a HxW float depth map
+
+    npy: float16 array as written by numpy.save
+    png: uint16 png of the depth times 256, as the KITTI depth benchmark
+    """
+    import numpy as np
+    import PIL.Image as pil
+
+    buffer = io.BytesIO()
+    if fmt == "npy":
+        np.save(buffer, depth.astype(np.float16))
+        return buffer.getvalue(), "application/octet-stream"
+    depth = np.clip(depth * 256, 0, 65535).astype(np.uint16)
+    pil.fromarray(depth).save(buffer, format="PNG")
+    return buffer.getvalue(), "image/png"
+
+
+class DepthRequestHandler(BaseHTTPRequestHandler):
+    """POST /depth?format=png|npy with an encoded image as body, GET /stats and /health
+
+    The images are decoded, resized and converted in the handler threads, only the network
+    runs in the batcher thread.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def address_string(self):
+        # the client address of a unix socket connection is an empty string
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def send_body(self, code, body, content_type, headers=()):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in headers:
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, code, obj):
+        self.send_body(code, json.dumps(obj).encode(), "application/json")
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/stats":
+            self.send_json(200, self.server.stats.summary())
+        elif path == "/health":
+            self.send_json(200, {"height": self.server.model.height, "width": self.server.model.width})
+        else:
+            self.send_json(404, {"error": "unknown path {}".format(path)})
+
+    def do_POST(self):
+        start_time = time.time()
+        url = urlparse(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if url.path != "/depth":
+            self.send_json(404, {"error": "unknown path {}".format(url.path)})
+            return
+        fmt = parse_qs(url.query).get("format", ["png"])[0]
+        if fmt not in ["png", "npy"]:
+            self.send_json(400, {"error": "format should be png or npy"})
+            return
+
+        import numpy as np
+        import PIL.Image as pil
+        import torch
+        import torch.nn.functional as F
+
+        try:
+            image = pil.open(io.BytesIO(body)).convert('RGB')
+        except Exception as e:
+            self.server.stats.add_error()
+            self.send_json(400, {"error": "cannot decode the image: {}".format(e)})
+            return
+
+        model = self.server.model
+        original_width, original_height = image.size
+        image = image.resize((model.width, model.height), pil.LANCZOS)
+        image = torch.from_numpy(np.asarray(image, dtype=np.float32) / 255).permute(2, 0, 1)
+
+        try:
+            depth = self.server.batcher.submit(image).result()
+        except Exception as e:
+            self.server.stats.add_error()
+            self.send_json(500, {"error": str(e)})
+            return
+
+        depth = F.interpolate(depth[None], (original_height, original_width),
+                              mode="bilinear", align_corners=False)[0, 0]
+        depth = depth.numpy() * self.server.depth_scale
+        body, content_type = encode_depth(depth, fmt)
+        self.server.stats.add_request(time.time() - start_time)
+        self.send_body(200, body, content_type,
+                       [("X-Depth-Shape", "{}x{}".format(original_height, original_width))])
+
+
+class DepthServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class UnixDepthServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        UnixStreamServer.server_bind(self)
+        # used by BaseHTTPRequestHandler to fill the Server header
+        self.server_name = socket.gethostname()
+        self.server_port = 0
+
+
+def serve(args):
+    import torch
+
+    device = torch.device("cpu" if args.no_cuda or not torch.cuda.is_available() else "cuda")
+    print("-> Loading the student from {} on {}".format(args.load_weights_folder, device))
+    model = DepthModel(args.load_weights_folder, device, args.min_depth, args.max_depth,
+                       args.channels_last)
+    stats = ServerStats()
+
+    if args.unix_socket is not None:
+        server = UnixDepthServer(args.unix_socket, DepthRequestHandler)
+        address = args.unix_socket
+    else:
+        server = DepthServer((args.host, args.port), DepthRequestHandler)
+        address = "http://{}:{}".format(args.host, args.port)
+    server.model = model
+    server.stats = stats
+    server.batcher = DynamicBatcher(model, args.max_batch_size, args.max_wait_ms, stats)
+    server.depth_scale = args.depth_scale
+    server.verbose = False
+
+    print("-> Serving {}x{} depth on {}, batches of up to {} within {} ms".format(
+        model.width, model.height, address, args.max_batch_size, args.max_wait_ms))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.unix_socket is not None and os.path.exists(args.unix_socket):
+            os.remove(args.unix_socket)
+        print("\n-> {}".format(json.dumps(stats.summary())))
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    serve(parse_args())
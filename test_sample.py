@@ -1,22 +1,11 @@
 from __future__ import absolute_import, division, print_function
 
-import cv2
 import os
 import sys
 import glob
 import argparse
 import numpy as np
-import PIL.Image as pil
-import matplotlib as mpl
-import matplotlib.cm as cm
 import time
-import torch
-from torchvision import transforms, datasets
-from cv2 import imwrite
-import networks
-# import hr_networks
-from layers import disp_to_depth
-from utils import download_model_if_doesnt_exist
 
 
 def parse_args():
@@ -49,11 +38,25 @@ def parse_args():
     parser.add_argument("--no_cuda",
                             help='if set, disables CUDA',
                             action='store_true')
+    parser.add_argument("--optimize_encoder",
+                            help='if set, folds the encoder batch norms into its convs before predicting',
+                            action='store_true')
     return parser.parse_args()
 
 def test_simple(args):
     """Function to predict for a single image or folder of images
         """
+    # imported here so that --help does not load torch, the networks and matplotlib
+    import cv2
+    import PIL.Image as pil
+    import matplotlib as mpl
+    import matplotlib.cm as cm
+    import torch
+    from torchvision import transforms
+    import networks
+    from geometry import disp_to_depth
+    from weight_registry import load_state_dict
+
     assert args.model_name is not None, \
         "You must specify the --model_name parameter; see README.md for an example"
 
@@ -72,7 +75,7 @@ def test_simple(args):
     print("   Loading pretrained encoder")
     encoder = networks.test_hr_encoder.hrnet18(False)
     encoder.num_ch_enc = [ 64, 18, 36, 72, 144 ]
-    loaded_dict_enc = torch.load(encoder_path, map_location=device)
+    loaded_dict_enc = load_state_dict(encoder_path)
 
     # extract the height and width of image that this model was trained with
     feed_height = loaded_dict_enc['height']
@@ -81,6 +84,10 @@ def test_simple(args):
     encoder.load_state_dict(filtered_dict_enc)
     encoder.to(device)
     encoder.eval()
+    if args.optimize_encoder:
+        print("   Optimizing encoder for inference")
+        encoder = networks.optimize_for_inference(
+            encoder, torch.rand(1, 3, feed_height, feed_width).to(device))
 
 
     # teacher network
@@ -108,7 +115,7 @@ def test_simple(args):
     print("   Loading pretrained decoder")
     depth_decoder = networks.HRDepthDecoder(encoder.num_ch_enc, range(4))
 
-    loaded_dict = torch.load(depth_decoder_path, map_location=device)
+    loaded_dict = load_state_dict(depth_decoder_path)
     depth_decoder.load_state_dict(loaded_dict)
 
     timing = 0.0
@@ -7,10 +7,12 @@ os.environ["VECLIB_MAXIMUM_THREADS"] = "1" # export VECLIB_MAXIMUM_THREADS=4
 os.environ["NUMEXPR_NUM_THREADS"] = "1" # export NUMEXPR_NUM_THREADS=6
 from options_teacher import MonodepthOptions
 
-from trainer_teacher import Trainer
 options = MonodepthOptions()
 opts = options.parse()
 
 if __name__ == "__main__":
+    # torch and the networks are imported once the options are parsed, so --help and
+    # option errors return without loading them
+    from trainer_teacher import Trainer
     trainer = Trainer(opts)
     trainer.train()
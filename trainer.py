@@ -3,6 +3,7 @@ from datetime import datetime
 import numpy as np
 import time
 import torch
+import torch.nn as nn
 import torch.nn.functional as F
 from torchvision.transforms.functional import hflip
 import torch.optim as optim
@@ -11,12 +12,12 @@ import json
 import torchvision
 from utils import *
 from kitti_utils import *
-from layers import *
+from geometry import *
 import datasets
 import networks
 
 
-def build_extractor(num_layers, pretrained_path):
+def build_extractor(num_layers, pretrained_path, levels=(0,)):
     extractor = networks.ResnetEncoder(50, None)
     if pretrained_path is not None:
         checkpoint = torch.load(pretrained_path, map_location='cpu')
@@ -24,7 +25,8 @@ def build_extractor(num_layers, pretrained_path):
             extractor.state_dict()[name].copy_(checkpoint['state_dict']['Encoder.' + name])
         for param in extractor.parameters():
             param.requires_grad = False
-    return extractor
+    # only the stage 0 features are used, layer1-layer4 are dropped
+    return networks.ResnetFeatureExtractor(extractor, levels)
 
 class Trainer:
     def __init__(self, options):
@@ -174,26 +176,12 @@ class Trainer:
         if not self.opt.no_ssim:
             self.ssim = SSIM()
             self.ssim.to(self.device)
+        self.smooth_loss = SmoothLoss()
         self.num_batch_k = train_dataset_k.__len__() // self.opt.batch_size
 
-        self.backproject_depth = {}
-        self.project_3d = {}
-
-        # feature generated
-        self.backproject_feature = Backproject(self.opt.batch_size, int(self.opt.height/2), int(self.opt.width/2))
-        self.project_feature = Project(self.opt.batch_size, int(self.opt.height/2), int(self.opt.width/2))
-        self.backproject_feature.to(self.device)
-        self.project_feature.to(self.device)
-
-        for scale in self.opt.scales:
-            h = self.opt.height // (2 ** scale)#defualt=[0,1,2,3]'scales used in the loss'
-            w = self.opt.width // (2 ** scale)
-
-            self.backproject_depth[scale] = BackprojectDepth(self.opt.batch_size, h, w)#in layers.py
-            self.backproject_depth[scale].to(self.device)
-
-            self.project_3d[scale] = Project3D(self.opt.batch_size, h, w)
-            self.project_3d[scale].to(self.device)
+        # both layers take the resolution from their inputs and share the pixel grids
+        self.backproject_depth = BackprojectDepth()
+        self.project_3d = Project3D()
 
         self.depth_metric_names = [
             "de/abs_rel", "de/sq_rel", "de/rms", "de/log_rms", "da/a1", "da/a2", "da/a3"]
@@ -475,9 +463,9 @@ class Trainer:
                         axisangle[:, 0], translation[:, 0] * mean_inv_depth[:, 0], frame_id < 0)
 
                 # 同时预测r和t的网络
-                cam_points = self.backproject_depth[source_scale](
+                cam_points = self.backproject_depth(
                     depth, inputs[("inv_K", source_scale)])
-                pix_coords = self.project_3d[source_scale](
+                pix_coords = self.project_3d(
                     cam_points, inputs[("K", source_scale)], T)
                 outputs[("sample", frame_id, scale)] = pix_coords
 
@@ -487,7 +475,7 @@ class Trainer:
                     padding_mode="border")
                 
                 # 只预测t
-                pix_coords_only_t = self.project_3d[source_scale](
+                pix_coords_only_t = self.project_3d(
                     cam_points, inputs[("K", source_scale)], T_only_t)
                 outputs[("sample_only_t", frame_id, scale)] = pix_coords_only_t
 
@@ -497,7 +485,7 @@ class Trainer:
                     padding_mode="border")
 
                 # 只预测r
-                pix_coords_only_r = self.project_3d[source_scale](
+                pix_coords_only_r = self.project_3d(
                     cam_points, inputs[("K", source_scale)], T_only_r)
                 outputs[("sample_only_r", frame_id, scale)] = pix_coords_only_r
 
@@ -507,7 +495,7 @@ class Trainer:
                     padding_mode="border")
 
                 # 单独的r和t组合
-                pix_coords_r_and_t = self.project_3d[source_scale](
+                pix_coords_r_and_t = self.project_3d(
                     cam_points, inputs[("K", source_scale)], T_r_and_t)
                 outputs[("sample_r_and_t", frame_id, scale)] = pix_coords_r_and_t
 
@@ -537,27 +525,25 @@ class Trainer:
             K[:, 0, :] /= 2
             K[:, 1, :] /= 2
 
-            inv_K = torch.zeros_like(K)
-            for i in range(inv_K.shape[0]):
-                inv_K[i, :, :] = torch.pinverse(K[i, :, :])
+            inv_K = torch.inverse(K)
 
-            cam_points = self.backproject_feature(depth, inv_K)
-            pix_coords = self.project_feature(cam_points, K, T)  # [b,h,w,2]
+            cam_points = self.backproject_depth(depth, inv_K)
+            pix_coords = self.project_3d(cam_points, K, T)  # [b,h,w,2]
 
             img = inputs[("color", frame_id, 0)]
             src_f = self.extractor(img)[0]
             outputs[("feature", frame_id, 0)] = F.grid_sample(src_f, pix_coords, padding_mode="border")
 
             # only t
-            pix_coords_only_t = self.project_feature(cam_points, K, T_only_t)  # [b,h,w,2]
+            pix_coords_only_t = self.project_3d(cam_points, K, T_only_t)  # [b,h,w,2]
             outputs[("feature_only_t", frame_id, 0)] = F.grid_sample(src_f, pix_coords_only_t, padding_mode="border")
 
             # only r
-            pix_coords_only_r = self.project_feature(cam_points, K, T_only_r)  # [b,h,w,2]
+            pix_coords_only_r = self.project_3d(cam_points, K, T_only_r)  # [b,h,w,2]
             outputs[("feature_only_r", frame_id, 0)] = F.grid_sample(src_f, pix_coords_only_r, padding_mode="border")
 
             # t and r
-            pix_coords_r_and_t = self.project_feature(cam_points, K, T_r_and_t)  # [b,h,w,2]
+            pix_coords_r_and_t = self.project_3d(cam_points, K, T_r_and_t)  # [b,h,w,2]
             outputs[("feature_r_and_t", frame_id, 0)] = F.grid_sample(src_f, pix_coords_r_and_t, padding_mode="border")
             
     def robust_l1(self, pred, target):
@@ -591,6 +577,7 @@ class Trainer:
         losses = {}
         total_loss = 0
         visit = False
+        self.smooth_loss.clear()
 
         for scale in self.opt.scales:
             #scales=[0,1,2,3]
@@ -742,7 +729,7 @@ class Trainer:
             loss += to_optimise.mean()
             mean_disp = disp.mean(2, True).mean(3, True)
             norm_disp = disp / (mean_disp + 1e-7)
-            smooth_loss = get_smooth_loss(norm_disp, color)
+            smooth_loss = self.smooth_loss(norm_disp, color)
 
             loss += self.opt.disparity_smoothness * smooth_loss / (2 ** scale)#defualt=1e-3 something with get_smooth_loss function
             total_loss += loss
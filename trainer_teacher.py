@@ -3,17 +3,24 @@ from datetime import datetime
 import numpy as np
 import time
 import torch
+import torch.nn as nn
 import torch.nn.functional as F
 import torch.optim as optim
 from torch.utils.data import DataLoader
+from torch.utils.checkpoint import checkpoint
 import json
 import torch.nn.functional as F
 
 from utils import *
 from kitti_utils import *
-from layers import *
+from geometry import *
 import datasets
 import networks
+from validation import Validator
+from profiler import StepProfiler
+from weight_registry import load_state_dict
+from checkpoint import CheckpointWriter, ResumableSampler, epoch_from_folder, \
+    get_rng_state, set_rng_state
 
 class Trainer:
     def __init__(self, options):
@@ -47,7 +54,8 @@ class Trainer:
             self.opt.frame_ids.append("s")
         
         self.models["encoder_t"] = networks.ResnetEncoder(
-            50, self.opt.weights_init == "pretrained", num_input_images=4)
+            50, self.opt.weights_init == "pretrained" and not self.will_load("encoder_t"),
+            num_input_images=4)
         self.models["encoder_t"].to(self.device)
         self.parameters_to_train += list(self.models["encoder_t"].parameters())
 
@@ -63,30 +71,31 @@ class Trainer:
         print('params in depth decdoer',para_sum)
 
 
-        # student for help teacher training
-
-        self.student_help_teacher_encoder = networks.test_hr_encoder.hrnet18(True)
-        self.student_help_teacher_encoder.num_ch_enc = [ 64, 18, 36, 72, 144 ]
-        self.student_help_teacher_decoder = networks.HRDepthDecoder(self.student_help_teacher_encoder.num_ch_enc, self.opt.scales)
+        # student for help teacher training, not needed when its disparities are precomputed,
+        # built without its ImageNet weights as they are overwritten
+        if self.opt.helper_disp_path is None:
+            self.student_help_teacher_encoder = networks.test_hr_encoder.hrnet18(False)
+            self.student_help_teacher_encoder.num_ch_enc = [ 64, 18, 36, 72, 144 ]
+            self.student_help_teacher_decoder = networks.HRDepthDecoder(self.student_help_teacher_encoder.num_ch_enc, self.opt.scales)
         
-        for model_type in ["encoder.pth", "depth.pth"]:
-            model_path = os.path.join(self.opt.student_model_input_of_disp_for_t, model_type)
-            pretrained_dict_for_student = torch.load(model_path)
+            for model_type in ["encoder.pth", "depth.pth"]:
+                model_path = os.path.join(self.opt.student_model_input_of_disp_for_t, model_type)
+                pretrained_dict_for_student = load_state_dict(model_path)
             
-            if model_type == "encoder.pth":
-                # pretrained_dict_for_student = {k: v for k, v in pretrained_dict_for_student.items() if k in self.student_help_teacher_encoder}
-                enc_model_dict = self.student_help_teacher_encoder.state_dict()
-                self.student_help_teacher_encoder.load_state_dict({k: v for k, v in pretrained_dict_for_student.items() if k in enc_model_dict})
-                for param in self.student_help_teacher_encoder.parameters():
-                    param.requires_grad = False
-                self.student_help_teacher_encoder.to(self.device)
-            else:
-                # pretrained_dict_for_student = {k: v for k, v in pretrained_dict_for_student.items() if k in self.student_help_teacher_decoder}
-                dec_model_dict = self.student_help_teacher_decoder.state_dict()
-                self.student_help_teacher_decoder.load_state_dict({k: v for k, v in pretrained_dict_for_student.items() if k in dec_model_dict})
-                for param in self.student_help_teacher_decoder.parameters():
-                    param.requires_grad = False
-                self.student_help_teacher_decoder.to(self.device)
+                if model_type == "encoder.pth":
+                    # pretrained_dict_for_student = {k: v for k, v in pretrained_dict_for_student.items() if k in self.student_help_teacher_encoder}
+                    enc_model_dict = self.student_help_teacher_encoder.state_dict()
+                    self.student_help_teacher_encoder.load_state_dict({k: v for k, v in pretrained_dict_for_student.items() if k in enc_model_dict})
+                    for param in self.student_help_teacher_encoder.parameters():
+                        param.requires_grad = False
+                    self.student_help_teacher_encoder.to(self.device)
+                else:
+                    # pretrained_dict_for_student = {k: v for k, v in pretrained_dict_for_student.items() if k in self.student_help_teacher_decoder}
+                    dec_model_dict = self.student_help_teacher_decoder.state_dict()
+                    self.student_help_teacher_decoder.load_state_dict({k: v for k, v in pretrained_dict_for_student.items() if k in dec_model_dict})
+                    for param in self.student_help_teacher_decoder.parameters():
+                        param.requires_grad = False
+                    self.student_help_teacher_decoder.to(self.device)
 
         if self.use_pose_net:  #use_pose_net = True
             if self.opt.pose_model_type == "separate_resnet":  #defualt=separate_resnet  choice = ['normal or shared']
@@ -94,11 +103,21 @@ class Trainer:
                 # Pose estimation's Encoder
                 self.models["pose_encoder_t"] = networks.ResnetEncoder(
                     self.opt.num_layers,
-                    self.opt.weights_init == "pretrained",
+                    self.opt.weights_init == "pretrained" and not self.will_load("pose_encoder_t"),
                     num_input_images=self.num_pose_frames)#num_input_images=2
                 
+                if self.opt.pose_decoder_sharing != "none":
+                    # a single decoder with one head per separate pose decoder
+                    heads = ["pose", "pose_for_t", "pose_for_r"] if self.opt.pose_idea == True else ["pose"]
+                    self.models["pose"] = networks.MultiHeadPoseDecoder(
+                        self.models["pose_encoder_t"].num_ch_enc,
+                        num_input_features=1,
+                        num_frames_to_predict_for=2,
+                        heads=heads,
+                        share_trunk=self.opt.pose_decoder_sharing == "trunk")
+
                 # if we use pose idea, we use other two pose decoder
-                if self.opt.pose_idea == True:
+                elif self.opt.pose_idea == True:
                     # Only output translation
                     self.models["pose_for_t"] = networks.PoseDecoder_for_t(
                         self.models["pose_encoder_t"].num_ch_enc,
@@ -112,13 +131,14 @@ class Trainer:
                         num_frames_to_predict_for=2)
 
                 # Whether there is pose idea or not, pose for estimating R and T is required
-                self.models["pose"] = networks.PoseDecoder(
-                    self.models["pose_encoder_t"].num_ch_enc,
+                if self.opt.pose_decoder_sharing == "none":
+                    self.models["pose"] = networks.PoseDecoder(
+                        self.models["pose_encoder_t"].num_ch_enc,
                         num_input_features=1,
                         num_frames_to_predict_for=2
-                )
+                    )
 
-            if self.opt.pose_idea == True:
+            if self.opt.pose_idea == True and self.opt.pose_decoder_sharing == "none":
                 self.models["pose_for_t"].cuda()
                 self.models["pose_for_r"].cuda()
                 self.parameters_to_train += list(self.models["pose_for_t"].parameters())
@@ -129,22 +149,34 @@ class Trainer:
             self.parameters_to_train += list(self.models["pose_encoder_t"].parameters())
             self.parameters_to_train += list(self.models["pose"].parameters())
         
+        # the frozen student stays in eval mode and runs without autograd, optionally on
+        # another device or in another dtype
+        if self.opt.helper_disp_path is None:
+            self.student_help_teacher = networks.FrozenModule(
+                nn.Sequential(self.student_help_teacher_encoder, self.student_help_teacher_decoder),
+                self.opt.frozen_device or self.device, getattr(torch, self.opt.frozen_dtype))
+
+        if self.opt.channels_last:
+            channels_last_models = list(self.models.values())
+            if self.opt.helper_disp_path is None:
+                channels_last_models.append(self.student_help_teacher)
+            for m in channels_last_models:
+                m.to(memory_format=torch.channels_last)
+
         self.model_optimizer = optim.Adam(self.parameters_to_train, self.opt.learning_rate) #learning_rate=1e-4
         #self.model_optimizer = optim.Adam(self.parameters_to_train, 0.5 * self.opt.learning_rate)#learning_rate=1e-4
         self.model_lr_scheduler = optim.lr_scheduler.StepLR(
             self.model_optimizer, self.opt.scheduler_step_size, 0.1)#defualt = 15'step size of the scheduler'
 
+        # names of the models restored from --load_weights_folder
+        self.loaded_models = []
+        if self.opt.load_weights_folder is not None:
+            self.load_model()
+
         print("Training model named:\n  ", self.opt.model_name)
         print("Models and tensorboard events files are saved to:\n  ", self.log_path)
         print("Training is using:\n  ", self.device)
 
-        # feature generated
-        self.backproject_feature = Backproject(self.opt.batch_size, int(self.opt.height/2), int(self.opt.width/2))
-        self.project_feature = Project(self.opt.batch_size, int(self.opt.height/2), int(self.opt.width/2))
-        self.backproject_feature.to(self.device)
-        self.project_feature.to(self.device)
-
-        
         # data
         datasets_dict = {"kitti": datasets.KITTIRAWDataset,
                          "kitti_odom": datasets.KITTIOdomDataset,
@@ -163,38 +195,43 @@ class Trainer:
         #dataloader for kitti
         train_dataset_k = self.dataset_k(
             self.opt.data_path, train_filenames_k, self.opt.height, self.opt.width,
-            self.opt.frame_ids, 4, is_train=True, img_ext = '.jpg')
+            self.opt.frame_ids, 4, is_train=True, img_ext = '.jpg',
+            helper_disp_path=self.opt.helper_disp_path)
+        self.train_sampler = ResumableSampler(train_dataset_k)
         self.train_loader_k = DataLoader(
-            train_dataset_k, self.opt.batch_size, True,
-            num_workers=self.opt.num_workers, pin_memory=True, drop_last=True)
+            train_dataset_k, self.opt.batch_size, sampler=self.train_sampler,
+            num_workers=self.opt.num_workers, pin_memory=True, drop_last=True,
+            collate_fn=datasets.PackedCollate(self.opt.channels_last))
         
         #val_dataset = self.dataset(
         val_dataset = self.dataset_k( 
             self.opt.data_path, val_filenames, self.opt.height, self.opt.width,
-            self.opt.frame_ids, 4, is_train=False, img_ext=img_ext)
+            self.opt.frame_ids, 4, is_train=False, img_ext=img_ext,
+            helper_disp_path=self.opt.helper_disp_path)
         self.val_loader = DataLoader(
             val_dataset, self.opt.batch_size, True,
-            num_workers=self.opt.num_workers, pin_memory=True, drop_last=True)
-        self.val_iter = iter(self.val_loader)
+            num_workers=self.opt.num_workers, pin_memory=True, drop_last=True,
+            collate_fn=datasets.PackedCollate(self.opt.channels_last))
+        # the teacher evaluation also needs the student predicting its input disparities
+        self.validator = Validator(
+            self, "evaluate_depth_teacher.py",
+            lambda save_folder: ["--load_weights_folder", self.opt.student_model_input_of_disp_for_t,
+                                 "--load_weights_folder_teacher", save_folder])
+        self.profiler = StepProfiler(self.opt.profile, self.device,
+                                     os.path.join(self.log_path, "profile"),
+                                     self.opt.profile_trace_start, self.opt.profile_trace_steps)
+        self.checkpointer = CheckpointWriter()
 
 
         if not self.opt.no_ssim:
             self.ssim = SSIM()
             self.ssim.to(self.device)
+        self.smooth_loss = SmoothLoss()
         self.num_batch_k = train_dataset_k.__len__() // self.opt.batch_size
 
-        self.backproject_depth = {}
-        self.project_3d = {}
-
-        for scale in self.opt.scales:
-            h = self.opt.height // (2 ** scale)#defualt=[0,1,2,3]'scales used in the loss'
-            w = self.opt.width // (2 ** scale)
-
-            self.backproject_depth[scale] = BackprojectDepth(self.opt.batch_size, h, w)#in layers.py
-            self.backproject_depth[scale].to(self.device)
-
-            self.project_3d[scale] = Project3D(self.opt.batch_size, h, w)
-            self.project_3d[scale].to(self.device)
+        # both layers take the resolution from their inputs and share the pixel grids
+        self.backproject_depth = BackprojectDepth()
+        self.project_3d = Project3D()
 
         self.depth_metric_names = [
             "de/abs_rel", "de/sq_rel", "de/rms", "de/log_rms", "da/a1", "da/a2", "da/a3"]
@@ -222,13 +259,24 @@ class Trainer:
         """
         self.init_time = time.time()
         self.epoch_start = 0
+        if self.loaded_models:
+            # continue the epoch count of a weights_<epoch> folder the models were restored from
+            epoch = epoch_from_folder(self.opt.load_weights_folder)
+            self.epoch_start = 0 if epoch is None else epoch + 1
         self.step = 0
+        self.batch_start = 0
+        if self.opt.resume is not None:
+            self.load_checkpoint(self.opt.resume)
         self.start_time = time.time()
         for self.epoch in range(self.opt.num_epochs - self.epoch_start):
             self.epoch = self.epoch_start + self.epoch
             self.run_epoch()
             if (self.epoch + 1) % self.opt.save_frequency == 0:#number of epochs between each save defualt =1
                 self.save_model()
+            self.save_checkpoint(self.epoch + 1, 0)
+        self.checkpointer.close()
+        self.validator.close()
+        self.profiler.close()
         self.total_training_time = time.time() - self.init_time
         print('====>total training time:{}'.format(sec_to_hm_str(self.total_training_time)))
 
@@ -240,12 +288,17 @@ class Trainer:
         self.set_train()
         self.every_epoch_start_time = time.time()
         
-        for batch_idx, inputs in enumerate(self.train_loader_k):
+        self.train_sampler.set_epoch(self.epoch, self.batch_start * self.opt.batch_size)
+        data_start_time = time.time()
+        for batch_idx, inputs in enumerate(self.train_loader_k, self.batch_start):
             before_op_time = time.time()
+            self.profiler.start_step(before_op_time - data_start_time)
             outputs, losses = self.process_batch(inputs)
-            self.model_optimizer.zero_grad()
-            losses["loss"].backward()
-            self.model_optimizer.step()
+            with self.profiler.region("backward"):
+                self.model_optimizer.zero_grad()
+                losses["loss"].backward()
+            with self.profiler.region("optimizer"):
+                self.model_optimizer.step()
 
             duration = time.time() - before_op_time
 
@@ -260,8 +313,17 @@ class Trainer:
                     self.compute_depth_losses(inputs, outputs, losses)
 
                 #self.log("train", inputs, outputs, losses)
-                self.val()
+            if self.validator.due(self.step, early_phase or late_phase):
+                with self.profiler.region("val"):
+                    self.val()
+            self.profiler.end_step(self.step, self.opt.batch_size)
+            if early_phase or late_phase:
+                self.profiler.summary()
             self.step += 1
+            if self.opt.checkpoint_frequency > 0 and self.step % self.opt.checkpoint_frequency == 0:
+                self.save_checkpoint(self.epoch, batch_idx + 1)
+            data_start_time = time.time()
+        self.batch_start = 0
         
         self.model_lr_scheduler.step()
         self.every_epoch_end_time = time.time()
@@ -270,8 +332,17 @@ class Trainer:
     def process_batch(self, inputs):
         """Pass a minibatch through the network and generate images and losses
         """
-        for key, ipt in inputs.items():#inputs.values() has :12x3x196x640.
-            inputs[key] = ipt.to(self.device)#put tensor in gpu memory
+        with self.profiler.region("inputs"):
+            if isinstance(inputs, datasets.PackedBatch):
+                # one asynchronous copy per dtype from pinned memory, already in the memory
+                # format asked by --channels_last
+                inputs.to_device(self.device, non_blocking=True)
+            else:
+                for key, ipt in inputs.items():#inputs.values() has :12x3x196x640.
+                    if self.opt.channels_last and ipt.dim() == 4:
+                        inputs[key] = ipt.to(self.device, memory_format=torch.channels_last)
+                    else:
+                        inputs[key] = ipt.to(self.device)#put tensor in gpu memory
 
         if self.opt.pose_model_type == "shared":
             # If we are using a shared encoder for both depth and pose (as advocated
@@ -287,44 +358,71 @@ class Trainer:
             outputs = self.models["depth"](features[0])
         else:
             # Otherwise, we first generate 3 disp images
-            source1 = inputs[("color_aug", -1, 0)]   # -1 frame
-            source0 = inputs[("color_aug", 0, 0)]    # 0 frame
-            source2 = inputs[("color_aug", 1, 0)]    # 1 frame
-
-            # disp1_help_teacher is a dict
-            disp1_help_teacher = self.student_help_teacher_decoder(self.student_help_teacher_encoder(source1))
-            disp0_help_teacher = self.student_help_teacher_decoder(self.student_help_teacher_encoder(source0))
-            disp2_help_teacher = self.student_help_teacher_decoder(self.student_help_teacher_encoder(source2))
+            with self.profiler.region("student"):
+                source1 = inputs[("color_aug", -1, 0)]   # -1 frame
+                source0 = inputs[("color_aug", 0, 0)]    # 0 frame
+                source2 = inputs[("color_aug", 1, 0)]    # 1 frame
+
+                if self.opt.helper_disp_path is not None:
+                    # precomputed by export_helper_disps.py from the images before color augmentation
+                    disp1_help_teacher, disp0_help_teacher, disp2_help_teacher = [
+                        inputs[("helper_disp", i, 0)].float() for i in [-1, 0, 1]]
+                    student_outputs = {("disp", s): inputs[("helper_disp", 0, s)].float()
+                                       for s in self.opt.scales}
+                else:
+                    # in eval mode the three frames can go through the student as one batch,
+                    # disps_help_teacher maps each disp key to the disparities of the three frames
+                    disps_help_teacher = self.student_help_teacher(torch.cat((source1, source0, source2)))
+                    disps_help_teacher = {k: torch.split(v, source0.shape[0]) for k, v in disps_help_teacher.items()}
+                    disp1_help_teacher, disp0_help_teacher, disp2_help_teacher = disps_help_teacher[("disp", 0)]
+                    student_outputs = {k: v[1] for k, v in disps_help_teacher.items()}
 
-            # then fed then to teacher network
-            teacher_input = torch.cat((source1, disp1_help_teacher[("disp", 0)], source0, disp0_help_teacher[("disp", 0)], source2, disp2_help_teacher[("disp", 0)]), 1)
+                # then fed then to teacher network
+                teacher_input = torch.cat((source1, disp1_help_teacher, source0, disp0_help_teacher, source2, disp2_help_teacher), 1)
 
-            features = self.models["encoder_t"](teacher_input)
-            outputs = self.models["depth_t"](features)
+            with self.profiler.region("teacher"):
+                features = self.models["encoder_t"](teacher_input)
+                outputs = self.models["depth_t"](features)
 
             # add student result to output dict to make selective supervised
-            outputs.update(disp0_help_teacher)
+            outputs.update(student_outputs)
 
         if self.opt.predictive_mask:
             outputs["predictive_mask"] = self.models["predictive_mask"](features)
             #different form 1:*:* depth maps ,it will output 2:*:* mask maps
 
         if self.use_pose_net:
-            outputs.update(self.predict_poses(inputs, features))
+            with self.profiler.region("pose"):
+                outputs.update(self.predict_poses(inputs, features))
 
-        self.generate_images_pred(inputs, outputs)
+        with self.profiler.region("warping"):
+            self.generate_images_pred(inputs, outputs)
 
-        losses = self.compute_losses(inputs, outputs)
+        with self.profiler.region("losses"):
+            losses = self.compute_losses(inputs, outputs)
 
         return outputs, losses
 
+    def run_pose_decoders(self, pose_inputs):
+        """Run the pose decoder(s) on encoded pose inputs, the outputs are keyed by the
+        names of the separate decoders
+        """
+        if self.opt.pose_decoder_sharing != "none":
+            return self.models["pose"](pose_inputs)
+
+        pose_outputs = {"pose": self.models["pose"](pose_inputs)}
+        if self.opt.pose_idea == True:
+            pose_outputs["pose_for_t"] = self.models["pose_for_t"](pose_inputs)
+            pose_outputs["pose_for_r"] = self.models["pose_for_r"](pose_inputs)
+        return pose_outputs
+
     def predict_poses(self, inputs, features):
         """Predict poses between input frames for monocular sequences.
         """
         outputs = {}
         if self.num_pose_frames == 2:
-            # In this setting, we compute the pose to each source frame via a
-            # separate forward pass through the pose network.
+            # In this setting, we compute the pose to each source frame. The pairs of all
+            # source frames are stacked along the batch so that the pose network runs once.
 
             # select what features the pose network takes as input
             if self.opt.pose_model_type == "shared":
@@ -338,44 +436,48 @@ class Trainer:
                 -1
                 1
             """
-            for f_i in self.opt.frame_ids[1:]:
-                #frame_ids = [0,-1,1]
-                if f_i != "s":
-                    # To maintain ordering we always pass frames in temporal order
-                    if f_i < 0:
-                        pose_inputs = [pose_feats[f_i], pose_feats[0]]#nerboring frames
-                    else:
-                        pose_inputs = [pose_feats[0], pose_feats[f_i]]
+            #frame_ids = [0,-1,1]
+            source_frame_ids = [f_i for f_i in self.opt.frame_ids[1:] if f_i != "s"]
+            pose_pairs = []
+            for f_i in source_frame_ids:
+                # To maintain ordering we always pass frames in temporal order
+                if f_i < 0:
+                    pose_pairs.append(torch.cat([pose_feats[f_i], pose_feats[0]], 1))#nerboring frames
+                else:
+                    pose_pairs.append(torch.cat([pose_feats[0], pose_feats[f_i]], 1))
+            pose_inputs = torch.cat(pose_pairs, 0)
 
-                    if self.opt.pose_model_type == "separate_resnet":
-                        pose_inputs = [self.models["pose_encoder_t"](torch.cat(pose_inputs, 1))]
-                    elif self.opt.pose_model_type == "posecnn":
-                        pose_inputs = torch.cat(pose_inputs, 1)
+            if self.opt.pose_model_type == "separate_resnet":
+                pose_inputs = [self.models["pose_encoder_t"](pose_inputs)]
 
-                    if self.opt.pose_idea == True:
-                        # only estimation translation and only estimate rotation
-                        translation_for_t = self.models["pose_for_t"](pose_inputs)
-                        axisangle_for_r = self.models["pose_for_r"](pose_inputs)
-                        outputs[("axisangle_for_r", 0, f_i)] = axisangle_for_r
-                        outputs[("translation_for_t", 0, f_i)] = translation_for_t
-
-                        # only for t
-                        axisangle_temp = torch.zeros_like(axisangle_for_r)
-                        outputs[("cam_T_cam_for_t", 0, f_i)] = transformation_from_parameters(
-                            axisangle_temp[:, 0], translation_for_t[:, 0], invert=(f_i < 0))
-                        # only for r
-                        translation_temp = torch.zeros_like(translation_for_t)
-                        outputs[("cam_T_cam_for_r", 0, f_i)] = transformation_from_parameters(
-                            axisangle_for_r[:, 0], translation_temp[:, 0], invert=(f_i < 0))
-                        # r and t
-                        outputs[("cam_T_cam_r_and_t", 0, f_i)] = transformation_from_parameters(
-                            axisangle_for_r[:, 0], translation_for_t[:, 0], invert=(f_i < 0))
-
-
-                    translation, axisangle = self.models["pose"](pose_inputs)
-                    outputs[("cam_T_cam", 0, f_i)] = transformation_from_parameters(
-                            axisangle[:, 0], translation[:, 0], invert=(f_i < 0))
-                    
+            pose_outputs = self.run_pose_decoders(pose_inputs)
+            batch_size = pose_pairs[0].shape[0]
+
+            for i, f_i in enumerate(source_frame_ids):
+                frame = slice(i * batch_size, (i + 1) * batch_size)
+
+                if self.opt.pose_idea == True:
+                    # only estimation translation and only estimate rotation
+                    translation_for_t = pose_outputs["pose_for_t"][frame]
+                    axisangle_for_r = pose_outputs["pose_for_r"][frame]
+                    outputs[("axisangle_for_r", 0, f_i)] = axisangle_for_r
+                    outputs[("translation_for_t", 0, f_i)] = translation_for_t
+
+                    # only for t
+                    axisangle_temp = torch.zeros_like(axisangle_for_r)
+                    outputs[("cam_T_cam_for_t", 0, f_i)] = transformation_from_parameters(
+                        axisangle_temp[:, 0], translation_for_t[:, 0], invert=(f_i < 0))
+                    # only for r
+                    translation_temp = torch.zeros_like(translation_for_t)
+                    outputs[("cam_T_cam_for_r", 0, f_i)] = transformation_from_parameters(
+                        axisangle_for_r[:, 0], translation_temp[:, 0], invert=(f_i < 0))
+                    # r and t
+                    outputs[("cam_T_cam_r_and_t", 0, f_i)] = transformation_from_parameters(
+                        axisangle_for_r[:, 0], translation_for_t[:, 0], invert=(f_i < 0))
+
+                translation, axisangle = [x[frame] for x in pose_outputs["pose"]]
+                outputs[("cam_T_cam", 0, f_i)] = transformation_from_parameters(
+                        axisangle[:, 0], translation[:, 0], invert=(f_i < 0))
 
         """ else:
             # Here we input all frames to the pose net (and predict all poses) together
@@ -421,25 +523,9 @@ class Trainer:
         return outputs
 
     def val(self):
-        """Validate the model on a single minibatch
+        """Validate the model on --val_batches minibatches
         """
-        self.set_eval()
-        try:
-            inputs = self.val_iter.next()
-        except StopIteration:
-            self.val_iter = iter(self.val_loader)
-            inputs = self.val_iter.next()
-
-        with torch.no_grad():
-            outputs, losses = self.process_batch(inputs)
-
-            if "depth_gt" in inputs:
-                self.compute_depth_losses(inputs, outputs, losses)
-
-            #self.log("val", inputs, outputs, losses)
-            del inputs, outputs, losses
-
-        self.set_train()
+        self.validator.run(self.step)
 
     def generate_images_pred(self, inputs, outputs):
         """Generate the warped (reprojected) color images for a minibatch.
@@ -485,89 +571,85 @@ class Trainer:
                     T = transformation_from_parameters(
                         axisangle[:, 0], translation[:, 0] * mean_inv_depth[:, 0], frame_id < 0)
                 """
-                cam_points_s = self.backproject_depth[source_scale](
+                cam_points_s = self.backproject_depth(
                     depth_s, inputs[("inv_K", source_scale)])
                 
-                teacher_cam_points = self.backproject_depth[source_scale](
+                teacher_cam_points = self.backproject_depth(
                     depth_t, inputs[("inv_K", source_scale)])
                 
                 if self.opt.pose_idea == True:
                     # trasnlation
-                    pix_coords_for_t = self.project_3d[source_scale](
+                    pix_coords_for_t = self.project_3d(
                         cam_points_s, inputs[("K", source_scale)], T_for_t)
 
-                    outputs[("color_for_t", frame_id, scale)] = F.grid_sample(
-                        inputs[("color", frame_id, source_scale)],
-                        pix_coords_for_t,
-                        padding_mode="border")
+                    self.warp_source(inputs, outputs, "color_for_t", frame_id, scale, source_scale,
+                                     pix_coords_for_t)
 
                     # rotation
-                    pix_coords_for_r = self.project_3d[source_scale](
+                    pix_coords_for_r = self.project_3d(
                         cam_points_s, inputs[("K", source_scale)], T_for_r)
 
-                    outputs[("color_for_r", frame_id, scale)] = F.grid_sample(
-                        inputs[("color", frame_id, source_scale)],
-                        pix_coords_for_r,
-                        padding_mode="border")
+                    self.warp_source(inputs, outputs, "color_for_r", frame_id, scale, source_scale,
+                                     pix_coords_for_r)
 
                     # translation and rotation
-                    pix_coords_r_and_t = self.project_3d[source_scale](
+                    pix_coords_r_and_t = self.project_3d(
                         cam_points_s, inputs[("K", source_scale)], T_r_and_t)
                     
-                    outputs[("color_r_and_t", frame_id, scale)] = F.grid_sample(
-                        inputs[("color", frame_id, source_scale)],
-                        pix_coords_r_and_t,
-                        padding_mode="border")
+                    self.warp_source(inputs, outputs, "color_r_and_t", frame_id, scale, source_scale,
+                                     pix_coords_r_and_t)
                     
                     # teacher part
                     # trasnlation
-                    teacher_pix_coords_for_t = self.project_3d[source_scale](
+                    teacher_pix_coords_for_t = self.project_3d(
                         teacher_cam_points, inputs[("K", source_scale)], T_for_t)
 
-                    outputs[("teacher_color_for_t", frame_id, scale)] = F.grid_sample(
-                        inputs[("color", frame_id, source_scale)],
-                        teacher_pix_coords_for_t,
-                        padding_mode="border")
+                    self.warp_source(inputs, outputs, "teacher_color_for_t", frame_id, scale, source_scale,
+                                     teacher_pix_coords_for_t)
 
                     # rotation
-                    teacher_pix_coords_for_r = self.project_3d[source_scale](
+                    teacher_pix_coords_for_r = self.project_3d(
                         teacher_cam_points, inputs[("K", source_scale)], T_for_r)
 
-                    outputs[("teacher_color_for_r", frame_id, scale)] = F.grid_sample(
-                        inputs[("color", frame_id, source_scale)],
-                        teacher_pix_coords_for_r,
-                        padding_mode="border")
+                    self.warp_source(inputs, outputs, "teacher_color_for_r", frame_id, scale, source_scale,
+                                     teacher_pix_coords_for_r)
 
                     # translation and rotation
-                    teacher_pix_coords_r_and_t = self.project_3d[source_scale](
+                    teacher_pix_coords_r_and_t = self.project_3d(
                         teacher_cam_points, inputs[("K", source_scale)], T_r_and_t)
 
-                    outputs[("teacher_color_r_and_t", frame_id, scale)] = F.grid_sample(
-                        inputs[("color", frame_id, source_scale)],
-                        teacher_pix_coords_r_and_t,
-                        padding_mode="border")
+                    self.warp_source(inputs, outputs, "teacher_color_r_and_t", frame_id, scale, source_scale,
+                                     teacher_pix_coords_r_and_t)
 
                 
-                pix_coords = self.project_3d[source_scale](
+                pix_coords = self.project_3d(
                         cam_points_s, inputs[("K", source_scale)], T)
 
-                outputs[("color", frame_id, scale)] = F.grid_sample(
-                    inputs[("color", frame_id, source_scale)],
-                    pix_coords,
-                    padding_mode="border")
+                self.warp_source(inputs, outputs, "color", frame_id, scale, source_scale,
+                                 pix_coords)
 
-                teacher_pix_coords = self.project_3d[source_scale](
+                teacher_pix_coords = self.project_3d(
                     teacher_cam_points, inputs[("K", source_scale)], T)
 
-                outputs[("teacher_color", frame_id, scale)] = F.grid_sample(
-                    inputs[("color", frame_id, source_scale)],
-                    teacher_pix_coords,
-                    padding_mode="border")
+                self.warp_source(inputs, outputs, "teacher_color", frame_id, scale, source_scale,
+                                 teacher_pix_coords)
                     
                 if not self.opt.disable_automasking:
                     #doing this
                     outputs[("color_identity", frame_id, scale)] = inputs[("color", frame_id, source_scale)]
 
+    def warp_source(self, inputs, outputs, name, frame_id, scale, source_scale, pix_coords):
+        """Warp a source frame into outputs[(name, frame_id, scale)]
+
+        With --low_memory_reprojection only the sampling coordinates are kept and the warp
+        is recomputed inside the checkpointed loss.
+        """
+        if self.opt.low_memory_reprojection:
+            outputs[(name + "_coords", frame_id, scale)] = pix_coords
+        else:
+            outputs[(name, frame_id, scale)] = grid_sample(
+                inputs[("color", frame_id, source_scale)], pix_coords, padding_mode="border")
+
     def robust_l1(self, pred, target):
         eps = 1e-3
         return torch.sqrt(torch.pow(target - pred, 2) + eps ** 2)
@@ -581,16 +663,55 @@ class Trainer:
         if self.opt.no_ssim:
             reprojection_loss = l1_loss
         else:
-            ssim_loss = self.ssim(pred, target).mean(1, True)
+            with self.profiler.region("ssim"):
+                ssim_loss = self.ssim(pred, target).mean(1, True)
             reprojection_loss = 0.85 * ssim_loss + 0.15 * l1_loss
 
         return reprojection_loss
 
+    def warp_and_compute_reprojection_loss(self, source, pix_coords, target):
+        """Reprojection loss of a source frame warped with pix_coords
+        """
+        pred = grid_sample(source, pix_coords, padding_mode="border")
+        return self.compute_reprojection_loss(pred, target)
+
+    def compute_warped_reprojection_loss(self, inputs, outputs, name, frame_id, scale,
+                                         source_scale, target):
+        """Reprojection loss of the warped image `name`, when only its sampling coordinates
+        were kept the warp and the loss are checkpointed so that neither the warped image
+        nor the SSIM intermediates stay alive until the backward pass
+        """
+        if (name, frame_id, scale) in outputs:
+            return self.compute_reprojection_loss(outputs[(name, frame_id, scale)], target)
+
+        source = inputs[("color", frame_id, source_scale)]
+        pix_coords = outputs[(name + "_coords", frame_id, scale)]
+        if not torch.is_grad_enabled():
+            return self.warp_and_compute_reprojection_loss(source, pix_coords, target)
+        return checkpoint(self.warp_and_compute_reprojection_loss, source, pix_coords, target,
+                          use_reentrant=False)
+
+    def compute_min_reprojection_loss(self, inputs, outputs, prefix, frame_id, scale,
+                                      source_scale, target):
+        """Per-pixel minimum reprojection loss over the pose hypotheses of a source frame,
+        reduced as each hypothesis is computed instead of concatenating all of them
+        """
+        names = ["color"]
+        if self.opt.pose_idea == True:
+            names += ["color_for_t", "color_r_and_t", "color_for_r"]
+
+        min_loss = RunningMin()
+        for name in names:
+            min_loss.add(self.compute_warped_reprojection_loss(
+                inputs, outputs, prefix + name, frame_id, scale, source_scale, target))
+        return min_loss.min
+
     def compute_losses(self, inputs, outputs):
         """Compute the reprojection and smoothness losses for a minibatch
         """
         losses = {}
         total_loss = 0
+        self.smooth_loss.clear()
 
         for scale in self.opt.scales:
             #scales=[0,1,2,3]
@@ -610,58 +731,19 @@ class Trainer:
 
             # mini reconstruction loss
             for frame_id in self.opt.frame_ids[1:]:
-                
-                if self.opt.pose_idea == True:
-                    pred_for_t = outputs[("color_for_t", frame_id, scale)]
-                    pred_r_and_t = outputs[("color_r_and_t", frame_id, scale)]
-                    pred_for_r = outputs[("color_for_r", frame_id, scale)] 
-
-                    loss_pred_for_t = self.compute_reprojection_loss(pred_for_t, target)
-                    loss_pred_r_and_t = self.compute_reprojection_loss(pred_r_and_t, target)
-                    loss_pred_for_r = self.compute_reprojection_loss(pred_for_r, target)
-
-                teacher_pred_for_t = outputs[("teacher_color_for_t", frame_id, scale)]
-                teacher_pred_r_and_t = outputs[("teacher_color_r_and_t", frame_id, scale)]
-                teacher_pred_for_r = outputs[("teacher_color_for_r", frame_id, scale)] 
-
-                teacher_loss_pred_for_t = self.compute_reprojection_loss(teacher_pred_for_t, target)
-                teacher_loss_pred_r_and_t = self.compute_reprojection_loss(teacher_pred_r_and_t, target)
-                teacher_loss_pred_for_r = self.compute_reprojection_loss(teacher_pred_for_r, target)
-
-                pred = outputs[("color", frame_id, scale)]
-                loss_pred = self.compute_reprojection_loss(pred, target)
-                    
-                teacher_pred = outputs[("teacher_color", frame_id, scale)]
-                teacher_loss_pred = self.compute_reprojection_loss(teacher_pred, target)
-                
-                if self.opt.pose_idea == True:
-                    final_t, _ = torch.min(torch.cat((teacher_loss_pred, teacher_loss_pred_for_t, teacher_loss_pred_r_and_t, teacher_loss_pred_for_r), 1), 1, True)
-                    final_s, _ = torch.min(torch.cat((loss_pred, loss_pred_for_t, loss_pred_r_and_t, loss_pred_for_r), 1), 1, True)
-                else:
-                    final_t = teacher_loss_pred
-                    final_s = loss_pred
-
-                reprojection_losses.append(final_s)
-                reprojection_losses_teacher.append(final_t)
-
-            reprojection_losses = torch.cat(reprojection_losses, 1)
-            reprojection_losses_teacher = torch.cat(reprojection_losses_teacher, 1)
+                reprojection_losses.append(self.compute_min_reprojection_loss(
+                    inputs, outputs, "", frame_id, scale, source_scale, target))
+                reprojection_losses_teacher.append(self.compute_min_reprojection_loss(
+                    inputs, outputs, "teacher_", frame_id, scale, source_scale, target))
 
+            identity_reprojection_losses = []
             if not self.opt.disable_automasking:
                 #doing this 
-                identity_reprojection_losses = []
                 for frame_id in self.opt.frame_ids[1:]:
                     pred = inputs[("color", frame_id, source_scale)]
                     identity_reprojection_losses.append(
                         self.compute_reprojection_loss(pred, target))
 
-                identity_reprojection_losses = torch.cat(identity_reprojection_losses, 1)
-                if self.opt.avg_reprojection:
-                    identity_reprojection_loss = identity_reprojection_losses.mean(1, keepdim=True)
-                else:
-                    # save both images, and do min all at once below
-                    identity_reprojection_loss = identity_reprojection_losses
-
             elif self.opt.predictive_mask:
                 mask = outputs["predictive_mask"]["disp", scale]
                 if not self.opt.v1_multiscale:
@@ -669,50 +751,45 @@ class Trainer:
                         mask, [self.opt.height, self.opt.width],
                         mode="bilinear", align_corners=False)
 
-                reprojection_losses *= mask
-                #reprojection_losses.size() =12X2X192X640 
+                reprojection_losses = [l * mask[:, i:i + 1] for i, l in enumerate(reprojection_losses)]
 
                 # add a loss pushing mask to 1 (using nn.BCELoss for stability)
-                weighting_loss = 0.2 * nn.BCELoss()(mask, torch.ones(mask.shape).cuda()) if torch.cuda.is_available() else   0.2 * nn.BCELoss()(mask, torch.ones(mask.shape).cpu())
+                weighting_loss = 0.2 * nn.BCELoss()(mask, torch.ones_like(mask))
                 loss += weighting_loss.mean()
 
             if self.opt.avg_reprojection:
-                reprojection_loss = reprojection_losses.mean(1, keepdim=True)
-            else:
-                #doing_this
-                reprojection_loss = reprojection_losses
-                reprojection_loss_teacher = reprojection_losses_teacher
-
-            if not self.opt.disable_automasking:
-                #doing_this
-                # add random numbers to break ties
-                    #identity_reprojection_loss.shape).cuda() * 0.00001
-                if torch.cuda.is_available():
-                    identity_reprojection_loss += torch.randn(identity_reprojection_loss.shape).cuda() * 0.00001
-                else:
-                    identity_reprojection_loss += torch.randn(identity_reprojection_loss.shape).cpu() * 0.00001
-                combined = torch.cat((identity_reprojection_loss, reprojection_loss), dim=1)
-                combined_t = torch.cat((identity_reprojection_loss, reprojection_loss_teacher), dim=1)
-            else:
-                combined = reprojection_loss
-                combined_t = reprojection_loss_teacher
+                if identity_reprojection_losses:
+                    identity_reprojection_losses = [
+                        sum(identity_reprojection_losses) / len(identity_reprojection_losses)]
+                reprojection_losses = [sum(reprojection_losses) / len(reprojection_losses)]
+                reprojection_losses_teacher = [
+                    sum(reprojection_losses_teacher) / len(reprojection_losses_teacher)]
+
+            # add random numbers to break ties
+            identity_reprojection_losses = [l + torch.randn_like(l) * 0.00001 for l in identity_reprojection_losses]
+
+            # per-pixel minimum over the identity and reprojection losses of all source frames,
+            # reduced one loss map at a time
+            combined = RunningMin(track_argmin=True)
+            for l in identity_reprojection_losses + reprojection_losses:
+                combined.add(l)
+            to_optimise = combined.min if combined.count == 1 else combined.min[:, 0]
+
+            combined_t = RunningMin()
+            for l in identity_reprojection_losses + reprojection_losses_teacher:
+                combined_t.add(l)
+            to_optimise_t = combined_t.min if combined_t.count == 1 else combined_t.min[:, 0]
 
-            if combined.shape[1] == 1:
-                to_optimise = combined
-                to_optimise_t = combined_t
-            else:
-                #doing this
-                to_optimise, idxs = torch.min(combined, dim=1)
-                to_optimise_t, idxs_t = torch.min(combined_t, dim=1)
             if not self.opt.disable_automasking:
                 #outputs["identity_selection/{}".format(scale)] = (
                 outputs["identity_selection/{}".format(0)] = (
-                    idxs > identity_reprojection_loss.shape[1] - 1).float()
+                    combined.argmin[:, 0] > len(identity_reprojection_losses) - 1).float()
 
 
             mean_disp = disp.mean(2, True).mean(3, True)
             norm_disp = disp / (mean_disp + 1e-7)
-            smooth_loss = get_smooth_loss(norm_disp, color)
+            with self.profiler.region("smoothness"):
+                smooth_loss = self.smooth_loss(norm_disp, color)
 
             loss += self.opt.disparity_smoothness * smooth_loss / (2 ** scale)#defualt=1e-3 something with get_smooth_loss function
             
@@ -826,6 +903,42 @@ class Trainer:
         with open(os.path.join(models_dir, 'opt.json'), 'w') as f:
             json.dump(to_save, f, indent=2)
 
+    def save_checkpoint(self, epoch, batch):
+        """Write the full training state in the background, --resume continues at `batch`
+        of `epoch`
+        """
+        state = {"epoch": epoch,
+                 "samples": batch * self.opt.batch_size,
+                 "step": self.step,
+                 "models": {n: m.state_dict() for n, m in self.models.items()},
+                 "optimizer": self.model_optimizer.state_dict(),
+                 "scheduler": self.model_lr_scheduler.state_dict(),
+                 "sampler": self.train_sampler.state_dict(),
+                 "rng": get_rng_state()}
+        self.checkpointer.save([(state, os.path.join(self.log_path, "models", "checkpoint.pth"))])
+
+    def load_checkpoint(self, path):
+        """Restore the training state written by save_checkpoint
+        """
+        path = os.path.expanduser(path)
+        if os.path.isdir(path):
+            path = os.path.join(path, "checkpoint.pth")
+        assert os.path.isfile(path), "Cannot find checkpoint {}".format(path)
+        print("Resuming training from {}".format(path))
+
+        state = torch.load(path, map_location="cpu")
+        for n, model in self.models.items():
+            model.load_state_dict(state["models"][n])
+        self.model_optimizer.load_state_dict(state["optimizer"])
+        self.model_lr_scheduler.load_state_dict(state["scheduler"])
+        self.train_sampler.load_state_dict(state["sampler"])
+        set_rng_state(state["rng"])
+
+        self.epoch_start = state["epoch"]
+        self.batch_start = state["samples"] // self.opt.batch_size
+        self.step = state["step"]
+        print("  epoch {}, batch {}, step {}".format(self.epoch_start, self.batch_start, self.step))
+
     def save_model(self):
         """Save model weights to disk
         """
@@ -833,6 +946,7 @@ class Trainer:
         if not os.path.exists(save_folder):
             os.makedirs(save_folder)
 
+        files = []
         for model_name, model in self.models.items():
             save_path = os.path.join(save_folder, "{}.pth".format(model_name))
             to_save = model.state_dict()
@@ -841,10 +955,33 @@ class Trainer:
                 to_save['height'] = self.opt.height
                 to_save['width'] = self.opt.width
                 to_save['use_stereo'] = self.opt.use_stereo
-            torch.save(to_save, save_path)
+            files.append((to_save, save_path))
 
         save_path = os.path.join(save_folder, "{}.pth".format("adam"))
-        torch.save(self.model_optimizer.state_dict(), save_path)
+        files.append((self.model_optimizer.state_dict(), save_path))
+        self.checkpointer.save(files)
+        if self.opt.val_mode == "process":
+            # the evaluation subprocess reads the weights right away
+            self.checkpointer.wait()
+        self.validator.on_save(save_folder)
+
+    def load_separate_pose_decoders(self, pose_dict):
+        """Initialise the multi-head pose decoder from a checkpoint of separate pose decoders
+        """
+        print("Converting separate pose decoder weights to the multi-head pose decoder")
+        state_dicts = {"pose": pose_dict}
+        for head in ["pose_for_t", "pose_for_r"]:
+            path = os.path.join(self.opt.load_weights_folder, "{}.pth".format(head))
+            if head in self.models["pose"].heads and os.path.isfile(path):
+                state_dicts[head] = load_state_dict(path)
+        self.models["pose"].load_decoder_state_dicts(state_dicts)
+
+    def will_load(self, name):
+        """Whether models[name] is overwritten by --load_weights_folder or --resume, in which
+        case its ImageNet initialisation is skipped
+        """
+        return self.opt.resume is not None or \
+            (self.opt.load_weights_folder is not None and name in self.opt.models_to_load)
 
     def load_model(self):
         """Load model(s) from disk
@@ -856,13 +993,22 @@ class Trainer:
         print("loading model from folder {}".format(self.opt.load_weights_folder))
 
         for n in self.opt.models_to_load:
+            if n not in self.models:
+                print("Skipping {} weights, the model is not used".format(n))
+                continue
             print("Loading {} weights...".format(n))
             path = os.path.join(self.opt.load_weights_folder, "{}.pth".format(n))
             model_dict = self.models[n].state_dict()
-            pretrained_dict = torch.load(path)
+            pretrained_dict = load_state_dict(path)
+            if isinstance(self.models[n], networks.MultiHeadPoseDecoder) and \
+                    not any(k.startswith("convs.") for k in pretrained_dict):
+                self.load_separate_pose_decoders(pretrained_dict)
+                self.loaded_models.append(n)
+                continue
             pretrained_dict = {k: v for k, v in pretrained_dict.items() if k in model_dict}
             model_dict.update(pretrained_dict)
             self.models[n].load_state_dict(model_dict)
+            self.loaded_models.append(n)
 
         # loading adam state
         # optimizer_load_path = os.path.join(self.opt.load_weights_folder, "adam.pth")
@@ -0,0 +1,181 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+import sys
+import copy
+import subprocess
+import torch
+import torch.nn.functional as F
+
+from geometry import compute_masked_depth_errors
+
+
+depth_metric_names = [
+    "de/abs_rel", "de/sq_rel", "de/rms", "de/log_rms", "da/a1", "da/a2", "da/a3"]
+
+
+class Validator(object):
+    """Validation of a Trainer at its own cadence, with metrics averaged over several batches
+
+    --val_mode selects how it runs:
+        sync    validates --val_batches batches in the training loop
+        stream  validates a snapshot of the models on a side CUDA stream, overlapping
+                with the following training steps, and reports at the next validation
+        process evaluates every saved checkpoint with `eval_script` in a subprocess, given
+                the weights arguments `weights_args(save_folder)` returns
+    """
+    def __init__(self, trainer, eval_script, weights_args=None):
+        self.trainer = trainer
+        self.opt = trainer.opt
+        self.eval_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), eval_script)
+        if weights_args is None:
+            weights_args = lambda save_folder: ["--load_weights_folder", save_folder]
+        self.weights_args = weights_args
+
+        self.val_iter = iter(trainer.val_loader)
+        self.metrics = {}
+        self.num_batches = 0
+        self.step = None
+
+        self.stream = None
+        self.done = None
+        if self.opt.val_mode == "stream":
+            assert trainer.device.type == "cuda", "--val_mode stream needs CUDA"
+            self.stream = torch.cuda.Stream(device=trainer.device)
+            self.done = torch.cuda.Event()
+            # the side stream validates copies, so the optimizer can update the weights and
+            # the batch norm statistics of the trained models while it runs
+            self.models = {k: copy.deepcopy(m) for k, m in trainer.models.items()}
+
+        self.processes = []
+        self.pending_folders = []
+
+    def due(self, step, log_step):
+        """Whether the training loop should validate at this step
+        """
+        if self.opt.val_mode == "process":
+            self.poll()
+            return False
+        if self.opt.val_frequency is None:
+            return log_step
+        return step % self.opt.val_frequency == 0
+
+    def next_batch(self):
+        try:
+            return next(self.val_iter)
+        except StopIteration:
+            self.val_iter = iter(self.trainer.val_loader)
+            return next(self.val_iter)
+
+    def accumulate(self, inputs, outputs, losses):
+        """Add the losses and depth metrics of a batch to the running sums, on the device
+        """
+        batch_metrics = {k: v.detach() for k, v in losses.items() if torch.is_tensor(v)}
+
+        if "depth_gt" in inputs and ("depth", 0, 0) in outputs:
+            depth_pred = torch.clamp(F.interpolate(
+                outputs[("depth", 0, 0)], [375, 1242], mode="bilinear", align_corners=False), 1e-3, 80)
+            depth_gt = inputs["depth_gt"]
+            mask = depth_gt > 0
+
+            # garg/eigen crop
+            crop_mask = torch.zeros_like(mask)
+            crop_mask[:, :, 153:371, 44:1197] = 1
+            mask = mask * crop_mask
+
+            depth_errors = compute_masked_depth_errors(depth_gt, depth_pred, mask)
+            for name, error in zip(depth_metric_names, depth_errors):
+                batch_metrics[name] = error
+
+        for k, v in batch_metrics.items():
+            self.metrics[k] = self.metrics[k] + v if k in self.metrics else v
+        self.num_batches += 1
+
+    def run(self, step):
+        """Validate --val_batches batches, in sync mode the results are printed right away
+        """
+        trainer = self.trainer
+        if self.stream is not None:
+            self.report()
+            self.stream.wait_stream(torch.cuda.current_stream(trainer.device))
+
+        models = trainer.models
+        # torch.cuda.stream(None) is a no-op
+        with torch.no_grad(), torch.cuda.stream(self.stream):
+            if self.stream is not None:
+                for k, m in self.models.items():
+                    m.load_state_dict(models[k].state_dict())
+                snapshot = torch.cuda.Event()
+                snapshot.record(self.stream)
+                trainer.models = self.models
+            trainer.set_eval()
+
+            for _ in range(self.opt.val_batches):
+                inputs = self.next_batch()
+                outputs, losses = trainer.process_batch(inputs)
+                self.accumulate(inputs, outputs, losses)
+                del inputs, outputs, losses
+
+            if self.stream is not None:
+                self.done.record(self.stream)
+        trainer.models = models
+        trainer.set_train()
+        self.step = step
+
+        if self.stream is not None:
+            # only the copy of the weights has to finish before training touches them again
+            torch.cuda.current_stream(trainer.device).wait_event(snapshot)
+        else:
+            self.report()
+
+    def report(self):
+        """Print the metrics averaged over the validated batches
+        """
+        if self.num_batches == 0:
+            return
+        if self.done is not None:
+            self.done.synchronize()
+
+        names = sorted(k for k in self.metrics if k not in depth_metric_names) + \
+            [k for k in depth_metric_names if k in self.metrics]
+        values = torch.stack([self.metrics[k].float() for k in names]) / self.num_batches
+        print("val | step {:>6} | {} batches | ".format(self.step, self.num_batches) +
+              " | ".join("{}: {:.4f}".format(k, v) for k, v in zip(names, values.tolist())))
+
+        self.metrics = {}
+        self.num_batches = 0
+
+    def on_save(self, save_folder):
+        """Queue the evaluation of a saved checkpoint in --val_mode process
+        """
+        if self.opt.val_mode != "process":
+            return
+        self.pending_folders.append(save_folder)
+        self.poll()
+
+    def poll(self):
+        """Start the next queued checkpoint evaluation once the previous one has exited
+        """
+        self.processes = [p for p in self.processes if p.poll() is None]
+        if self.processes or not self.pending_folders:
+            return
+
+        save_folder = self.pending_folders.pop(0)
+        log_file = open(os.path.join(save_folder, "eval.txt"), "w")
+        command = [sys.executable, self.eval_script] + self.weights_args(save_folder) + \
+            ["--data_path", self.opt.data_path,
+             "--eval_split", self.opt.eval_split,
+             "--eval_stereo" if self.opt.use_stereo else "--eval_mono",
+             "--num_workers", str(min(self.opt.num_workers, 4))]
+        print("-> Evaluating {} in the background, see {}".format(save_folder, log_file.name))
+        self.processes.append(subprocess.Popen(command, stdout=log_file, stderr=subprocess.STDOUT))
+        log_file.close()
+
+    def close(self):
+        """Report the last stream validation and wait for the queued evaluations
+        """
+        self.report()
+        while self.processes or self.pending_folders:
+            for p in self.processes:
+                p.wait()
+            self.poll()
@@ -0,0 +1,160 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+import ssl
+import argparse
+import tempfile
+import torch
+
+# where the weights are stored, unless DIFFNET_WEIGHTS is set
+DEFAULT_ROOT = os.path.join(os.path.expanduser("~"), ".cache", "diffnet", "weights")
+
+
+def load_state_dict(path, map_location="cpu"):
+    """torch.load of a checkpoint, memory-mapped when the file and torch support it
+
+    With mmap the tensors are paged in from the file as they are copied into a model instead
+    of being read and deserialized up front. Files written with the legacy serialization, and
+    torch versions before 2.1, fall back to a plain torch.load.
+    """
+    try:
+        return torch.load(path, map_location=map_location, mmap=True)
+    except (TypeError, RuntimeError):
+        return torch.load(path, map_location=map_location)
+
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class WeightRegistry(object):
+    """Local content addressed store of pretrained weights
+
+    Each file is stored once as <root>/blobs/<sha256>.pth, index.json maps names such as
+    hrnet18_imagenet to these hashes. A missing name is downloaded from its url and added,
+    unless the registry is offline, so after the first run the pretrained networks are built
+    without network access. Files can be added by hand with
+    `python weight_registry.py add <name> <file>` on machines without any.
+    """
+    def __init__(self, root=None, offline=None):
+        self.root = root or os.environ.get("DIFFNET_WEIGHTS", DEFAULT_ROOT)
+        if offline is None:
+            offline = os.environ.get("DIFFNET_OFFLINE", "0") not in ["", "0"]
+        self.offline = offline
+        self.index_path = os.path.join(self.root, "index.json")
+
+    def read_index(self):
+        if not os.path.isfile(self.index_path):
+            return {}
+        with open(self.index_path) as f:
+            return json.load(f)
+
+    def write_index(self, index):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.index_path)
+
+    def blob_path(self, sha256):
+        return os.path.join(self.root, "blobs", "{}.pth".format(sha256))
+
+    def path(self, name):
+        """Path of the weights registered as `name`, None if they are not in the store
+        """
+        sha256 = self.read_index().get(name)
+        if sha256 is None or not os.path.isfile(self.blob_path(sha256)):
+            return None
+        return self.blob_path(sha256)
+
+    def add(self, name, path):
+        """Copy a file into the store under `name` and return its sha256
+        """
+        sha256 = file_sha256(path)
+        blob_path = self.blob_path(sha256)
+        if not os.path.isfile(blob_path):
+            if not os.path.exists(os.path.dirname(blob_path)):
+                os.makedirs(os.path.dirname(blob_path))
+            tmp_path = blob_path + ".tmp"
+            shutil.copyfile(path, tmp_path)
+            os.replace(tmp_path, blob_path)
+
+        index = self.read_index()
+        index[name] = sha256
+        self.write_index(index)
+        return sha256
+
+    def fetch(self, name, url=None):
+        """Path of the weights registered as `name`, downloaded from `url` if needed
+        """
+        path = self.path(name)
+        if path is not None:
+            return path
+
+        assert url is not None and not self.offline, \
+            "{} is not in the weight registry at {}, add it with " \
+            "`python weight_registry.py add {} <file>`".format(name, self.root, name)
+
+        print("-> Downloading {} to the weight registry".format(name))
+        if not os.path.exists(self.root):
+            os.makedirs(self.root)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".download")
+        os.close(fd)
+        # the ImageNet weights were always downloaded without checking the certificates
+        https_context = ssl._create_default_https_context
+        ssl._create_default_https_context = ssl._create_unverified_context
+        try:
+            torch.hub.download_url_to_file(url, tmp_path, progress=True)
+            self.add(name, tmp_path)
+        finally:
+            ssl._create_default_https_context = https_context
+            os.remove(tmp_path)
+        return self.path(name)
+
+    def load(self, name, url=None, map_location="cpu"):
+        """State dict of the weights registered as `name`, downloaded from `url` if needed
+        """
+        return load_state_dict(self.fetch(name, url), map_location)
+
+    def verify(self):
+        """Names whose stored file is missing or does not match its hash
+        """
+        return [name for name, sha256 in sorted(self.read_index().items())
+                if not os.path.isfile(self.blob_path(sha256)) or
+                file_sha256(self.blob_path(sha256)) != sha256]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Manages the local store of pretrained weights')
+    parser.add_argument('--root', type=str,
+                        help='store directory, defaults to $DIFFNET_WEIGHTS or {}'.format(DEFAULT_ROOT))
+    subparsers = parser.add_subparsers(dest='command')
+    add_parser = subparsers.add_parser('add', help='add a weights file under a name')
+    add_parser.add_argument('name', type=str, help='e.g. hrnet18_imagenet or resnet50')
+    add_parser.add_argument('path', type=str)
+    subparsers.add_parser('list', help='list the registered weights')
+    subparsers.add_parser('verify', help='check the stored files against their hashes')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    registry = WeightRegistry(args.root)
+    if args.command == "add":
+        print("{} {}".format(registry.add(args.name, args.path), args.name))
+    elif args.command == "verify":
+        corrupted = registry.verify()
+        for name in corrupted:
+            print("-> {} is missing or corrupted".format(name))
+        print("-> {} corrupted entries".format(len(corrupted)))
+        sys.exit(1 if corrupted else 0)
+    else:
+        for name, sha256 in sorted(registry.read_index().items()):
+            print("{} {}".format(sha256, name))